@@ -0,0 +1,118 @@
+#
+# absolute effects engine
+#
+#   batch (numpy) calculation of the control event rates (weighted median)
+#   and the intervention event rates with 95% CIs for every dichotomous
+#   analysis in a review, as used in the "absolute effect" text
+#
+#   results are rounded to natural frequencies exactly as natfreq() in cca.py
+#   (values too close to a rounding boundary for floating point to be sure of,
+#   and anything unusual, are left out so the caller uses the Decimal path)
+#
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+ROUNDING_MARGIN = 1e-6 # numerators within this of x.5 are left to the exact Decimal calculation
+
+
+
+def available():
+    " True if numpy is installed "
+    return np is not None
+
+
+class AbsTable():
+    """
+    Absolute effect numerators for every DICH_OUTCOME and DICH_SUBGROUP in a review
+
+    initiate with the review (reviewmodel.Review) and the natural frequency denominator
+
+    all study counts are loaded into flat arrays (one row per DICH_DATA, with the
+    analysis it belongs to), then every weighted median CER, and every IER and CI
+    from the RR or OR, is calculated in one go
+
+    lookup returns the rounded numerators as strings (intervention, CI low, CI high,
+    control), or None if the analysis is not in the table
+
+    """
+
+    def __init__(self, review, denom):
+
+        self.denom = denom
+        self.table = {}
+
+        analyses = [] # (reviewmodel.Analysis, units, (point, ci95low, ci95up) as floats)
+        rows = [] # (analysis number, EVENTS_2, TOTAL_1, TOTAL_2)
+
+        for comparison in review.comparisons:
+            for outcome in comparison.outcomes:
+                if outcome.skipped or outcome.kind != "DICH_OUTCOME":
+                    continue
+                units = outcome.units # subgroups are reported in the units of their outcome
+                if units[-2:] not in ["RR", "OR"]:
+                    continue
+                for analysis in [outcome] + outcome.subgroups:
+                    if analysis.point is None:
+                        continue
+                    try:
+                        data = [(float(d.events_2), float(d.total_1), float(d.total_2)) for d in analysis.all_study_data() if d.kind == "DICH_DATA"]
+                    except (TypeError, ValueError):
+                        continue
+                    if not data or min(d[2] for d in data) <= 0:
+                        # Decimal path raises or returns None here; leave it to do so
+                        continue
+                    rows.extend((len(analyses), ) + d for d in data)
+                    analyses.append((analysis, units, (float(analysis.point), float(analysis.ci95low), float(analysis.ci95up))))
+
+        if analyses:
+            self._calculate(analyses, np.array(rows, dtype=np.float64))
+
+    def _calculate(self, analyses, rows):
+
+        group = rows[:, 0].astype(np.int64)
+        cnt_n = rows[:, 1]
+        weight = rows[:, 2] + rows[:, 3]
+        study_cer = cnt_n / rows[:, 3]
+
+        # sort by analysis, then as cerparse does (by cer, then by population)
+        order = np.lexsort((weight, study_cer, group))
+        group = group[order]
+        weight = weight[order]
+        study_cer = study_cer[order]
+
+        no_groups = len(analyses)
+        totals = np.bincount(group, weights=weight, minlength=no_groups)
+        starts = np.searchsorted(group, np.arange(no_groups))
+
+        # population counted before each study, within its own analysis
+        running = np.cumsum(weight) - weight
+        counter = running - running[starts][group]
+
+        # weighted median = last study whose preceding population is below the midpoint
+        passed = np.bincount(group, weights=(counter < totals[group] / 2), minlength=no_groups).astype(np.int64)
+        valid = passed > 0
+        cer = study_cer[starts + np.maximum(passed, 1) - 1]
+
+        estimates = np.array([a[2] for a in analyses], dtype=np.float64)
+        is_or = np.array([a[1][-2:] == "OR" for a in analyses])
+
+        # columns: point, ci95low, ci95up -> risk with intervention
+        cer_col = cer[:, np.newaxis]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            risks = np.where(is_or[:, np.newaxis], cer_col * (estimates / (1 - (cer_col * (1 - estimates)))), cer_col * estimates)
+        risks = np.hstack([risks, cer_col]) * self.denom
+
+        # round half to even (as Decimal.quantize), unless too close to call
+        rounded = np.rint(risks)
+        fraction = np.abs(risks - np.floor(risks) - 0.5)
+        safe = valid & np.all(np.isfinite(risks) & (risks >= 0) & (fraction > ROUNDING_MARGIN), axis=1)
+
+        for a in np.nonzero(safe)[0]:
+            self.table[analyses[a][0]] = ["%d" % (n, ) for n in rounded[a]]
+
+    def lookup(self, analysis):
+        return self.table.get(analysis)
@@ -0,0 +1,190 @@
+#
+# benchmark
+#
+#   times each stage of the PICOtron on synthetic reviews of increasing size
+#   (or on an existing folder of reviews), reporting files/sec and MB/sec,
+#   and how the time for each stage grows with review size
+#
+
+import argparse
+import glob
+import math
+import os
+import shutil
+import tempfile
+from timeit import default_timer
+
+import cca
+import synthrm5
+import tagindex
+import textgen
+
+
+STAGES = ["parse", "index", "ocparse", "rm_dataparse", "rm_picos (other)", "writefile", "total"]
+NONLINEAR_EXPONENT = 1.3 # growth exponents above this are flagged
+
+
+
+def _timed(name, func, totals):
+    " wraps func so that time spent in it is added to totals[name] "
+    def wrapper(*args, **kwargs):
+        start = default_timer()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            totals[name] += default_timer() - start
+    return wrapper
+
+
+def time_file(filename, output):
+    """
+    runs one review through the PICOtron stages, returns a dict of stage: seconds
+    ocparse and rm_dataparse are timed inside rm_picos (which is reported net of them)
+    """
+    times = dict((stage, 0.0) for stage in STAGES)
+    inner = {"ocparse": 0.0, "rm_dataparse": 0.0}
+
+    start = default_timer()
+    xmldoc = cca.rm_parse(filename)
+    times["parse"] = default_timer() - start
+
+    start = default_timer()
+    xmldoc = tagindex.indexed(xmldoc)
+    times["index"] = default_timer() - start
+
+    originals = (cca.ocparse, cca.rm_dataparse)
+    cca.ocparse = _timed("ocparse", cca.ocparse, inner)
+    cca.rm_dataparse = _timed("rm_dataparse", cca.rm_dataparse, inner)
+    try:
+        start = default_timer()
+        picolist = cca.rm_picos(xmldoc)
+        picos_time = default_timer() - start
+    finally:
+        (cca.ocparse, cca.rm_dataparse) = originals
+
+    times["ocparse"] = inner["ocparse"]
+    times["rm_dataparse"] = inner["rm_dataparse"]
+    times["rm_picos (other)"] = picos_time - inner["ocparse"] - inner["rm_dataparse"]
+
+    start = default_timer()
+    cca.writefile(output, '\n'.join(picolist))
+    times["writefile"] = default_timer() - start
+
+    times["total"] = sum(times[stage] for stage in STAGES if stage != "total")
+    return times
+
+
+def time_files(filenames, output, repeat = 1):
+    " times each file (best of repeat runs per stage); returns (total bytes, dict of stage: total seconds) "
+    totals = dict((stage, 0.0) for stage in STAGES)
+    total_bytes = 0
+
+    for filename in filenames:
+        runs = [time_file(filename, output) for r in range(repeat)]
+        for stage in STAGES:
+            totals[stage] += min(run[stage] for run in runs)
+        total_bytes += os.path.getsize(filename)
+
+    return total_bytes, totals
+
+
+def growth_exponent(sizes, times):
+    " least squares slope of log(time) against log(size); 1 = linear, 2 = quadratic "
+    points = [(math.log(s), math.log(t)) for (s, t) in zip(sizes, times) if s > 0 and t > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum(p[0] for p in points) / len(points)
+    mean_y = sum(p[1] for p in points) / len(points)
+    sxx = sum((p[0] - mean_x) ** 2 for p in points)
+    if sxx == 0:
+        return None
+    return sum((p[0] - mean_x) * (p[1] - mean_y) for p in points) / sxx
+
+
+def throughput_line(files, total_bytes, seconds):
+    if seconds <= 0:
+        return "%d files, %.2f MB" % (files, total_bytes / 1e6)
+    return "%d files, %.2f MB in %.3fs - %.1f files/sec, %.2f MB/sec" % (files, total_bytes / 1e6, seconds, files / seconds, total_bytes / 1e6 / seconds)
+
+
+def print_stage_table(rows, header):
+    " rows = list of (label, dict of stage: seconds) "
+    print "%-12s" % (header, ) + "".join("%18s" % (stage, ) for stage in STAGES)
+    for (label, times) in rows:
+        print "%-12s" % (label, ) + "".join("%17.4fs" % (times[stage], ) for stage in STAGES)
+
+
+
+def benchmark_corpus(directory, repeat):
+    " throughput over an existing folder of .rm5 files "
+    filenames = sorted(glob.glob(os.path.join(directory, "*.rm5")))
+    tmp = tempfile.mkdtemp()
+    try:
+        total_bytes, totals = time_files(filenames, os.path.join(tmp, "out.html"), repeat)
+    finally:
+        shutil.rmtree(tmp)
+
+    print_stage_table([("all files", totals)], "corpus")
+    print ""
+    print throughput_line(len(filenames), total_bytes, totals["total"])
+    print ""
+    print "text caches (hits / misses):"
+    for (name, stats) in sorted(textgen.cache_stats().items()):
+        print "  %-18s %8d / %d" % (name, stats["hits"], stats["misses"])
+
+
+def benchmark_scaling(dimension, sizes, repeat, files, params):
+    """
+    generates synthetic reviews with params[dimension] set to each of sizes
+    times every stage, and reports the growth exponent of each stage against file size
+    """
+    tmp = tempfile.mkdtemp()
+    rows = []
+    file_sizes = []
+
+    try:
+        for size in sizes:
+            params[dimension] = size
+            filenames = synthrm5.write_corpus(os.path.join(tmp, "%s_%d" % (dimension, size)), files, **params)
+            total_bytes, totals = time_files(filenames, os.path.join(tmp, "out.html"), repeat)
+            rows.append(("%s=%d" % (dimension, size), dict((stage, totals[stage] / files) for stage in STAGES)))
+            file_sizes.append(total_bytes / float(files))
+            print throughput_line(files, total_bytes, totals["total"]) + " (%s=%d)" % (dimension, size)
+    finally:
+        shutil.rmtree(tmp)
+
+    print ""
+    print "seconds per file:"
+    print_stage_table(rows, dimension)
+    print ""
+    print "growth with file size (%.0f KB to %.0f KB); 1.0 = linear:" % (file_sizes[0] / 1e3, file_sizes[-1] / 1e3)
+    for stage in STAGES:
+        exponent = growth_exponent(file_sizes, [times[stage] for (label, times) in rows])
+        if exponent is None:
+            print "  %-18s   n/a" % (stage, )
+        else:
+            print "  %-18s %5.2f%s" % (stage, exponent, "  <- non-linear" if exponent > NONLINEAR_EXPONENT else "")
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="times each stage of the PICOtron")
+    parser.add_argument("--corpus", metavar="DIR", help="benchmark the .rm5 files in DIR instead of synthetic reviews")
+    parser.add_argument("--dimension", default="outcomes", choices=["comparisons", "outcomes", "subgroups", "studies"], help="review dimension to scale")
+    parser.add_argument("--sizes", default="1,2,4,8,16", help="comma separated values for the scaled dimension")
+    parser.add_argument("--files", type=int, default=5, help="synthetic files per size")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per file (best is kept)")
+    parser.add_argument("--comparisons", type=int, default=3)
+    parser.add_argument("--outcomes", type=int, default=4)
+    parser.add_argument("--subgroups", type=int, default=0)
+    parser.add_argument("--studies", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.corpus:
+        benchmark_corpus(args.corpus, args.repeat)
+    else:
+        params = {"comparisons": args.comparisons, "outcomes": args.outcomes, "subgroups": args.subgroups, "studies": args.studies}
+        benchmark_scaling(args.dimension, [int(s) for s in args.sizes.split(",")], args.repeat, args.files, params)
+
+if __name__ == '__main__':
+    main()
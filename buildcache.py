@@ -0,0 +1,159 @@
+#
+# build cache
+#
+#   persistent manifest of which output was built from which input
+#   so that unchanged reviews are not rebuilt on the next run
+#
+
+import hashlib
+import json
+import os
+
+
+HASH_BLOCK_SIZE = 1 << 20 # bytes read at a time when hashing input files
+
+
+
+def file_hash(filename):
+    " sha1 hex digest of a file's contents "
+    h = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        while True:
+            block = f.read(HASH_BLOCK_SIZE)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+def topics_hash(topics):
+    " order independent digest of a set of topic headings "
+    h = hashlib.sha1()
+    for t in sorted(topics):
+        if isinstance(t, unicode):
+            t = t.encode('utf-8')
+        h.update(t + "\n")
+    return h.hexdigest()
+
+
+
+class BuildManifest():
+    """
+    Records, for each input file, what the last successful build depended on
+
+    an entry holds the size/mtime (to avoid rehashing unchanged files), the
+    content hash, the CD number found in the file, a digest of the topic
+    headings for that CD number, and the settings (version and rendering flags)
+
+    a file is current if its content, its topic headings and the settings
+    all match the entry, and its output file still exists
+
+    """
+
+    def __init__(self, filename, settings):
+
+        self.filename = filename
+        self.settings = settings
+        self.entries = {}
+        self.hashes = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.filename, 'rb') as f:
+                self.entries = json.load(f).get("files", {})
+        except (IOError, ValueError):
+            self.entries = {}
+
+    def save(self, keep=None):
+        """
+        writes the manifest (via a temporary file, so an interrupted run cannot corrupt it)
+        keep = optional list of input files; entries for any others are dropped
+        """
+        if keep is not None:
+            keep = set(os.path.basename(f) for f in keep)
+            self.entries = dict((k, v) for (k, v) in self.entries.items() if k in keep)
+
+        tmp = self.filename + ".tmp"
+        with open(tmp, 'wb') as f:
+            json.dump({"settings": self.settings, "files": self.entries}, f, indent=1, sort_keys=True)
+        os.rename(tmp, self.filename)
+
+    def _stat_hash(self, filename):
+        """
+        (size, mtime, sha1) of an input file, as at the first call in this run (or since invalidate)
+        reuses the stored hash if size and mtime are unchanged since the last run
+        """
+        if filename not in self.hashes:
+            st = os.stat(filename)
+            entry = self.entries.get(os.path.basename(filename))
+            if entry and entry["size"] == st.st_size and entry["mtime"] == st.st_mtime:
+                sha1 = entry["sha1"]
+            else:
+                sha1 = file_hash(filename)
+            self.hashes[filename] = (st.st_size, st.st_mtime, sha1)
+        return self.hashes[filename]
+
+    def invalidate(self, filenames):
+        " forgets the size, mtime and hash of filenames as seen so far, so they are looked at again (e.g. after a change) "
+        for filename in filenames:
+            self.hashes.pop(filename, None)
+
+    def content_hash(self, filename):
+        " content hash of an input file "
+        return self._stat_hash(filename)[2]
+
+    def is_current(self, filename, topic_lookup, output):
+        """
+        True if filename was built (or skipped) with the same content, topics and settings
+        output = the output file expected for filename
+        """
+        entry = self.entries.get(os.path.basename(filename))
+
+        if entry is None or entry["settings"] != self.settings:
+            return False
+        if entry["sha1"] != self.content_hash(filename):
+            return False
+        if entry["cdno"] is not None:
+            if entry["topics"] != topics_hash(topic_lookup.get(entry["cdno"], [])):
+                return False
+            if not os.path.exists(output):
+                return False
+        return True
+
+    def record(self, filename, cdno, topic_lookup):
+        """
+        stores a successful build of filename
+        cdno = CD number of the review written, or None if the file was skipped
+        """
+        (size, mtime, sha1) = self._stat_hash(filename)
+        if cdno is None:
+            topics = None
+        else:
+            topics = topics_hash(topic_lookup.get(cdno, []))
+
+        self.entries[os.path.basename(filename)] = {"size": size, "mtime": mtime,
+            "sha1": sha1, "cdno": cdno, "topics": topics, "settings": self.settings}
+
+    def record_as(self, filename, other):
+        """
+        stores filename as built along with other (the same review under another
+        name), with other's CD number and topics; other must be recorded first
+        """
+        (size, mtime, sha1) = self._stat_hash(filename)
+        entry = dict(self.entries[os.path.basename(other)])
+        entry.update({"size": size, "mtime": mtime, "sha1": sha1})
+        self.entries[os.path.basename(filename)] = entry
+
+    def cdno(self, filename):
+        " CD number recorded for filename (None if skipped or not recorded) "
+        return self.entries.get(os.path.basename(filename), {}).get("cdno")
+
+    def merge(self, filename):
+        " adds the entries of another manifest file (e.g. one shard's), replacing any for the same files "
+        with open(filename, 'rb') as f:
+            self.entries.update(json.load(f).get("files", {}))
+
+    def forget(self, filename):
+        " removes a file's entry (e.g. after a failed build) "
+        self.entries.pop(os.path.basename(filename), None)
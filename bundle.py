@@ -0,0 +1,122 @@
+#
+# output bundles
+#
+#   writes every document of a run into one file (a zip archive, or a
+#   JSON lines stream) instead of one file each in the output folder,
+#   together with the not done list and the run details
+#
+
+import json
+import os
+import zipfile
+
+
+BUNDLE_BUFFER_SIZE = 1 << 22 # bytes buffered before each write to disk
+FORMATS = ("zip", "jsonl")
+
+
+
+class Bundle(object):
+    """
+    Base for the bundle formats
+
+    add(name, data) stores a document (utf-8 bytes) under name
+    add_records(name, records) stores a list of PICO records (dicts) under name
+    close(not_done, run) stores the not done list (list of filenames) and the
+    run details (dict), and finishes the bundle
+
+    the bundle is written under a temporary name and only renamed to filename
+    by close(), so an interrupted run does not leave a partial bundle
+
+    """
+
+    def __init__(self, filename):
+
+        self.filename = filename
+        self.tmp_filename = filename + ".part"
+        self.f = open(self.tmp_filename, 'wb', BUNDLE_BUFFER_SIZE)
+        self.names = []
+
+    def add(self, name, data):
+        self.names.append(name)
+        self._add(name, data)
+
+    def add_records(self, name, records):
+        self.names.append(name)
+        self._add_records(name, records)
+
+    def close(self, not_done, run):
+        self._finish(not_done, run)
+        self.f.close()
+        os.rename(self.tmp_filename, self.filename)
+
+    def abort(self):
+        self.f.close()
+        if os.path.exists(self.tmp_filename):
+            os.remove(self.tmp_filename)
+
+
+class ZipBundle(Bundle):
+    """
+    zip archive; one entry per document (and records file, as JSON lines), then not_done.txt and run.json
+    """
+
+    def __init__(self, filename):
+        Bundle.__init__(self, filename)
+        self.zf = zipfile.ZipFile(self.f, 'w', zipfile.ZIP_DEFLATED, allowZip64=True)
+
+    def _add(self, name, data):
+        self.zf.writestr(name, data)
+
+    def _add_records(self, name, records):
+        self.zf.writestr(name, "".join(json.dumps(r, sort_keys=True) + "\n" for r in records))
+
+    def abort(self):
+        try:
+            self.zf.close() # (before the file under it, which it would otherwise write to when collected)
+        finally:
+            Bundle.abort(self)
+
+    def _finish(self, not_done, run):
+        if not_done:
+            self.zf.writestr("not_done.txt", not_done_text(not_done))
+        self.zf.writestr("run.json", json.dumps(run, indent=1, sort_keys=True))
+        self.zf.close()
+
+
+class JsonlBundle(Bundle):
+    """
+    JSON lines; one object per line, with "type" =
+    "document" (with "name" and "html") or "record" (with "name", and the record's fields),
+    then "not_done" (with "files"), then "run"
+    """
+
+    def _line(self, obj):
+        self.f.write(json.dumps(obj, sort_keys=True))
+        self.f.write("\n")
+
+    def _add(self, name, data):
+        self._line({"type": "document", "name": name, "html": data.decode('utf-8')})
+
+    def _add_records(self, name, records):
+        for r in records:
+            self._line(dict(r, type="record", name=name))
+
+    def _finish(self, not_done, run):
+        self._line({"type": "not_done", "files": not_done})
+        self._line(dict(run, type="run"))
+
+
+def open_bundle(fmt, filename):
+    " returns a Bundle of format fmt (one of FORMATS) writing to filename "
+    if fmt == "zip":
+        return ZipBundle(filename)
+    elif fmt == "jsonl":
+        return JsonlBundle(filename)
+    else:
+        raise ValueError("unknown bundle format '%s'" % (fmt, ))
+
+
+def not_done_text(not_done):
+    " contents of the not done list (not_done.txt) "
+    return "The following files were not able to be processed due to errors:\n\n" + "\n".join(not_done)
@@ -9,17 +9,36 @@
 
 
 import glob
+import argparse
 from xml.dom import minidom
 from datetime import datetime
 import codecs
 from bs4 import BeautifulSoup
 from decimal import *
 import os
-import re
-import random
 import collections
 import codecs
+import json
 import progressbar
+import traceback
+import workerpool
+import buildcache
+import instrument
+import htmlwriter
+import rm5parse
+import tagindex
+import absengine
+import poolengine
+import reviewmodel
+import topicindex
+import watcher
+import pipeline
+import bundle
+import textgen
+import dedup
+import shards
+import outcomeindex
+import diagnostics
 from csv import DictReader
 
 
@@ -44,9 +63,65 @@ PATH["op"] = "output/" # output directory
 
 
 
-DISPLAY_COMMENTS = False # display compiler comments
+DISPLAY_COMMENTS = False # display compiler comments (the diagnostics of each review) in the output
 ABS_IF_SIG_ONLY = False # display absolute numbers only where significant result
-PICOTRON_VERSION = "28"
+PICOTRON_VERSION = "29"
+
+# xml parser backend
+# "selective" = as "stream", but only the sections the PICOtron reads are built (rm5parse.KEEP_TAGS)
+# "stream" = expat event driven parser building a lightweight tree of the whole file (rm5parse.py)
+# "minidom" = full DOM from xml.dom.minidom (original behaviour; kept for comparison)
+PARSER_BACKEND = "selective"
+
+# absolute effects calculation
+# "numpy" = whole review in one batch (absengine.py); results identical to "decimal"
+# "decimal" = one analysis at a time with Decimal objects (used anyway if numpy is not installed)
+ABS_ENGINE = "numpy"
+
+# pooled estimates recomputed from the study data (poolengine.py; needs numpy)
+# True = given (labelled as not from the review) where the review has no meta-analysis, and used
+# to check the estimates the review does give (a disagreement is a pooled-mismatch diagnostic)
+# False = documents as the review gives them, unchecked
+RECOMPUTE_POOLED = False
+
+# topic map lookups
+# True = served from an SQLite index of topics.csv (output/topics.sqlite; rebuilt when the csv changes)
+# False = csv read into memory on every run
+TOPIC_INDEX = True
+
+# rich text sections (rm5parse.SOURCE_TAGS) copied exactly as written in the RevMan file
+# False = rebuilt from the parsed xml with toxml() (original behaviour)
+RAW_TAG_CONTENTS = True
+
+# save the PICO records (the values behind each outcome and subgroup) as JSON lines
+# (set by --records)
+EXPORT_RECORDS = False
+
+# wording of the suggested question, where there is a choice (QUESTION_PATTERNS)
+# None = chosen at random on every run
+# integer = a seed; the same review gets the same wording every run (set by --seed)
+QUESTION_SEED = None
+
+# reject reviews which are not intervention reviews from the start of the file, before parsing
+SNIFF_TYPE = True
+
+# input files which are the same review (identical contents, or the same CD number and version)
+# are converted once, and the output given to each of the other names
+# "link" = hard linked (copied where the filesystem cannot link)
+# "copy" = copied
+# None = every file converted separately
+DUPLICATES = "link"
+
+# keep every outcome, subgroup and row of study data in an SQLite index for queries across
+# the corpus (output/outcomes.sqlite; see outcomeindex.py), updated as each review is converted
+OUTCOME_INDEX = True
+
+# this run's part of a run split over several machines, as (i, n) = shard i of n (see shards.py)
+# None = every file; set by --shard
+SHARD = None
+
+# --watch mode; seconds a new or changed file must be left unchanged before it is converted
+WATCH_DEBOUNCE = 2.0
 
 
 # templates
@@ -102,6 +177,9 @@ QUESTION_PATTERNS = [['What are the effects of intname in people with cndname?',
 ['How does intname compare with cntname in people with cndname?'],
  ['How does intname compare with cntname] in popname with cndname?']]
 
+QUESTION_TEMPLATES = textgen.compile_templates(QUESTION_PATTERNS, ("intname", "cntname", "cndname", "popname"))
+QUESTION_CHOOSER = textgen.Chooser(QUESTION_SEED)
+
 
 # vocabulary
 
@@ -117,7 +195,7 @@ DONT_CONVERT_TO_LOWER = ["VAS", "VAS.", "NSAID", "LABA", "ICS", "PEF", "FEV", "R
 
 MONTH_NAMES = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"]
 
-ERROR_LOG = []
+STUDY_DATA_TAGS = ["DICH_DATA", "CONT_DATA", "IV_DATA", "IPD_DATA"]
 
 
 
@@ -130,20 +208,89 @@ def get_topic_filename():
     return os.path.join(PATH["rev"], "topics.csv")
 
 
-def parse_topics(filename):
-    " takes a csv file, parses, and returns a dict of sets of top level headings (in case more than one) "
-    topic_lookup = collections.defaultdict(set)
+def sharded(filename):
+    " filename for this run's shard (e.g. output/manifest.shard-2-of-4.json), if SHARD is set "
+    return shards.shard_filename(filename, SHARD)
+
+
+def get_manifest_filename():
+    return sharded(os.path.join(PATH["op"], "manifest.json"))
+
+
+def get_run_filename():
+    return sharded(os.path.join(PATH["op"], "run.json"))
+
 
+def get_not_done_filename():
+    return sharded("not_done.txt")
+
+
+def get_diagnostics_filenames():
+    return (sharded(os.path.join(PATH["op"], "diagnostics.json")), sharded(os.path.join(PATH["op"], "diagnostics.csv")))
+
+
+def get_timings_filenames():
+    return (sharded(os.path.join(PATH["op"], "timings.json")), sharded(os.path.join(PATH["op"], "timings.csv")))
+
+
+def load_diagnostics(files):
+    """
+    the batch diagnostics report of the last run, for those of files still in it
+    (which keep their diagnostics if they are not converted again), or an empty one
+    """
+    report = diagnostics.BatchReport()
+    try:
+        report.load(get_diagnostics_filenames()[0])
+    except (IOError, ValueError, KeyError):
+        return diagnostics.BatchReport() # (none yet, or unreadable: every file is converted again anyway)
+    report.prune(keep=files)
+    return report
+
+
+def write_diagnostics(report):
+    " saves the batch diagnostics report (output/diagnostics.json and .csv) "
+    report.write(*get_diagnostics_filenames())
+
+
+def get_outcome_index_filename():
+    return sharded(os.path.join(PATH["op"], "outcomes.sqlite"))
+
+
+def get_topic_index_filename():
+    return sharded(os.path.join(PATH["op"], "topics.sqlite"))
+
+
+def topic_rows(filename):
+    " takes a csv file, parses, and yields (CD number, top level heading) for each line "
     with open(filename, 'rU') as f:
         csv_file = DictReader(f, dialect='excel')
         for line in csv_file:
-            topic_lookup[line["CD Number"]].add(line["Level 1"])
+            yield (line["CD Number"], line["Level 1"])
+
+
+def parse_topics(filename):
+    " takes a csv file, parses, and returns a dict of sets of top level headings (in case more than one) "
+    topic_lookup = collections.defaultdict(set)
+
+    for (cdno, heading) in topic_rows(filename):
+        topic_lookup[cdno].add(heading)
 
     return topic_lookup
 
 
+def load_topics(filename):
+    """
+    returns the topic lookup for filename; a topicindex.TopicIndex if TOPIC_INDEX
+    is set (rebuilt only if the csv has changed), otherwise a dict from parse_topics
+    """
+    if TOPIC_INDEX:
+        return topicindex.TopicIndex(filename, get_topic_index_filename(), topic_rows)
+    return parse_topics(filename)
+
+
 # *** FUNCTIONS FOR SIMPLE LANGUAGE PARSING ***
 
+@textgen.memoise
 def numberword(noun, number):
     " returns an appropriately pluralised word with the formatted number in front "
     number = str(number)
@@ -176,6 +323,7 @@ def pluralise(word):
     else:
         return word + "s"
 
+@textgen.memoise
 def mid_sent(txt):
     " capitalises a word when mid_sentence "
     words = txt.split(' ')
@@ -192,26 +340,34 @@ def start_sent(txt):
     return txt[0].upper() + txt[1:]
 
 
-def favours_parser(favours_pre):
+def favours_parser(favours_pre, diags = None):
     """
     checks if Forest plot labels are in predictable form, then changes to editorial preferred sentence "in favour of..."
     generates error if string < 7 characters
+    diags = optional diagnostics.Located; any problem with the label is added to it
     """
 
+    label = favours_pre
     lc = favours_pre.lower()
 
     if "control" in lc or "experimental" in lc or "treatment" in lc or "intervention" in lc:
         favours_pre += " <span class='edittext'>ALERT! - default 'favored' text left here by authors - please check and change to favoured intervention name if needed</span>"
+        if diags is not None:
+            diags.add("default-favours-label", "Forest plot label is the default text left by the authors: '%s'" % (label, ))
 
     if len(favours_pre) < 7:
-        return "<span class='edittext'>ALERT! - expected Forest plot key to start with 'favors', instead found - '" + favours_pre + "' - please add text 'in favor of [favoured intervention]'</span>"
+        alert = "<span class='edittext'>ALERT! - expected Forest plot key to start with 'favors', instead found - '" + favours_pre + "' - please add text 'in favor of [favoured intervention]'</span>"
     # first check for English or US spelling at start of word
     elif favours_pre[:7].lower() == "favours":
         return "in favor of" + favours_pre[7:]
     elif favours_pre[:6].lower() == "favors":
         return "in favor of" + favours_pre[6:]
     else:
-        return "<span class='edittext'>ALERT! - expected Forest plot key to start with 'favors', instead found - '" + favours_pre + "' - please add text 'in favor of [favored intervention]'</span>"
+        alert = "<span class='edittext'>ALERT! - expected Forest plot key to start with 'favors', instead found - '" + favours_pre + "' - please add text 'in favor of [favored intervention]'</span>"
+
+    if diags is not None:
+        diags.add("favours-label-format", "Forest plot label does not start with 'favours': '%s'" % (label, ))
+    return alert
 
 
 
@@ -228,6 +384,10 @@ def xml_tag_contents(xml, tag, silentfail = False):
     els = xml.getElementsByTagName(tag)
 
     if len(els) > 0:
+        if RAW_TAG_CONTENTS:
+            contents = getattr(els[0], "source_contents", lambda: None)() # as written in the file (None if not recorded)
+            if contents is not None:
+                return contents
         return ('').join([node.toxml() for node in els[0].childNodes])
     else:
         if silentfail == False:
@@ -250,6 +410,30 @@ def xml_attribute_contents(xml, tag, silentfail = False):
             r = None
     return r
 
+def rm_parse(filename, backend = None, data = None):
+    """
+    parses a RevMan file with the chosen backend (defaults to PARSER_BACKEND)
+    both return objects answering the same calls used by the rm_ functions below
+    data = the file's contents, if already read (filename is then not opened)
+    """
+    if backend is None:
+        backend = PARSER_BACKEND
+
+    if backend == "minidom":
+        if data is not None:
+            return minidom.parseString(data)
+        return minidom.parse(filename)
+    elif backend == "stream":
+        if data is not None:
+            return rm5parse.parseString(data)
+        return rm5parse.parse(filename)
+    elif backend == "selective":
+        if data is not None:
+            return rm5parse.parseString_selective(data)
+        return rm5parse.parse_selective(filename)
+    else:
+        raise ValueError("unknown parser backend '%s'" % (backend,))
+
 def rm_is_intervention_review(xml):
     " returns True for intervention reviews only "
     cr = xml.getElementsByTagName('COCHRANE_REVIEW')
@@ -257,10 +441,60 @@ def rm_is_intervention_review(xml):
     return review_type == 'INTERVENTION'
 
 
-def ocparse(xml, checkfav = True):
-    "takes xml.dom object containing a dichotomous or continuous outcome, returns tuple of values, or None if not estimible"
+def rm_sniff_header(filename):
+    """
+    reads just the start of a review file (up to the COCHRANE_REVIEW tag)
+    returns a dict of the COCHRANE_REVIEW attributes, or None if they cannot be
+    told without parsing the whole file
+    """
+    try:
+        root = rm5parse.sniff(filename)
+    except Exception:
+        return None # (left for the full parse to report)
+    if root is None or root[0] != 'COCHRANE_REVIEW':
+        return None
+    return root[1]
+
+
+def rm_sniff_type(filename):
+    " the review TYPE (e.g. 'INTERVENTION', 'DIAGNOSTIC') from the start of a file, or None (see rm_sniff_header) "
+    header = rm_sniff_header(filename)
+    if header is None:
+        return None
+    return header.get('TYPE')
+
+
+def rm_sniff_version(filename):
+    " (CD number, VERSION_NO) from the start of a file, or None if either is not there "
+    header = rm_sniff_header(filename)
+    if header is None:
+        return None
+    cdno = cdno_from_doi(header.get('DOI', ''))
+    version = header.get('VERSION_NO')
+    if not cdno or not version:
+        return None
+    return (cdno, version)
+
+
+def rm_study_data(xml):
+    " returns a reviewmodel.StudyData from a row of study data (DICH_DATA, CONT_DATA etc.) "
+    def attr(name):
+        return xml_attribute_contents(xml, name, silentfail = True)
+
+    return reviewmodel.StudyData(kind = xml.nodeName, study_id = attr('STUDY_ID'), estimable = attr('ESTIMABLE'),
+        effect_size = attr('EFFECT_SIZE'), ci_start = attr('CI_START'), ci_end = attr('CI_END'),
+        events_1 = attr('EVENTS_1'), events_2 = attr('EVENTS_2'), total_1 = attr('TOTAL_1'), total_2 = attr('TOTAL_2'),
+        mean_1 = attr('MEAN_1'), mean_2 = attr('MEAN_2'), sd_1 = attr('SD_1'), sd_2 = attr('SD_2'), se = attr('SE'))
+
+
+def ocparse(xml, checkfav = True, analysis_class = reviewmodel.Analysis):
+    """
+    takes xml.dom object containing a dichotomous or continuous outcome (or subgroup)
+    returns a reviewmodel.Analysis (or analysis_class) of its values; point, CIs etc. None if not estimible
+    """
 
     name = xml_tag_contents(xml, 'NAME') # analysis name
+    no = xml_attribute_contents(xml, "NO") # analysis index
 
     if checkfav:
         # find which intervention is favoured by examining forest plot labels
@@ -273,6 +507,8 @@ def ocparse(xml, checkfav = True):
 
     studies=xml.attributes['STUDIES'].value
     octype = xml.nodeName # Dichotomous, Continuous, or IV
+    method = xml_attribute_contents(xml, "METHOD", silentfail = True) # MH, IV or PETO
+    random = xml_attribute_contents(xml, "RANDOM", silentfail = True) # YES = random effects
 
     units = xml_attribute_contents(xml, "EFFECT_MEASURE", silentfail = True)
     if units == None:
@@ -281,6 +517,8 @@ def ocparse(xml, checkfav = True):
         except:
             units = "No units found"
 
+    study_data = [rm_study_data(i) for i in xml.childNodes if i.nodeName in STUDY_DATA_TAGS]
+
     if xml.attributes['ESTIMABLE'].value == "NO":
         # where there is *no* meta-analysis, just individual study reports
 
@@ -302,14 +540,16 @@ def ocparse(xml, checkfav = True):
         else:
             if no_studies > 1:
                 # for more than one study; output results of individual studies
-                study_text = singlestudiesparse(ind_study_data, units)
+                study_text = singlestudiesparse([d for d in study_data if d.kind in ["DICH_DATA", "CONT_DATA"]], units)
             else:
                 # for analyses with no studies
                 study_text = "no individual studies reported for this analysis (there may be subgroups)."
 
             subgroups = xml_attribute_contents(xml, 'SUBGROUPS')
 
-            return (None, name, units, None, None, None, favours1, favours2, studies, None, None, subgroups, study_text)
+            return analysis_class(kind = xml.nodeName, no = no, name = name, units = units, favours1 = favours1, favours2 = favours2,
+                                  studies = studies, subgroups_present = subgroups, study_text = study_text, study_data = study_data,
+                                  method = method, random = random)
     else:
         # where there is a meta-analysis get these results
         point = Decimal(xml_attribute_contents(xml, 'EFFECT_SIZE'))
@@ -327,7 +567,9 @@ def ocparse(xml, checkfav = True):
     if units.upper() in UNIT_DICT: # standardise units
         units = UNIT_DICT[units.upper()]
 
-    return (octype, name, units, point, ci95low, ci95up, favours1, favours2, studies, participants, usetotal, subgroups, None)
+    return analysis_class(kind = xml.nodeName, no = no, name = name, octype = octype, units = units, point = point, ci95low = ci95low, ci95up = ci95up,
+                          favours1 = favours1, favours2 = favours2, studies = studies, participants = participants, usetotal = usetotal,
+                          subgroups_present = subgroups, study_data = study_data, method = method, random = random)
 
 
 def ier(cer, units, point):
@@ -364,14 +606,14 @@ def natfreq_nodenom (risk, denom):
 
 
 def singlestudiesparse(studies, units):
-    " returns a simple fomatted string containing the results of individual studies for when there is no meta-analysis "
+    " returns a simple fomatted string containing the results of individual studies (list of reviewmodel.StudyData) for when there is no meta-analysis "
     output = []
 
     for i, study in enumerate(studies):
 
-        ci95up = Decimal(study.attributes['CI_END'].value)
-        ci95low = Decimal(study.attributes['CI_START'].value)
-        point = Decimal(study.attributes['EFFECT_SIZE'].value)
+        ci95up = Decimal(study.ci_end)
+        ci95low = Decimal(study.ci_start)
+        point = Decimal(study.effect_size)
 
         output.append("Study %d: %s %.2f, 95%% CI %.2f to %.2f" % (i+1, units, point, ci95low, ci95up))
 
@@ -379,22 +621,22 @@ def singlestudiesparse(studies, units):
 
 
 
-def cerparse(xml):
+def cerparse(study_data):
     """
     returns a weighted median (as decimal object) of the control absolute risks in the analysis
-    weighted by population size
+    (list of reviewmodel.StudyData), weighted by population size
     """
 
-    data = xml.getElementsByTagName('DICH_DATA')
+    data = [datum for datum in study_data if datum.kind == 'DICH_DATA']
 
     studydata = []
     total = 0
 
     for datum in data:
-        int_n = Decimal(datum.attributes['EVENTS_1'].value)
-        cnt_n = Decimal(datum.attributes['EVENTS_2'].value)
-        int_d = Decimal(datum.attributes['TOTAL_1'].value)
-        cnt_d = Decimal(datum.attributes['TOTAL_2'].value)
+        int_n = Decimal(datum.events_1)
+        cnt_n = Decimal(datum.events_2)
+        int_d = Decimal(datum.total_1)
+        cnt_d = Decimal(datum.total_2)
         study_cer = cnt_n / cnt_d # find the cer for each study
         studydata.append((study_cer, int_d + cnt_d)) # then add to a list
         total += (int_d + cnt_d) # and the total population for weighting purpose
@@ -536,10 +778,14 @@ def cerparse(xml):
 #     return aresult
 
 
-def rm_abs_values(octype, intname, cntname, name, units, point, ci95low, ci95up, studies, participants, xml):
+def rm_abs_values(outcome, analysis, abstable = None, record = None):
     """
-    returns absolute value text for an xml.dom obj, (dich outcome)
+    returns absolute value text for an analysis (dich outcome, or one of its subgroups)
+    uses the precalculated numbers from abstable (absengine.AbsTable) where available
+    record = optional dict; the numbers are added as record["absolute"] (see abs_record)
     """
+    (intname, cntname, units) = (outcome.intname, outcome.cntname, outcome.units)
+    (point, ci95low, ci95up) = (analysis.point, analysis.ci95low, analysis.ci95up)
 
     # set significance cutoff
     if units[-1] == "R" or units.upper()[-10:] == "RATE RATIO":
@@ -547,7 +793,10 @@ def rm_abs_values(octype, intname, cntname, name, units, point, ci95low, ci95up,
     else:
         cutoff = 0
 
-
+    if abstable:
+        numerators = abstable.lookup(analysis) # None if not in the batch
+    else:
+        numerators = None
 
     if (Decimal(ci95low) == 0) and (Decimal(point) == 0) and (Decimal(ci95up) == 0):
         # error from malformed RM5 - authors not completed fields
@@ -555,11 +804,19 @@ def rm_abs_values(octype, intname, cntname, name, units, point, ci95low, ci95up,
     elif (Decimal(ci95low) < cutoff) and (Decimal(ci95up) > cutoff) and ABS_IF_SIG_ONLY:
         # result is not significant
         aresult = "There was no statistically significant difference between groups."
+    elif numerators:
+        # result is significant; already calculated in batch
+        (abier_s, abci95low_s, abci95up_s, abcer_s) = numerators
+        denom = abstable.denom
+
+        aresult = abier_s + " per " + str(denom) + " people (95% CI " + abci95low_s + " to " + abci95up_s + ") with " + mid_sent(intname) + " compared with " + abcer_s + " per " + str(denom) + " people with " + mid_sent(cntname) + "."
+        if record is not None:
+            record["absolute"] = abs_record(denom, abier_s, abci95low_s, abci95up_s, abcer_s)
     else:
         # result is significant
 
         # calculate absolute risks and 95% CIs for intervention group
-        abcer = cerparse(xml)
+        abcer = cerparse(analysis.all_study_data())
         abier = ier(abcer, units, point)
 
         abci95low = ier(abcer, units, ci95low)
@@ -579,6 +836,8 @@ def rm_abs_values(octype, intname, cntname, name, units, point, ci95low, ci95up,
         denom = DENOMINATOR # change based on what is needed
 
         aresult =  natfreq(abier, denom) + " (95% CI " + natfreq_nodenom(abci95low, denom) + " to " + natfreq_nodenom(abci95up, denom) + ") with " + mid_sent(intname) + " compared with " + natfreq(abcer ,denom) + " with " + mid_sent(cntname) + "."
+        if record is not None:
+            record["absolute"] = abs_record(denom, natfreq_nodenom(abier, denom), natfreq_nodenom(abci95low, denom), natfreq_nodenom(abci95up, denom), natfreq_nodenom(abcer, denom))
 
 
     return aresult
@@ -586,6 +845,11 @@ def rm_abs_values(octype, intname, cntname, name, units, point, ci95low, ci95up,
 
 
 
+def abs_record(denom, abier_s, abci95low_s, abci95up_s, abcer_s):
+    " the absolute effect numbers for a PICO record; natural frequency numerators (as strings) per denominator "
+    return {"denominator": denom, "intervention": abier_s, "intervention_ci_low": abci95low_s, "intervention_ci_high": abci95up_s, "control": abcer_s}
+
+
 def rm_unique(xml):
     """ attempts to get CD number from XML (parses from  string) """
     ###
@@ -593,12 +857,15 @@ def rm_unique(xml):
     ###
     cr = xml.getElementsByTagName('COCHRANE_REVIEW')
     doi = cr[0].attributes['DOI'].value
-    doi_l = doi.split('.')
+    return cdno_from_doi(doi) or "[no CD number found in revman file]"
 
-    for d in doi_l:
+
+def cdno_from_doi(doi):
+    " CD number from a review DOI (e.g. 10.1002/14651858.CD001234.pub3), or None "
+    for d in doi.split('.'):
         if d[:2] == "CD":
             return d
-    return "[no CD number found in revman file]"
+    return None
 
 
 
@@ -615,6 +882,7 @@ def rm_title(xml):
     return t
 
 
+@textgen.memoise
 def splitter(n):
     """
     first split into A and B removing the word ' for ' if present
@@ -658,22 +926,10 @@ def randomquestion(intname, cntname, cndname, popname, patternno):
     (not for publication - as a hint for editors to turn into proper English!)
     """
 
-    random.seed()
-    patternpointer = QUESTION_PATTERNS[patternno]
-    tmpind = random.randint(0, len(patternpointer) - 1)
-
-    text = patternpointer[tmpind]
-
-    text = re.sub("intname", intname, text) # sub the intervention for intname
-    text = re.sub("cndname", cndname, text) # sub the condition for cndname
-
-    if cntname:
-        text = re.sub("cntname", cntname, text) # sub the intervention for cntname
+    template = QUESTION_CHOOSER.choose(QUESTION_TEMPLATES[patternno], "%s|%s|%s|%s" % (intname, cntname, cndname, popname))
 
-    if popname:
-        text = re.sub("popname", popname, text) # sub the intervention for popname
-
-    return  text
+    # (the comparison and population are only filled in if there are any, as they always were)
+    return template.fill({"intname": intname, "cntname": cntname or None, "cndname": cndname, "popname": popname or None})
 
 
 
@@ -723,8 +979,15 @@ def rm_searchdate(xml):
 
 
 
-def rm_narrative(octype, intname, cntname, name, units, point, ci95low, ci95up, studies, participants, show_participants):
-    " returns a Clinical Evidence style sentence from all this data "
+def rm_narrative(outcome, analysis, diags = None):
+    """
+    returns a Clinical Evidence style sentence from the results of an analysis (the outcome, or one of its subgroups)
+    diags = optional diagnostics.Located for the analysis
+    raises ValueError if the result cannot be described (a CI limit exactly at the line of no effect)
+    """
+    (intname, cntname, name, units, show_participants) = (outcome.intname, outcome.cntname, outcome.name, outcome.units, outcome.show_participants)
+    (point, ci95low, ci95up, studies, participants) = (analysis.point, analysis.ci95low, analysis.ci95up, analysis.studies, analysis.participants)
+
     if units[-1] == "R" or units.upper()[-10:] == "RATE RATIO":
         cutoff = 1
     else:
@@ -743,8 +1006,8 @@ def rm_narrative(octype, intname, cntname, name, units, point, ci95low, ci95up,
 
     if (Decimal(ci95low) == 0) and (Decimal(point) == 0) and (Decimal(ci95up) == 0):
         nresult = "ERROR - no narrative result possible since effect size and 95% CI set to 0."
-        # ERROR_LOG.append("Narrative result error - please see below")
-        # print "NR ERROR"
+        if diags is not None:
+            diags.add("zero-effect", "Effect size and 95% CI are all 0; no narrative result", diagnostics.ERROR)
     elif (Decimal(ci95low) < cutoff) and (Decimal(ci95up) > cutoff):
         nresult = "%s %s found no statistically significant difference between groups." % (start_sent(numberword("RCT", int(studies))), participants_str)
     elif (Decimal(ci95low) < cutoff) and (Decimal(ci95up) < cutoff):
@@ -752,121 +1015,165 @@ def rm_narrative(octype, intname, cntname, name, units, point, ci95low, ci95up,
     elif (Decimal(ci95low) > cutoff) and (Decimal(ci95up) > cutoff):
         nresult = "%s %s found that more people had %s with %s than with %s." % (start_sent(numberword("RCT", int(studies))), participants_str, name, intname, cntname)
     else:
-        print "ERROR - unexpected XML contents in this review"
+        message = "Effect size %s, 95%% CI %s to %s has a CI limit at the line of no effect (%s); no narrative result" % (point, ci95low, ci95up, cutoff)
+        if diags is not None:
+            diags.add("unexpected-estimate", message, diagnostics.ERROR)
+        raise ValueError("analysis %s: %s" % (getattr(diags, "location", "?"), message))
     return nresult
 
 
-def rm_picos(xml):
+def rm_review(xml):
     """
-    MAIN LOOP
-
-    takes in xml at comparison level
-    parses and returns as HTML
-
+    reads the comparisons, outcomes and subgroups of a review into a reviewmodel.Review
+    (everything rm_picos_rows needs; the xml is not needed after this)
     """
 
-    picolist = []
-    comparisons = xml.getElementsByTagName('COMPARISON')
-    cdno =  rm_unique(xml)
-    searchdate = rm_searchdate(xml)
-
-    for c in range(len(comparisons)):
-        titlexml = comparisons[c].getElementsByTagName('NAME')
-        title = titlexml[0].firstChild.data # comparison title
+    review = reviewmodel.Review(cdno = rm_unique(xml), title = rm_title(xml), searchdate = rm_searchdate(xml),
+                                outcomes_text = rm_outcomes(xml), comparisons = [])
 
-        c_no = xml_attribute_contents(comparisons[c], "NO") # comparison index
+    for comparison in xml.getElementsByTagName('COMPARISON'):
+        titlexml = comparison.getElementsByTagName('NAME')
+        c = reviewmodel.Comparison(no = xml_attribute_contents(comparison, "NO"), title = titlexml[0].firstChild.data, outcomes = [])
+        review.comparisons.append(c)
 
+        outcomes=[i for i in comparison.childNodes if i.nodeName in ["DICH_OUTCOME", "CONT_OUTCOME", "IV_OUTCOME", "IPD_OUTCOME"]]
 
-        picolist.append(tabtag(tag("Comparison ", "h3"), tag(title, "h3")))
-
-        picolist.append(tabtag("Population", " "))
-        picolist.append(tabtag("Intervention", " "))
-        picolist.append(tabtag("Comparator", " "))
-        picolist.append(tabtag("Safety alerts", " "))
-
-        outcomes=[i for i in comparisons[c].childNodes if i.nodeName in ["DICH_OUTCOME", "CONT_OUTCOME", "IV_OUTCOME", "IPD_OUTCOME"]]
-
-        for o in range(len(outcomes)):
-            intxml = outcomes[o].getElementsByTagName('GROUP_LABEL_1')
+        for o in outcomes:
+            intxml = o.getElementsByTagName('GROUP_LABEL_1')
             if len(intxml) > 0:
-                try:
-                    intname = intxml[0].firstChild.data
-                except:
-                    picolist.append(tabtag(tag(("Comparison skipped from Revman file here"), "h3")))
-                    picolist.append(tabtag(("In tests, this was due to errors in the original file where the authors have incompletely filled in the intervention field.")))
+                if intxml[0].firstChild is None:
+                    # authors have incompletely filled in the intervention field
+                    c.outcomes.append(reviewmodel.Outcome(kind = o.nodeName, skipped = "intervention"))
                     continue
-
+                intname = intxml[0].firstChild.data
             else:
                 intname = "NO INTERVENTION FOUND"
-            try:
-                cntxml = outcomes[o].getElementsByTagName('GROUP_LABEL_2')
-            except:
-                picolist.append(tabtag(tag(("Comparison skipped from Revman file here"), "h3")))
-                picolist.append(tabtag(("In tests, this was due to errors in the original file where the authors have incompletely filled in the control field.")))
-
 
+            cntxml = o.getElementsByTagName('GROUP_LABEL_2')
             if len(cntxml) > 0:
                 cntname = cntxml[0].firstChild.data
             else:
-                intname = "NO CONTROL FOUND"
+                intname = "NO CONTROL FOUND" # (cntname is left as the previous outcome's)
 
-            participants_shown_attr = outcomes[o].attributes.get("SHOW_PARTICIPANTS")
-            if participants_shown_attr and participants_shown_attr.value == "NO":
-                show_participants = False
-            else:
-                show_participants = True
+            participants_shown_attr = o.attributes.get("SHOW_PARTICIPANTS")
 
-            data = ocparse(outcomes[o])
+            outcome = ocparse(o, analysis_class = reviewmodel.Outcome)
+            outcome.intname = intname
+            outcome.cntname = cntname
+            outcome.show_participants = not (participants_shown_attr and participants_shown_attr.value == "NO")
+            outcome.subgroups = []
+            c.outcomes.append(outcome)
 
-            o_no = xml_attribute_contents(outcomes[o], "NO")
+            if outcome.subgroups_present == "YES":
+                subgroups = o.getElementsByTagName('DICH_SUBGROUP') + o.getElementsByTagName('CONT_SUBGROUP') + o.getElementsByTagName('IV_SUBGROUP') + o.getElementsByTagName('IPD_SUBGROUP')
 
-            (octype, name, units, point, ci95low, ci95up, favours1, favours2, studies, participants, usetotal, subgroupspresent, study_text) = data
-            ocstr = "%s.%s" % (c_no, o_no)
-            octitle = ("Outcome %s" % (ocstr, ))
+                for sg in subgroups:
+                    outcome.subgroups.append(ocparse(sg, checkfav = False, analysis_class = reviewmodel.Subgroup)) # want to use the existing favours string
 
+    return review
 
-            picolist += rm_dataparse(title, octitle, octype, name, intname, cntname, units, point, ci95low, ci95up, favours1, favours2, studies, participants, show_participants, usetotal, outcomes[o], cdno, ocstr, searchdate, study_text)
 
-            if subgroupspresent == "YES":
-                subgroups = outcomes[o].getElementsByTagName('DICH_SUBGROUP') + outcomes[o].getElementsByTagName('CONT_SUBGROUP') + outcomes[o].getElementsByTagName('IV_SUBGROUP') + outcomes[o].getElementsByTagName('IPD_SUBGROUP')
+def rm_picos(xml):
+    " as rm_picos_rows, returned as a list "
+    return list(rm_picos_rows(rm_review(xml)))
 
 
-                for s in range(len(subgroups)):
+def rm_picos_rows(review, records = None, diags = None):
+    """
+    MAIN LOOP
 
-                    participants_shown_attr = outcomes[o].attributes.get("SHOW_PARTICIPANTS")
-                    if participants_shown_attr and participants_shown_attr.value == "NO":
-                        show_participants = False
-                    else:
-                        show_participants = True
+    takes in the review (reviewmodel.Review, from rm_review)
+    yields HTML table rows one at a time (so they can be written as they are made)
+    records = optional list; a PICO record (dict) is added for every outcome and subgroup (see rm_dataparse)
+    diags = optional diagnostics.Diagnostics for the review
 
-                    s_no = xml_attribute_contents(subgroups[s], "NO")
+    """
 
-                    data = ocparse(subgroups[s], checkfav = False) #want to use the existing favours string
-                    (octype, sgname, dummy0, point, ci95low, ci95up, dummy1, dummy2, studies, participants, usetotal, dummy3, study_text) = data #slight hack, assigning favours to dummystring, subgroups, and units
-                    ocstr = "%s.%s.%s" % (c_no, o_no, s_no)
-                    octitle = ("Subgroup analysis %s" % (ocstr,))
-                    picolist += rm_dataparse(title, octitle, octype, name, intname, cntname, units, point, ci95low, ci95up, favours1, favours2, studies, participants, show_participants, usetotal, subgroups[s], cdno, ocstr, searchdate, study_text, sgname)
-    return picolist
+    if ABS_ENGINE == "numpy" and absengine.available():
+        abstable = absengine.AbsTable(review, DENOMINATOR)
+    else:
+        abstable = None
 
+    if RECOMPUTE_POOLED and poolengine.available():
+        pooltable = poolengine.PoolTable(review)
+    else:
+        pooltable = None
+
+    for comparison in review.comparisons:
+
+        yield tabtag(tag("Comparison ", "h3"), tag(comparison.title, "h3"))
+
+        yield tabtag("Population", " ")
+        yield tabtag("Intervention", " ")
+        yield tabtag("Comparator", " ")
+        yield tabtag("Safety alerts", " ")
+
+        for outcome in comparison.outcomes:
+            if outcome.skipped:
+                if diags is not None:
+                    diags.add("skipped-outcome", "Outcome skipped; the %s field is incomplete" % (outcome.skipped, ), diagnostics.ERROR, comparison.no)
+                yield tabtag(tag(("Comparison skipped from Revman file here"), "h3"))
+                yield tabtag(("In tests, this was due to errors in the original file where the authors have incompletely filled in the %s field." % (outcome.skipped, )))
+                continue
+
+            ocstr = "%s.%s" % (comparison.no, outcome.no)
+            octitle = ("Outcome %s" % (ocstr, ))
 
-def rm_dataparse(title, octitle, octype, name, intname, cntname, units, point, ci95low, ci95up, favours1, favours2, studies, participants, show_participants, usetotal, xml, cdno, ocstr, searchdate, study_text, sgname = None):
+            for row in rm_dataparse(comparison, outcome, outcome, octitle, ocstr, review, abstable = abstable, records = records, diags = diags, pooltable = pooltable):
+                yield row
+
+            for sg in outcome.subgroups:
+                ocstr = "%s.%s.%s" % (comparison.no, outcome.no, sg.no)
+                octitle = ("Subgroup analysis %s" % (ocstr,))
+                for row in rm_dataparse(comparison, outcome, sg, octitle, ocstr, review, abstable = abstable, records = records, diags = diags, pooltable = pooltable):
+                    yield row
+
+
+def rm_dataparse(comparison, outcome, analysis, octitle, ocstr, review, abstable = None, records = None, diags = None, pooltable = None):
     """
-    take statistical data
+    take statistical data (analysis = the outcome, or one of its subgroups)
     parse, and output as CCA text
+    names, units and favours labels are always those of the outcome
+    records = optional list; the same results as a PICO record (dict) are added to it
+    diags = optional diagnostics.Diagnostics; problems are added at ocstr
+    pooltable = optional poolengine.PoolTable; the estimate recomputed from the study data is given
+    where there was no meta-analysis, and any disagreement with the one reported is added to diags
     """
+    (title, cdno, searchdate) = (comparison.title, review.cdno, review.searchdate)
+    (name, units, favours1, favours2) = (outcome.name, outcome.units, outcome.favours1, outcome.favours2)
+    (point, ci95low, ci95up, studies, usetotal, study_text) = (analysis.point, analysis.ci95low, analysis.ci95up, analysis.studies, analysis.usetotal, analysis.study_text)
 
-    if sgname:
+    if analysis is not outcome and analysis.name:
         # indicate whether this is a subgroup
-        sgname = name + " - [subgroup: " + sgname + "]"
+        sgname = name + " - [subgroup: " + analysis.name + "]"
     else:
         sgname = name
 
+    if records is not None:
+        record = pico_record(comparison, outcome, analysis, ocstr, review)
+        records.append(record)
+    else:
+        record = None
+
+    located = diags.at(ocstr) if diags is not None else None
+
+    pooled = pooltable.lookup(analysis) if pooltable else None
+    if pooled is not None:
+        if record is not None:
+            record["recomputed"] = pooled_record(pooled)
+        if pooled.agrees is False and located is not None:
+            located.add("pooled-mismatch", "The review gives %s; recomputed from the study data (%s): %s (%s differ)"
+                        % (estimate_text(units, point, ci95low, ci95up), poolengine.method_text(pooled),
+                           estimate_text(units, pooled.point, pooled.ci95low, pooled.ci95up), ", ".join(pooled.mismatches)))
+
     picolist = []
     picolist.append(tabtag(tag(octitle, "h4"), tag(sgname, "h4")))
 
     if usetotal == "SUB":
         # no overall meta-analysis; subgroups only will be reported in CCA (as in original review)
         picolist.append(tabtag(tag("Analysed by subgroup only", "h4")))
+        if record is not None:
+            record["subgroups_only"] = True
 
     else:
         # yes - there is an overall meta-analysis
@@ -874,20 +1181,29 @@ def rm_dataparse(title, octitle, octype, name, intname, cntname, units, point, c
             nresult = "We found no studies meeting our criteria which assessed the effect of " + mid_sent(title) + " on " + mid_sent(name)
             qresult = "n/a"
             abresult = "n/a"
+            if located is not None:
+                located.add("no-studies", "No studies in this analysis", diagnostics.NOTE)
         elif type(point) == type(None):
             nresult = "No narrative result is available for this analysis. (The analysis includes multiple studies but no meta-analysis was conducted.)"
             qresult = "The results from individual studies were: " + study_text + "; Forest plot details: " + cdno + " Analysis " + ocstr
+            if pooled is not None:
+                qresult += ". Pooled by the PICOtron from the study data (not a result of the review; %s, %s): %s" % (
+                    poolengine.method_text(pooled), numberword("study", str(pooled.studies)), estimate_text(units, pooled.point, pooled.ci95low, pooled.ci95up))
+                if located is not None:
+                    located.add("pooled-recomputed", "No meta-analysis in the review; pooled estimate recomputed from the study data", diagnostics.NOTE)
             abresult = "The absolute effect in each group cannot be calculated as data were not meta-analysed."
+            if located is not None:
+                located.add("no-meta-analysis", "Studies were not meta-analysed; individual study results given", diagnostics.NOTE)
         else:
-            nresult = rm_narrative(octype, intname, cntname, name, units, point, ci95low, ci95up, studies, participants, show_participants)
-            if xml.nodeName == "IV_OUTCOME" or xml.nodeName == "IV_SUBGROUP":
+            nresult = rm_narrative(outcome, analysis, located)
+            if analysis.kind == "IV_OUTCOME" or analysis.kind == "IV_SUBGROUP":
                 abresult = "The absolute effect in each group cannot be calculated using only the generic inverse variance data from this analysis."
-           # elif xml.nodeName == "IPD_OUTCOME" or xml.nodeName == "IPD_SUBGROUP":
+           # elif analysis.kind == "IPD_OUTCOME" or analysis.kind == "IPD_SUBGROUP":
            #     abresult = "The absolute effect in each group cannot be calculated from time-to-event data (hazard ratios)."
-            elif xml.nodeName == "CONT_OUTCOME" or xml.nodeName == "CONT_SUBGROUP": # new insertion - no longer want continuous o/cs calculated
+            elif analysis.kind == "CONT_OUTCOME" or analysis.kind == "CONT_SUBGROUP": # new insertion - no longer want continuous o/cs calculated
                 abresult = " "
             elif units[-2:] == "OR" or units[-2:] == "RR" or units.upper()[-10:] == "RATE RATIO":
-                abresult = rm_abs_values(octype, intname, cntname, name, units, point, ci95low, ci95up, studies, participants, xml)
+                abresult = rm_abs_values(outcome, analysis, abstable, record)
             else:
                 abresult = "The absolute effect in each group cannot be calculated using " + units + " from this analysis"
 
@@ -898,9 +1214,9 @@ def rm_dataparse(title, octitle, octype, name, intname, cntname, units, point, c
                 cutoff = 0
 
             if ci95up < cutoff:
-                favours = "There was a statistically significant difference between groups, " + favours_parser(favours1)
+                favours = "There was a statistically significant difference between groups, " + favours_parser(favours1, located)
             elif ci95low > cutoff:
-                favours = "There was a statistically significant difference between groups, " + favours_parser(favours2)
+                favours = "There was a statistically significant difference between groups, " + favours_parser(favours2, located)
             else:
                 favours = "There was no statistically significant difference between groups"
 
@@ -914,9 +1230,62 @@ def rm_dataparse(title, octitle, octype, name, intname, cntname, units, point, c
         picolist.append(tabtag("Quantitative result: absolute effect", abresult))
         picolist.append(tabtag("Reference", cdno))
         picolist.append(tabtag("Search date", searchdate))
+
+        if record is not None:
+            record.update({"narrative": nresult, "quantitative": qresult, "absolute_text": abresult})
     return picolist
 
 
+def pico_record(comparison, outcome, analysis, ocstr, review):
+    """
+    the structured values behind one outcome or subgroup in the CCA (for the --records export)
+    numbers from the file are kept as strings, so they are exactly as given; rm_dataparse adds the text results
+    """
+    def text(value):
+        if value is None:
+            return None
+        return unicode(value)
+
+    is_subgroup = analysis is not outcome
+    return {"cdno": review.cdno,
+            "analysis": ocstr,
+            "comparison_no": comparison.no,
+            "comparison": comparison.title,
+            "outcome_no": outcome.no,
+            "outcome": outcome.name,
+            "subgroup_no": analysis.no if is_subgroup else None,
+            "subgroup": analysis.name if is_subgroup else None,
+            "data_type": analysis.kind,
+            "intervention": outcome.intname,
+            "control": outcome.cntname,
+            "units": outcome.units,
+            "point": text(analysis.point),
+            "ci_low": text(analysis.ci95low),
+            "ci_high": text(analysis.ci95up),
+            "studies": analysis.studies,
+            "participants": analysis.participants,
+            "participants_shown": outcome.show_participants,
+            "subgroups_only": False,
+            "narrative": None,
+            "quantitative": None,
+            "absolute": None,
+            "absolute_text": None,
+            "recomputed": None,
+            "search_date": review.searchdate}
+
+
+def pooled_record(pooled):
+    " the estimate recomputed from the study data (a poolengine.Pooled), for a PICO record "
+    return {"point": pooled.point, "ci_low": pooled.ci95low, "ci_high": pooled.ci95up, "studies": pooled.studies,
+            "method": pooled.method, "random_effects": pooled.random, "agrees": pooled.agrees,
+            "mismatches": list(pooled.mismatches)}
+
+
+def estimate_text(units, point, ci95low, ci95up):
+    " e.g. 'RR 0.78, 95% CI 0.60 to 1.01' (Decimals or floats) "
+    return "%s %.2f, 95%% CI %.2f to %.2f" % (units, point, ci95low, ci95up)
+
+
 
 
 
@@ -926,10 +1295,11 @@ def rm_dataparse(title, octitle, octype, name, intname, cntname, units, point, c
 # data validation functions
 #
 
-def val_comparison(txt):
+def val_comparison(txt, diags = None):
     """
     check comparisons, return true or false
     check 1 - does it have v, versus, or vs?
+    diags = optional diagnostics.Located; a failed check is added to it
     """
     vcheck = False
 
@@ -937,8 +1307,8 @@ def val_comparison(txt):
         if v in txt:
             vcheck = True
 
-    if not vcheck:
-        ERROR_LOG.append("Outcome name without intervention and control")
+    if not vcheck and diags is not None:
+        diags.add("outcome-name", "Outcome name without intervention and control")
     return vcheck
 
 #
@@ -952,6 +1322,12 @@ def outputfile(inputfile):
 
     return os.path.join(PATH["op"], os.path.splitext(os.path.split(inputfile)[-1])[0]+".doc")
 
+def recordsfile(inputfile):
+    """
+    returns the PICO records (--records) filename from input filename (same name with jsonl extension moved to op directory)
+    """
+    return os.path.join(PATH["op"], os.path.splitext(os.path.split(inputfile)[-1])[0]+".jsonl")
+
 def htmlfile(inputfile):
     """
     returns output filename from input filename (same name with txt extension moved to op directory)
@@ -960,6 +1336,58 @@ def htmlfile(inputfile):
 
 
 
+def error_line(error_text):
+    " the last line of a traceback (the exception), or a worker pool message "
+    if not error_text:
+        return "unknown error"
+    return error_text.strip().splitlines()[-1]
+
+
+def diagnostic_text(d):
+    " one line for a diagnostics.Diagnostic, e.g. 'warning (analysis 1.2): ... [default-favours-label]' "
+    if d.location:
+        return "%s (analysis %s): %s [%s]" % (d.severity, d.location, d.message, d.code)
+    return "%s: %s [%s]" % (d.severity, d.message, d.code)
+
+
+def find_duplicate_files(files, manifest):
+    """
+    groups files which are the same review; identical contents (by hash, from the
+    manifest), or the same CD number and version
+    the most recently modified file of each group is converted
+    returns a list of (index of file to convert, list of indices of its duplicates, list of reasons)
+    """
+    return dedup.find_duplicates(files, [("same contents", manifest.content_hash), ("same CD number and version", rm_sniff_version)],
+                                 rank = os.path.getmtime)
+
+
+def duplicates_text(files, duplicates):
+    " report of duplicate groups (from find_duplicate_files) "
+    lines = []
+    for (c, dups, reasons) in duplicates:
+        lines.append("%s = %s (%s)" % (os.path.basename(files[c]), ", ".join(os.path.basename(files[d]) for d in dups), "; ".join(reasons)))
+    return "\n".join(lines)
+
+
+def build_settings():
+    " the version and rendering flags which the output depends on (stored in the build manifest) "
+    return {"version": PICOTRON_VERSION, "DISPLAY_COMMENTS": DISPLAY_COMMENTS, "ABS_IF_SIG_ONLY": ABS_IF_SIG_ONLY, "DENOMINATOR": DENOMINATOR, "EXPORT_RECORDS": EXPORT_RECORDS, "QUESTION_SEED": QUESTION_SEED, "RECOMPUTE_POOLED": RECOMPUTE_POOLED,
+            "RAW_TAG_CONTENTS": RAW_TAG_CONTENTS, "PARSER_BACKEND": PARSER_BACKEND}
+
+
+def records_text(records):
+    " PICO records as JSON lines (utf-8) "
+    return "".join(json.dumps(r, sort_keys=True) + "\n" for r in records)
+
+
+def write_records(filename, records):
+    " writes PICO records to filename (via a temporary name, as the html) "
+    tmp = filename + ".part"
+    with open(tmp, 'wb') as f:
+        f.write(records_text(records))
+    os.rename(tmp, filename)
+
+
 def datecode():
     """
     top of file date/time/compiler options stamp
@@ -1004,144 +1432,643 @@ def writefile(filename, txt):
 
 
 
-def main():
-    files = glob.glob(os.path.join(PATH["rev"],  "*.rm5")) # get all reviews
-    topic_lookup = parse_topics(get_topic_filename())
-    os.system("clear")
-    print INTRO
+def process_review(f, topic_lookup, timer = instrument.NULL_FILE_TIMER, data = None, op = None, records = None, diags = None, index_entry = None):
+    """
+    converts a single review file to html in the output folder
+    returns the CD number of the review written, or None if skipped (not an intervention review)
+    raises on any error in the file
+    timer = instrument.FileTimer to record the time spent in each stage
+    data = the file's contents, if already read
+    op = the htmlwriter to use (default htmlwriter.HtmlWriter for the output file)
+    records = optional list; filled with the PICO records of the review (see pico_record)
+    diags = optional diagnostics.Diagnostics; filled with the problems found in the review
+    (shown in the output if DISPLAY_COMMENTS)
+    index_entry = optional dict; filled with the title, search date and rows of the review
+    for the outcome index (see outcomeindex.OutcomeIndex.update)
+    """
+    if diags is None:
+        diags = diagnostics.Diagnostics()
+    (cache_hits, cache_misses) = textgen.cache_totals()
+    xmldoc = rm_parse(f, data = data)
+    timer.count("parse_bytes_skipped", getattr(xmldoc, "bytes_skipped", 0))
+    xmldoc = tagindex.indexed(xmldoc) # one walk; later tag lookups served from the index
+
+    if not rm_is_intervention_review(xmldoc): # only process intervention style reviews for the purposes of CCA
+        timer.lap("parse", timer.input_bytes)
+        return None # = skip
+
+    timer.lap("parse", timer.input_bytes)
+
+    review = rm_review(xmldoc) # all rendering below reads from the model
+    timer.lap("model")
+    if index_entry is not None:
+        index_entry.update(title = review.title, search_date = review.searchdate, rows = outcomeindex.review_rows(review))
+        timer.lap("index_rows")
+
+    if op is None:
+        op = htmlwriter.HtmlWriter(outputfile(f)) # fragments are written as they are made
+    try:
+        op.write(HTML_HEADER)
+        op.write(tag("Cochrane Clinical Answers", "h3"))
 
-    nofiles = len(files)
-    nofiles_u = len(set(files))
-    print "%d files found - processing..." % (nofiles,)
-    print "(%d unique files)" % (nofiles_u,)
 
-    files_count = collections.Counter(files)
-    duplicates = [i for i in files_count if files_count[i]>1]
-    if duplicates:
-        print "The following duplicates were found ", ",".join(duplicates)
 
-    not_done = []
+        q = review.title
 
-    p = progressbar.ProgressBar(nofiles, timer=True)
+        (intname, cntname, cndname, popname, patternno) = splitter(mid_sent(q))
+        if intname:
+            qu = randomquestion(intname, cntname, cndname, popname, patternno)
+        else:
+            qu = "[Sorry, it was not possible to auto-generate a question (the wording of the review title was not in the expected format).]"
+            diags.add("title-format", "No question generated; the title is not in the form 'intervention for condition'")
 
-    for c in range(nofiles):
-        p.tap()
+        op.write(tag(qu, "h1"))
 
-        try:
 
-            f = files[c]
+        op.write(TABLE_HEADER)
 
-            op = []
-            xmldoc = minidom.parse(f)
+        cdno = review.cdno
 
-            if not rm_is_intervention_review(xmldoc): # only process intervention style reviews for the purposes of CCA
-                continue # = skip
+        op.write(tabtag(tag("Notes to Associate Editor from Cochrane Review " + cdno + " [not for publication]", "h3")))
+        # print cdno
 
-            op.append(HTML_HEADER)
-            op.append(tag("Cochrane Clinical Answers", "h3"))
+        timer.lap("assembly")
+        topic_headers = "; ".join(list(topic_lookup[cdno]))
+        timer.lap("topics", topic_headers)
+        if not topic_headers:
+            diags.add("no-topics", "%s is not in the topic map" % (cdno, ))
 
 
+        op.write(tabtag("Review title", q))
 
-            q = rm_title(xmldoc)
+        # op.write(tabtag("Short conclusions<br/>(Abstract > Conclusions)", rm_summaryshort(xmldoc)))
+        # op.write(tabtag("Long conclusions<br/>(Authors' conclusions > Implications for practice)", rm_implications(xmldoc)))
 
-            (intname, cntname, cndname, popname, patternno) = splitter(mid_sent(q))
-            if intname:
-                qu = randomquestion(intname, cntname, cndname, popname, patternno)
-            else:
-                qu = "[Sorry, it was not possible to auto-generate a question (the wording of the review title was not in the expected format).]"
+        # op.write(tabtag("Population<br/>(Methods > Criteria for considering studies for this review > Types of participants)", rm_overview_p(xmldoc)))
+        # op.write(tabtag("Interventions<br/>(Methods > Criteria for considering studies for this review > Types of interventions)", rm_overview_i(xmldoc)))
+        op.write(tabtag("Outcomes<br/>(Methods > Criteria for considering studies for this review > Types of outcome measures)", review.outcomes_text))
+        # op.write(tabtag("Risk of bias of studies<br/>(Results > Risk of bias in included studies)", rm_quality(xmldoc)))
+        op.write(TABLE_FOOTER)
 
-            op.append(tag(qu, "h1"))
 
+        op.write(tag(" ", "br"))
 
-            op.append(TABLE_HEADER)
+        op.write(TABLE_HEADER)
+        op.write(tabtag(tag("CCA number", "h4"), "cca "))
+        op.write(tabtag(tag("DOI", "h4"), "10.1002/cca."))
+        op.write(TABLE_FOOTER)
 
-            cdno =  rm_unique(xmldoc)
+        op.write(tag(" ", "br"))
 
-            op.append(tabtag(tag("Notes to Associate Editor from Cochrane Review " + cdno + " [not for publication]", "h3")))
-            # print cdno
 
-            topic_headers = "; ".join(list(topic_lookup[cdno]))
+        op.write(TABLE_HEADER)
+        op.write(tabtag(tag("Clinical question", "h4"), qu))
+        op.write(tabtag("Clinical answer", " "))
+        op.write(tabtag("Abstract", "This Cochrane Clinical Answer evaluates %s in people with %s." % (intname, cndname)))
 
+        # no longer needed
+        # op.write(tabtag("Keywords", " "))
 
-            op.append(tabtag("Review title", q))
+        op.write(tabtag("Subject (1)", topic_headers))
+        op.write(tabtag("Subject (2)", " "))
+        op.write(tabtag("Subject (3)", " "))
 
-            # op.append(tabtag("Short conclusions<br/>(Abstract > Conclusions)", rm_summaryshort(xmldoc)))
-            # op.append(tabtag("Long conclusions<br/>(Authors' conclusions > Implications for practice)", rm_implications(xmldoc)))
+        # no longer needed
+        # op.write(tabtag("MeSH codes", " "))
 
-            # op.append(tabtag("Population<br/>(Methods > Criteria for considering studies for this review > Types of participants)", rm_overview_p(xmldoc)))
-            # op.append(tabtag("Interventions<br/>(Methods > Criteria for considering studies for this review > Types of interventions)", rm_overview_i(xmldoc)))
-            op.append(tabtag("Outcomes<br/>(Methods > Criteria for considering studies for this review > Types of outcome measures)", rm_outcomes(xmldoc)))
-            # op.append(tabtag("Risk of bias of studies<br/>(Results > Risk of bias in included studies)", rm_quality(xmldoc)))
-            op.append(TABLE_FOOTER)
+        op.write(TABLE_FOOTER)
 
 
-            op.append(tag(" ", "br"))
+        op.write(tag(" ", "br"))
 
-            op.append(TABLE_HEADER)
-            op.append(tabtag(tag("CCA number", "h4"), "cca "))
-            op.append(tabtag(tag("DOI", "h4"), "10.1002/cca."))
-            op.append(TABLE_FOOTER)
+        op.write(tag(datecode(), "p", "compiler"))
+        op.slot() # compiler comments go here, once known
 
-            op.append(tag(" ", "br"))
 
+        op.write(TABLE_HEADER)
+        op.write(tabtag(tag("PICOS", "h3")))
+        timer.lap("assembly", op.bytes_written)
+        picos_start = op.bytes_written
+        op.writelines(rm_picos_rows(review, records, diags))
+        timer.lap("rm_picos", op.bytes_written - picos_start)
+        op.write(TABLE_FOOTER)
 
-            op.append(TABLE_HEADER)
-            op.append(tabtag(tag("Clinical question", "h4"), qu))
-            op.append(tabtag("Clinical answer", " "))
-            op.append(tabtag("Abstract", "This Cochrane Clinical Answer evaluates %s in people with %s." % (intname, cndname)))
 
-            # no longer needed
-            # op.append(tabtag("Keywords", " "))
+        op.write(HTML_FOOTER)
 
-            op.append(tabtag("Subject (1)", topic_headers))
-            op.append(tabtag("Subject (2)", " "))
-            op.append(tabtag("Subject (3)", " "))
 
-            # no longer needed
-            # op.append(tabtag("MeSH codes", " "))
+        # add in this review's diagnostics if compiler comments = True
+        if DISPLAY_COMMENTS:
+            op.fill([tag(diagnostic_text(d), "p", "compiler") for d in diags])
+        else:
+            op.fill([""])
+        timer.lap("assembly")
+        (hits, misses) = textgen.cache_totals()
+        timer.count("text_cache_hits", hits - cache_hits)
+        timer.count("text_cache_misses", misses - cache_misses)
+
+        op.close()
+        timer.lap("writefile", op.bytes_written)
+    except:
+        op.abort()
+        raise
 
-            op.append(TABLE_FOOTER)
+    return cdno
 
 
-            op.append(tag(" ", "br"))
 
-            op.append(tag(datecode(), "p", "compiler"))
-            op.append("!/!/!/!/COMPILER!/!/!/!/")
+def convert_review(data, topic_lookup = None, records = False):
+    """
+    converts one review in memory (for use as a library, e.g. by service.py);
+    no files are read or written, and nothing is printed
+    data = the contents of a RevMan file (bytes)
+    topic_lookup = mapping of CD number to a set of top level headings, as from
+    load_topics (default: no headings)
+    records = True to also return the PICO records (see pico_record)
+    returns a dict of
+      cdno = the CD number, or None if skipped (not an intervention review)
+      html = the document (utf-8 bytes), or None if skipped
+      records = list of PICO records, or None
+      diagnostics = list of dicts (code, severity, message, location)
+    raises on any error in the file
+    """
+    if topic_lookup is None:
+        topic_lookup = collections.defaultdict(set)
+    op = htmlwriter.HtmlBuffer("review.doc") # (never saved)
+    review_records = [] if records else None
+    diags = diagnostics.Diagnostics()
+    cdno = process_review("review.rm5", topic_lookup, data = data, op = op, records = review_records, diags = diags)
+    return {"cdno": cdno, "html": op.data if cdno else None, "records": review_records,
+            "diagnostics": [dict(d._asdict()) for d in diags]}
 
 
-            op.append(TABLE_HEADER)
-            op.append(tabtag(tag("PICOS", "h3")))
-            op += rm_picos(xmldoc)
-            op.append(TABLE_FOOTER)
+def process_review_timed(f, topic_lookup, run_timer, buffered = False):
+    """
+    runs process_review with a new file timer from run_timer (an instrument.RunTimer)
+    returns (CD number or None, file timer, diagnostics.Diagnostics, outcome index entry or None);
+    the caller adds the timer to the run (and the entry to the index)
+    if buffered, the document is not written but returned, as
+    (CD number, file timer, diagnostics, index entry, document bytes or None, list of PICO records or None)
+    if EXPORT_RECORDS, and not buffered, the PICO records are written next to the document
+    """
+    timer = run_timer.file(f)
+    records = [] if EXPORT_RECORDS else None
+    diags = diagnostics.Diagnostics()
+    index_entry = {} if OUTCOME_INDEX else None
+    if buffered:
+        op = htmlwriter.HtmlBuffer(outputfile(f))
+        cdno = process_review(f, topic_lookup, timer, op = op, records = records, diags = diags, index_entry = index_entry)
+        return (cdno, timer, diags, index_entry, op.data, records)
+    cdno = process_review(f, topic_lookup, timer, records = records, diags = diags, index_entry = index_entry)
+    if cdno and EXPORT_RECORDS:
+        write_records(recordsfile(f), records)
+        timer.lap("records")
+    return (cdno, timer, diags, index_entry)
+
+
+def process_review_safe(f, topic_lookup, run_timer, buffered = False):
+    """
+    as process_review_timed, but never raises (for the single process loop)
+    returns (ok, value) in the same form as the worker pool (value = the error text if not ok)
+    """
+    try:
+        return (True, process_review_timed(f, topic_lookup, run_timer, buffered))
+    except:
+        return (False, traceback.format_exc())
 
 
-            op.append(HTML_FOOTER)
+def review_pipeline(topic_lookup, run_timer, buffered = False):
+    """
+    returns a pipeline.Pipeline which converts reviews, reading input and writing output
+    in their own threads while the next review is processed
+    values are as process_review_timed (if buffered, there is no write stage)
+    """
+    def read(f):
+        timer = run_timer.file(f)
+        with open(f, 'rb') as input_f:
+            data = input_f.read()
+        timer.lap("read", len(data))
+        return (data, timer)
+
+    def process(f, (data, timer)):
+        timer.restart()
+        op = htmlwriter.HtmlBuffer(outputfile(f))
+        records = [] if EXPORT_RECORDS else None
+        diags = diagnostics.Diagnostics()
+        index_entry = {} if OUTCOME_INDEX else None
+        cdno = process_review(f, topic_lookup, timer, data, op, records, diags, index_entry)
+        if buffered:
+            return ((cdno, timer, diags, index_entry, op.data, records), None)
+        if cdno is None:
+            return ((cdno, timer, diags, index_entry), None)
+        return ((cdno, timer, diags, index_entry), (f, op, records, timer))
+
+    def write((f, op, records, timer)):
+        timer.restart()
+        op.save()
+        timer.lap("writefile")
+        if records is not None:
+            write_records(recordsfile(f), records)
+            timer.lap("records")
+
+    return pipeline.Pipeline(read, process, write)
+
+
+def build(files, topic_lookup, manifest, run_timer, workers = 1, rebuild = False, use_pipeline = False, output_bundle = None, report = None, outcome_index = None, changed = None,
+          progress = progressbar.ThroughputProgress):
+    """
+    converts each of files which is not current in manifest (buildcache.BuildManifest),
+    or all of them if rebuild, and records the results in the manifest
+    (in worker processes if workers > 1, otherwise in a read/process/write pipeline if use_pipeline)
+    output_bundle = a bundle.Bundle to add the documents to, instead of writing them to the output folder
+    report = a diagnostics.BatchReport to add each file's diagnostics (or failure) to; unchanged
+    files keep the entries it already has
+    outcome_index = an outcomeindex.OutcomeIndex to update; files it does not hold are converted
+    even if unchanged
+    changed = optional list of files; only these are converted (if not current), though
+    duplicates are still found among all of files
+    progress = the progress bar class, given the number of files and bytes to convert
+    (progressbar.NullProgress to show none)
+    if DUPLICATES is set, only one of each group of duplicate files is converted (see find_duplicate_files);
+    a new copy of a file already converted is given that file's output
+    returns (list of results for files; "done", "duplicate", "skipped", "unchanged", or None = not done,
+             collections.Counter of skipped review types, where found before parsing,
+             list of duplicate groups from find_duplicate_files)
+    """
+    nofiles = len(files)
+    if changed is not None:
+        manifest.invalidate(changed) # (they may have changed since the manifest last looked)
+
+    if rebuild:
+        to_do = range(nofiles)
+    else:
+        to_do = [c for c in range(nofiles) if not manifest.is_current(files[c], topic_lookup, outputfile(files[c]))]
+        if outcome_index is not None:
+            indexed = outcome_index.files()
+            stale = set(to_do)
+            to_do = [c for c in range(nofiles) if c in stale or indexed.get(os.path.basename(files[c])) != manifest.content_hash(files[c])]
+
+    results = ["unchanged"] * nofiles
+    for c in to_do:
+        results[c] = None # (files not in changed keep this, if not current; e.g. not done last time)
+    pending = set(to_do)
+    if changed is not None:
+        changed = set(changed)
+        to_do = [c for c in to_do if files[c] in changed]
+
+    print "(%d unchanged since last run)" % (nofiles - len(pending),)
+
+    if DUPLICATES:
+        duplicates = find_duplicate_files(files, manifest)
+        # where the file to convert is a copy of one already converted, that one is used instead
+        for (i, (c, dups, reasons)) in enumerate(duplicates):
+            if c in pending:
+                current = [d for d in dups if d not in pending and manifest.content_hash(files[d]) == manifest.content_hash(files[c])]
+                if current:
+                    duplicates[i] = (current[0], sorted([c] + [d for d in dups if d != current[0]]), reasons)
+    else:
+        duplicates = []
+    duplicates_of = dict((c, dups) for (c, dups, reasons) in duplicates)
+    if duplicates:
+        print "(%d duplicate files; each review converted once:)" % (sum(len(dups) for dups in duplicates_of.values()), )
+        print duplicates_text(files, duplicates)
+        is_duplicate = set(d for dups in duplicates_of.values() for d in dups)
+        to_do = [c for c in to_do if c not in is_duplicate]
+
+    skip_types = collections.Counter()
+    if SNIFF_TYPE:
+        # reject other types of review from their first few bytes, before they are parsed
+        for c in to_do:
+            review_type = rm_sniff_type(files[c])
+            if review_type is not None and review_type != 'INTERVENTION':
+                results[c] = "skipped"
+                skip_types[review_type] += 1
+                manifest.record(files[c], None, topic_lookup)
+                if report is not None:
+                    report.add(files[c], [])
+                if outcome_index is not None:
+                    outcome_index.update(files[c], manifest.content_hash(files[c]), None)
+        to_do = [c for c in to_do if results[c] is None]
+
+    def finished(c, ok, value):
+        " records the outcome of one file "
+        if ok:
+            (cdno, timer, diags, index_entry) = value[:4]
+            if output_bundle is not None and cdno:
+                timer.restart()
+                for d in [c] + duplicates_of.get(c, []):
+                    output_bundle.add(os.path.basename(outputfile(files[d])), value[4])
+                    timer.lap("writefile", len(value[4]))
+                    if value[5] is not None:
+                        output_bundle.add_records(os.path.basename(recordsfile(files[d])), value[5])
+                        timer.lap("records")
+            if report is not None:
+                report.add(files[c], diags)
+            if outcome_index is not None:
+                timer.restart()
+                outcome_index.update(files[c], manifest.content_hash(files[c]), cdno, **(index_entry or {}))
+                timer.lap("index")
+            results[c] = "done" if cdno else "skipped"
+            manifest.record(files[c], cdno, topic_lookup)
+            run_timer.add(timer)
+            finish_duplicates(c, cdno, copy_output = output_bundle is None)
+        else:
+            manifest.forget(files[c])
+            if outcome_index is not None:
+                outcome_index.forget(files[c])
+            if report is not None:
+                report.add_failure(files[c], error_line(value))
+            for d in duplicates_of.get(c, []):
+                results[d] = None
+                manifest.forget(files[d])
+
+    def finish_duplicates(c, cdno, copy_output = True):
+        " gives the duplicates of files[c] its result (and output) "
+        for d in duplicates_of.get(c, []):
+            if cdno and copy_output:
+                dedup.link_or_copy(outputfile(files[c]), outputfile(files[d]), link = DUPLICATES == "link")
+                if EXPORT_RECORDS:
+                    dedup.link_or_copy(recordsfile(files[c]), recordsfile(files[d]), link = DUPLICATES == "link")
+            results[d] = "duplicate" if cdno else "skipped"
+            manifest.record_as(files[d], files[c])
+            if report is not None:
+                report.add(files[d], []) # (its diagnostics are those of files[c])
+            if outcome_index is not None:
+                outcome_index.add_duplicate(files[d], manifest.content_hash(files[d]), files[c])
+
+    if to_do:
+        sizes = dict((c, os.path.getsize(files[c])) for c in to_do)
+        p = progress(len(to_do), sum(sizes.values()))
+
+    buffered = output_bundle is not None
+
+    if workers > 1 or use_pipeline:
+        if workers > 1:
+            pool = workerpool.WorkerPool(lambda f: process_review_timed(f, topic_lookup, run_timer, buffered), workers)
+        else:
+            pool = review_pipeline(topic_lookup, run_timer, buffered)
+        for (i, ok, value) in pool.imap([files[c] for c in to_do]):
+            finished(to_do[i], ok, value)
+            p.tap(sizes[to_do[i]])
+        for c in to_do:
+            if results[c] is None:
+                print "error, file %s not done" % (files[c], )
+    else:
+        for c in to_do:
+            (ok, value) = process_review_safe(files[c], topic_lookup, run_timer, buffered)
+            finished(c, ok, value)
+            if not ok:
+                print ""
+                print "error, file %s not done" % (files[c], )
+            p.tap(sizes[c])
+    if to_do:
+        p.finish()
+
+    # duplicates of files which were not converted this run (unchanged, or skipped before parsing)
+    for (c, dups, reasons) in duplicates:
+        if c not in to_do and results[c] is not None and any(results[d] is None for d in dups):
+            finish_duplicates(c, manifest.cdno(files[c]))
+
+    return (results, skip_types, duplicates)
+
+
+def write_not_done(not_done):
+    if not_done:
+        with open(get_not_done_filename(), 'wb') as not_done_f:
+            not_done_f.write(bundle.not_done_text(not_done))
 
 
-            # add in error log if compiler comments = True
-            ccom_index = op.index("!/!/!/!/COMPILER!/!/!/!/")
+def shard_files(files, manifest):
+    " the files in this run's shard (SHARD), as split by shards.assign "
+    keys = []
+    for f in files:
+        header = rm_sniff_header(f)
+        cdno = cdno_from_doi(header.get('DOI', '')) if header else None
+        keys.append(cdno or "sha1:" + manifest.content_hash(f))
+    shard_nos = shards.assign(keys, [os.path.getsize(f) for f in files], SHARD[1])
+    return [f for (f, shard_no) in zip(files, shard_nos) if shard_no == SHARD[0]]
+
+
+def write_run_report(details, not_done):
+    " saves the run details, with the not done list (output/run.json, or one per shard) "
+    report = dict(details, not_done = [os.path.basename(f) for f in not_done])
+    if SHARD:
+        report["shard"] = "%d/%d" % SHARD
+    with open(get_run_filename(), 'wb') as f:
+        json.dump(report, f, indent=1, sort_keys=True)
+
+
+def merge_shards(n):
+    """
+    combines the output of a run split with --shard i/n, once every shard has finished:
+    the run details (output/run.json), not done list, manifest, diagnostics and outcome index
+    of each shard are merged into the files of an unsharded run
+    returns the merged run details, or raises IOError if a shard has not finished
+    """
+    every_shard = [(i, n) for i in range(1, n + 1)]
+    run_filenames = [shards.shard_filename(get_run_filename(), shard) for shard in every_shard]
+    missing = [f for f in run_filenames if not os.path.exists(f)]
+    if missing:
+        raise IOError("shard not finished (no %s)" % (", ".join(missing), ))
+
+    runs = []
+    for filename in run_filenames:
+        with open(filename, 'rb') as f:
+            runs.append(json.load(f))
+    merged = shards.merge_runs(runs)
+
+    manifest = buildcache.BuildManifest(get_manifest_filename(), build_settings())
+    report = diagnostics.BatchReport()
+    if OUTCOME_INDEX:
+        outcome_index = outcomeindex.OutcomeIndex(get_outcome_index_filename())
+    for shard in every_shard:
+        manifest.merge(shards.shard_filename(get_manifest_filename(), shard))
+        report.load(shards.shard_filename(get_diagnostics_filenames()[0], shard))
+        index_filename = shards.shard_filename(get_outcome_index_filename(), shard)
+        if OUTCOME_INDEX and os.path.exists(index_filename):
+            outcome_index.merge(index_filename)
+    manifest.save(keep=merged["files"])
+    if OUTCOME_INDEX:
+        outcome_index.prune(keep=merged["files"])
+    write_diagnostics(report)
+    merged["diagnostics"] = dict(report.counts()[0])
+
+    write_not_done([os.path.join(PATH["rev"], f) for f in merged["not_done"]])
+    with open(get_run_filename(), 'wb') as f:
+        json.dump(merged, f, indent=1, sort_keys=True)
+    return merged
+
+
+def run_details(files, results, skip_types, duplicates, report, run_timer):
+    " dict describing a run, saved in output bundles and output/run.json "
+    details = {"settings": build_settings(),
+               "finished": datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+               "files": [os.path.basename(f) for f in files],
+               "results": dict((os.path.basename(f), r or "not done") for (f, r) in zip(files, results)),
+               "skipped_types": dict(skip_types),
+               "duplicates": [{"converted": os.path.basename(files[c]), "duplicates": [os.path.basename(files[d]) for d in dups], "reasons": reasons}
+                              for (c, dups, reasons) in duplicates],
+               "diagnostics": dict(report.counts()[0])}
+    if run_timer.enabled:
+        details["stage_totals"] = run_timer.totals()
+    return details
+
+
+def summary_line(results, skip_types):
+    line = "%d done; %d duplicates; %d unchanged; %d skipped (not intervention reviews); %d not done" % (results.count("done"), results.count("duplicate"), results.count("unchanged"), results.count("skipped"), results.count(None))
+    if skip_types:
+        line += "\n(skipped without parsing: %s)" % ("; ".join("%d %s" % (n, t) for (t, n) in sorted(skip_types.items())), )
+    return line
+
+
+def watch(topic_lookup, manifest, run_timer, report, workers = 1, use_pipeline = False, outcome_index = None):
+    """
+    keeps running, converting reviews which are added to or changed in the input folder
+    (and any affected by a change to the topic map) as soon as they have been completely written
+    report = the diagnostics.BatchReport of the first run, updated with each file converted
+    (and files removed from the input folder taken out)
+    stops on ctrl-c
+    """
+    w = watcher.DirectoryWatcher(PATH["rev"], patterns = ("*.rm5", os.path.basename(get_topic_filename())), debounce = WATCH_DEBOUNCE)
+    print ""
+    print "watching %s for changes (using %s) - press ctrl-c to stop" % (PATH["rev"], w.method)
 
-            if DISPLAY_COMMENTS:
-                for e in range(len(ERROR_LOG)):
-                    ERROR_LOG[e] = tag(ERROR_LOG[e], "p", "compiler")
-                op = op[:ccom_index] + ERROR_LOG + op [ccom_index + 1:]
+    try:
+        for changed in w.changes():
+            print ""
+            print "%s - %d changed file%s" % (datetime.now().strftime("%H:%M:%S"), len(changed), (len(changed) > 1) * "s")
+
+            all_files = sorted(glob.glob(os.path.join(PATH["rev"],  "*.rm5")))
+            if get_topic_filename() in changed:
+                # headings may have changed for any review; the manifest decides which
+                print "topic map changed - reloading"
+                topic_lookup = load_topics(get_topic_filename())
+                files = all_files
             else:
-                op[ccom_index] = ""
+                files = [f for f in changed if f in all_files]
+            if outcome_index is not None and outcome_index.prune(keep=all_files):
+                # (a removed file may have held the rows of its duplicates, which are converted again)
+                indexed = outcome_index.files()
+                files += [f for f in all_files if os.path.basename(f) not in indexed and f not in files]
+
+            # (every file, so a changed one is matched with its duplicates among the rest)
+            (results, skip_types, duplicates) = build(all_files, topic_lookup, manifest, run_timer, workers, use_pipeline = use_pipeline, report = report, outcome_index = outcome_index, changed = files)
+            manifest.save(keep=all_files)
+            run_timer.report(*get_timings_filenames())
+            report.prune(keep=all_files)
+            write_diagnostics(report)
+            write_not_done([all_files[c] for c in range(len(all_files)) if results[c] is None])
+            print ""
+            print summary_line(results, skip_types)
+            print "diagnostics: %s" % (report.summary_text(), )
+    except KeyboardInterrupt:
+        print ""
+        print "stopped watching"
+    finally:
+        w.close()
 
-            writefile(outputfile(f), '\n'.join(op))
 
-        except:
-            print "error, file %s not done" % (files[c], )
-            not_done.append(files[c])
+def main():
+    parser = argparse.ArgumentParser(description="converts all intervention reviews from input folder to html documents in output folder")
+    parser.add_argument("--workers", type=int, default=1, metavar="N", help="number of worker processes (default 1 = no pool)")
+    parser.add_argument("--rebuild", action="store_true", help="ignore the build manifest and rebuild every review")
+    parser.add_argument("--timings", action="store_true", help="time each stage of each file; report saved as output/timings.json and timings.csv")
+    parser.add_argument("--pipeline", action="store_true", help="read and write files in background threads while reviews are converted (for slow or network storage; single process only)")
+    parser.add_argument("--bundle", choices=bundle.FORMATS, help="write every document (and the not done list and run details) into one file, output/cca.zip or output/cca.jsonl, instead of one file each; all reviews are rebuilt")
+    parser.add_argument("--records", action="store_true", help="also save the results of every outcome and subgroup as JSON lines, next to each document (output/<review>.jsonl)")
+    parser.add_argument("--seed", type=int, help="choose the wording of each suggested question from this seed, so it is the same on every run")
+    parser.add_argument("--watch", action="store_true", help="after converting, keep running and convert reviews as they are added to or changed in the input folder")
+    parser.add_argument("--shard", metavar="I/N", help="convert only shard I of N of the input files (e.g. 2/4; run each shard on its own machine, sharing the input and output folders)")
+    parser.add_argument("--merge", type=int, metavar="N", help="combine the reports of the N shards of a run (after every --shard I/N has finished), then stop")
+    args = parser.parse_args()
+    if args.bundle and args.watch:
+        parser.error("--bundle cannot be used with --watch")
+    if args.shard and args.watch:
+        parser.error("--shard cannot be used with --watch")
+
+    if args.merge:
+        try:
+            merged = merge_shards(args.merge)
+        except IOError as e:
+            parser.error(str(e))
+        results = [r if r != "not done" else None for r in merged["results"].values()]
+        print "merged %d shards: %d files" % (args.merge, len(merged["files"]))
+        print summary_line(results, collections.Counter(merged["skipped_types"]))
+        for warning in merged.get("warnings", []):
+            print "warning: %s" % (warning, )
+        print "(see %s)" % (get_run_filename(), )
+        return
+
+    if args.shard:
+        global SHARD
+        try:
+            SHARD = shards.parse(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
 
+    global EXPORT_RECORDS
+    EXPORT_RECORDS = EXPORT_RECORDS or args.records
 
-    if not_done:
-        with open('not_done.txt', 'wb') as not_done_f:
-            not_done_f.write("The following files were not able to be processed due to errors:\n\n")
-            not_done_f.write("\n".join(not_done))
+    if args.seed is not None:
+        global QUESTION_SEED, QUESTION_CHOOSER
+        QUESTION_SEED = args.seed
+        QUESTION_CHOOSER = textgen.Chooser(QUESTION_SEED)
+
+    files = sorted(glob.glob(os.path.join(PATH["rev"],  "*.rm5"))) # get all reviews
+    topic_lookup = load_topics(get_topic_filename())
+    os.system("clear")
+    print INTRO
+
+    manifest = buildcache.BuildManifest(get_manifest_filename(), build_settings())
+
+    if SHARD:
+        all_files = len(files)
+        files = shard_files(files, manifest)
+        print "shard %d of %d: %d of %d files (%d bytes)" % (SHARD + (len(files), all_files, sum(os.path.getsize(f) for f in files)))
+
+    nofiles = len(files)
+    print "%d files found - processing..." % (nofiles,)
+
+    run_timer = instrument.RunTimer(args.timings)
+    report = load_diagnostics(files) # (files not converted again keep their diagnostics)
+    if OUTCOME_INDEX:
+        outcome_index = outcomeindex.OutcomeIndex(get_outcome_index_filename())
+        outcome_index.prune(keep=files) # (before the build, so duplicates of removed files are converted)
+    else:
+        outcome_index = None
+
+    if args.bundle:
+        output_bundle = bundle.open_bundle(args.bundle, sharded(os.path.join(PATH["op"], "cca.%s" % (args.bundle, ))))
+    else:
+        output_bundle = None
+
+    try:
+        (results, skip_types, duplicates) = build(files, topic_lookup, manifest, run_timer, args.workers, args.rebuild or bool(output_bundle), args.pipeline, output_bundle, report, outcome_index)
+    except:
+        if output_bundle:
+            output_bundle.abort()
+        raise
+
+    manifest.save(keep=files)
+    run_timer.report(*get_timings_filenames())
+    write_diagnostics(report)
+
+    not_done = [files[c] for c in range(nofiles) if results[c] is None]
+    details = run_details(files, results, skip_types, duplicates, report, run_timer)
+    if output_bundle:
+        output_bundle.close(not_done, details)
+        print "(documents saved in %s)" % (output_bundle.filename, )
+    else:
+        write_not_done(not_done)
+    write_run_report(details, not_done)
     print ""
+    print summary_line(results, skip_types)
+    print "diagnostics: %s (see %s)" % (report.summary_text(), get_diagnostics_filenames()[1])
     print "done!"
-    
+
+    if args.watch:
+        watch(topic_lookup, manifest, run_timer, report, args.workers, args.pipeline, outcome_index)
+
 
 
 if __name__ == "__main__":
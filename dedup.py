@@ -0,0 +1,95 @@
+#
+# duplicate reviews
+#
+#   finds input files which are the same review (identical contents, or the
+#   same CD number and version exported under another name), so each review
+#   is converted once and its output linked or copied to the other names
+#
+
+import os
+import shutil
+
+
+class _Groups():
+    " union-find over item indices "
+
+    def __init__(self, n):
+        self.parent = range(n)
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i, j):
+        (i, j) = (self.find(i), self.find(j))
+        if i != j:
+            self.parent[max(i, j)] = min(i, j)
+
+
+def find_duplicates(items, keys, rank = None):
+    """
+    groups items which share a value for any of the key functions
+    keys = list of (reason, function); each function takes an item and returns
+    a hashable key, or None if it has none (never matched)
+    rank = optional function; the item with the highest rank in each group is
+    its primary (default: the first)
+
+    returns a list of (primary index, list of duplicate indices, sorted list of
+    reasons) for each group of more than one item, in order of primary
+    """
+    groups = _Groups(len(items))
+    joined = [] # (index, reason) for each item joined to an earlier one
+
+    for (reason, key) in keys:
+        first = {} # key: index of first item with it
+        for (i, item) in enumerate(items):
+            k = key(item)
+            if k is None:
+                continue
+            if k in first:
+                groups.union(first[k], i)
+                joined.append((i, reason))
+            else:
+                first[k] = i
+
+    members = {}
+    for i in range(len(items)):
+        members.setdefault(groups.find(i), []).append(i)
+    reasons = {}
+    for (i, reason) in joined:
+        reasons.setdefault(groups.find(i), set()).add(reason)
+
+    found = []
+    for (root, indices) in members.items():
+        if len(indices) < 2:
+            continue
+        if rank is None:
+            primary = indices[0]
+        else:
+            primary = max(indices, key=lambda i: (rank(items[i]), -i))
+        found.append((primary, [i for i in indices if i != primary], sorted(reasons.get(root, ()))))
+    return sorted(found)
+
+
+def link_or_copy(source, target, link = True):
+    """
+    makes target a hard link to source (or a copy, if link is False or the
+    filesystem cannot link); replaces any existing target
+    """
+    if os.path.exists(target) and os.path.samefile(source, target):
+        return # (already linked; renaming a link over the same file does nothing)
+    tmp = target + ".part"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    linked = False
+    if link:
+        try:
+            os.link(source, tmp)
+            linked = True
+        except (OSError, AttributeError):
+            pass # (AttributeError = no os.link on Windows with python 2)
+    if not linked:
+        shutil.copyfile(source, tmp)
+    os.rename(tmp, target)
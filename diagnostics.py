@@ -0,0 +1,139 @@
+#
+# diagnostics
+#
+#   problems found while converting a review (for the editors), collected
+#   per review with a code, severity and location, and gathered into a
+#   report for the whole batch
+#
+
+import collections
+import csv
+import json
+import os
+
+
+ERROR = "error"
+WARNING = "warning"
+NOTE = "note"
+SEVERITIES = (ERROR, WARNING, NOTE) # most severe first
+
+Diagnostic = collections.namedtuple("Diagnostic", "code severity message location")
+
+
+
+class Diagnostics():
+    """
+    The diagnostics of one review
+
+    add(code, message, severity, location) records one; location is the
+    analysis number (e.g. '1.2', or '1.2.1' for a subgroup), or None for the
+    review as a whole
+    at(location) returns a Located, which adds at that location
+
+    iterate for the Diagnostic tuples, in the order they were added
+
+    """
+
+    def __init__(self):
+
+        self.items = []
+
+    def add(self, code, message, severity = WARNING, location = None):
+        self.items.append(Diagnostic(code, severity, message, location))
+
+    def at(self, location):
+        return Located(self, location)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class Located():
+    " adds to a Diagnostics at a fixed location "
+
+    def __init__(self, diagnostics, location):
+
+        self.diagnostics = diagnostics
+        self.location = location
+
+    def add(self, code, message, severity = WARNING):
+        self.diagnostics.add(code, message, severity, self.location)
+
+
+
+class BatchReport():
+    """
+    The diagnostics of every review in a run
+
+    add(filename, diagnostics) records a review's diagnostics (replacing any
+    from an earlier conversion of the same file)
+    add_failure(filename, message) records a file which could not be converted
+    load(json_filename) adds the files of a saved report (e.g. one shard's, or
+    the last run's, for the files not converted again)
+    prune(keep) removes every file not in keep (a list of filenames)
+
+    write(json_filename, csv_filename) saves the report
+    json = counts by severity and by code, and the diagnostics of each file
+    csv = one row per diagnostic
+
+    """
+
+    def __init__(self):
+
+        self.files = {} # basename: list of Diagnostic
+
+    def add(self, filename, diagnostics):
+        self.files[os.path.basename(filename)] = list(diagnostics)
+
+    def add_failure(self, filename, message):
+        self.add(filename, [Diagnostic("not-done", ERROR, message, None)])
+
+    def load(self, json_filename):
+        with open(json_filename, 'rb') as f:
+            report = json.load(f)
+        for (name, items) in report["files"].items():
+            self.files[name] = [Diagnostic(d["code"], d["severity"], d["message"], d["location"]) for d in items]
+
+    def prune(self, keep):
+        keep = set(os.path.basename(f) for f in keep)
+        for name in [name for name in self.files if name not in keep]:
+            del self.files[name]
+
+    def counts(self):
+        " (Counter of severities, Counter of codes) over every file "
+        severities = collections.Counter()
+        codes = collections.Counter()
+        for items in self.files.values():
+            for d in items:
+                severities[d.severity] += 1
+                codes[d.code] += 1
+        return (severities, codes)
+
+    def summary_text(self):
+        " e.g. '1 error, 3 warnings, 2 notes' "
+        severities = self.counts()[0]
+        return ", ".join("%d %s%s" % (severities[s], s, (severities[s] != 1) * "s") for s in SEVERITIES)
+
+    def write(self, json_filename, csv_filename):
+        (severities, codes) = self.counts()
+        report = {"severities": dict(severities),
+                  "codes": dict(codes),
+                  "files": dict((name, [d._asdict() for d in items]) for (name, items) in self.files.items() if items)}
+        with open(json_filename, 'wb') as f:
+            json.dump(report, f, indent=1, sort_keys=True)
+
+        with open(csv_filename, 'wb') as f:
+            w = csv.writer(f)
+            w.writerow(["file", "location", "severity", "code", "message"])
+            for name in sorted(self.files):
+                for d in self.files[name]:
+                    w.writerow([name, d.location or "", d.severity, d.code, _encode(d.message)])
+
+
+def _encode(text):
+    if isinstance(text, unicode):
+        return text.encode('utf-8')
+    return text
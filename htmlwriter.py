@@ -0,0 +1,153 @@
+#
+# html writer
+#
+#   streams the fragments of an output document straight to a buffered file
+#   (instead of collecting them in a list and joining at the end)
+#
+
+import os
+import shutil
+import tempfile
+from cStringIO import StringIO
+
+
+WRITE_BUFFER_SIZE = 1 << 18 # bytes buffered before each write to disk
+SPOOL_SIZE = 1 << 22 # bytes held in memory after an unfilled slot, before spooling to disk
+
+
+
+def _encode(fragment):
+    if isinstance(fragment, unicode):
+        return fragment.encode('utf-8')
+    return fragment
+
+
+
+class HtmlWriter():
+    """
+    Writes an output document fragment by fragment, utf-8 encoded
+
+    fragments are separated by newlines, so the file is the same as
+    '\\n'.join() of the fragments
+
+    slot() reserves the place for a block which is only known later (the
+    compiler comments); until fill() is called, the fragments after it are
+    spooled (in memory, then in a temporary file if large), then copied
+    in after the block
+
+    the document is written under a temporary name and only renamed to
+    filename by close(), so a review which fails part way leaves no output;
+    abort() discards it
+
+    """
+
+    def __init__(self, filename):
+
+        self.filename = filename
+        self.tmp_filename = filename + ".part"
+        self.f = open(self.tmp_filename, 'wb', WRITE_BUFFER_SIZE)
+        self.out = self.f
+        self.spool = None
+        self.first = True
+        self.bytes_written = 0
+
+    def write(self, fragment):
+        if self.first:
+            self.first = False
+        else:
+            self.out.write("\n")
+            self.bytes_written += 1
+        data = _encode(fragment)
+        self.out.write(data)
+        self.bytes_written += len(data)
+
+    def writelines(self, fragments):
+        for fragment in fragments:
+            self.write(fragment)
+
+    def slot(self):
+        " reserves the current position for the fragments passed to fill() "
+        if self.spool is not None:
+            raise ValueError("only one slot may be open at a time")
+        self.spool = tempfile.SpooledTemporaryFile(SPOOL_SIZE)
+        self.out = self.spool
+        self.slot_first = self.first
+        self.first = True
+
+    def fill(self, fragments):
+        " writes fragments (list of strings) into the open slot "
+        spooled_first = self.first
+
+        self.out = self.f
+        self.first = self.slot_first
+        self.writelines(fragments)
+
+        # the spooled fragments follow; their leading separator was not written
+        if not spooled_first:
+            if not self.first:
+                self.f.write("\n")
+                self.bytes_written += 1
+            self.first = False
+        self.spool.seek(0)
+        shutil.copyfileobj(self.spool, self.f)
+        self.spool.close()
+        self.spool = None
+
+    def close(self):
+        if self.spool is not None:
+            self.fill([])
+        self.f.close()
+        os.rename(self.tmp_filename, self.filename)
+
+    def abort(self):
+        if self.spool is not None:
+            self.spool.close()
+            self.spool = None
+        self.f.close()
+        if os.path.exists(self.tmp_filename):
+            os.remove(self.tmp_filename)
+
+
+
+class HtmlBuffer(HtmlWriter):
+    """
+    As HtmlWriter, but the document is assembled in memory; close() keeps it
+    (as self.data) and save() writes it to filename, so the rendering and the
+    write to disk can happen in different threads
+
+    """
+
+    def __init__(self, filename):
+
+        self.filename = filename
+        self.tmp_filename = filename + ".part"
+        self.f = StringIO()
+        self.out = self.f
+        self.spool = None
+        self.first = True
+        self.bytes_written = 0
+        self.data = None
+
+    def close(self):
+        if self.spool is not None:
+            self.fill([])
+        self.data = self.f.getvalue()
+        self.f.close()
+
+    def abort(self):
+        if self.spool is not None:
+            self.spool.close()
+            self.spool = None
+        self.f.close()
+
+    def save(self):
+        " writes the closed document to filename (via a temporary name, as HtmlWriter) "
+        try:
+            with open(self.tmp_filename, 'wb') as f:
+                f.write(self.data)
+            os.rename(self.tmp_filename, self.filename)
+        except:
+            if os.path.exists(self.tmp_filename):
+                os.remove(self.tmp_filename)
+            raise
+        self.data = None
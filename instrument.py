@@ -0,0 +1,175 @@
+#
+# instrumentation
+#
+#   per-stage timing of each file in a run, and a machine readable report
+#
+
+import csv
+import json
+import os
+from timeit import default_timer
+
+
+
+class FileTimer(object):
+    """
+    lap timer for the stages of one file
+
+    call lap(stage) at the end of each stage; the time since the previous lap
+    (or since the timer was made) is added to that stage, so a stage may be
+    lapped more than once (e.g. html assembly, interleaved with other stages)
+
+    data = what the stage read, produced or wrote, if known; a number of bytes,
+    or a string / list of strings (only measured when instrumentation is on)
+
+    count(name, n) adds to a named counter (e.g. bytes the parser skipped)
+
+    """
+    __slots__ = ("filename", "input_bytes", "stages", "counts", "last")
+    enabled = True
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.input_bytes = os.path.getsize(filename)
+        self.stages = {} # stage: [seconds, bytes]
+        self.counts = {}
+        self.last = default_timer()
+
+    def lap(self, stage, data = 0):
+        now = default_timer()
+        nbytes = measure(data)
+        if stage in self.stages:
+            self.stages[stage][0] += now - self.last
+            self.stages[stage][1] += nbytes
+        else:
+            self.stages[stage] = [now - self.last, nbytes]
+        self.last = now
+
+    def count(self, name, n):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def restart(self):
+        " the next stage is timed from now (leaves out time spent waiting, e.g. in a pipeline queue) "
+        self.last = default_timer()
+
+    def total(self):
+        return sum(s[0] for s in self.stages.values())
+
+    def __getstate__(self):
+        # sent back from worker processes
+        return (self.filename, self.input_bytes, self.stages, self.counts)
+
+    def __setstate__(self, state):
+        (self.filename, self.input_bytes, self.stages, self.counts) = state
+        self.last = None
+
+
+class NullFileTimer(object):
+    " stands in for FileTimer when instrumentation is off "
+    __slots__ = ()
+    enabled = False
+    input_bytes = 0
+
+    def lap(self, stage, data = 0):
+        pass
+
+    def count(self, name, n):
+        pass
+
+    def restart(self):
+        pass
+
+
+NULL_FILE_TIMER = NullFileTimer()
+
+
+def measure(data):
+    " size of a stage's data for FileTimer.lap: a number, or the length of a string or list of strings "
+    if isinstance(data, (int, long)):
+        return data
+    if isinstance(data, basestring):
+        return len(data)
+    return sum(len(d) for d in data)
+
+
+
+class RunTimer():
+    """
+    collects the FileTimers for a run and writes the report
+
+    initiate with enabled = False for a no-op timer (file() then returns
+    the shared NULL_FILE_TIMER, so the per-file cost is a few method calls)
+
+    """
+
+    def __init__(self, enabled = True):
+
+        self.enabled = enabled
+        self.files = []
+        self.start_time = default_timer()
+
+    def file(self, filename):
+        " new timer for filename; starts now "
+        if self.enabled:
+            return FileTimer(filename)
+        return NULL_FILE_TIMER
+
+    def add(self, file_timer):
+        " keeps a finished file's timings (which may have come from a worker process) "
+        if file_timer.enabled:
+            self.files.append(file_timer)
+
+    def stage_names(self):
+        names = []
+        for ft in self.files:
+            for stage in ft.stages:
+                if stage not in names:
+                    names.append(stage)
+        return sorted(names)
+
+    def count_names(self):
+        return sorted(set(name for ft in self.files for name in ft.counts))
+
+    def totals(self):
+        " dict of stage: {seconds, bytes} over all files "
+        totals = {}
+        for ft in self.files:
+            for (stage, (seconds, nbytes)) in ft.stages.items():
+                t = totals.setdefault(stage, {"seconds": 0.0, "bytes": 0})
+                t["seconds"] += seconds
+                t["bytes"] += nbytes
+        return totals
+
+    def report(self, json_filename, csv_filename, slowest = 20):
+        """
+        writes the run report
+        json = per-stage totals, counter totals, and the slowest files with their stage breakdown
+        csv = one row per file (seconds and bytes for every stage, then the counters)
+        """
+        if not self.enabled:
+            return
+
+        files = sorted(self.files, key=lambda ft: ft.filename)
+        by_time = sorted(files, key=lambda ft: -ft.total())
+
+        summary = {"wall_seconds": default_timer() - self.start_time,
+                   "files": len(files),
+                   "input_bytes": sum(ft.input_bytes for ft in files),
+                   "stage_totals": self.totals(),
+                   "counts": dict((name, sum(ft.counts.get(name, 0) for ft in files)) for name in self.count_names()),
+                   "slowest_files": [{"file": ft.filename, "input_bytes": ft.input_bytes, "seconds": ft.total(),
+                                      "stages": dict((stage, {"seconds": s[0], "bytes": s[1]}) for (stage, s) in ft.stages.items())}
+                                     for ft in by_time[:slowest]]}
+
+        with open(json_filename, 'wb') as f:
+            json.dump(summary, f, indent=1, sort_keys=True)
+
+        stages = self.stage_names()
+        counts = self.count_names()
+        with open(csv_filename, 'wb') as f:
+            w = csv.writer(f)
+            w.writerow(["file", "input_bytes", "seconds"] + ["%s_seconds" % (s, ) for s in stages] + ["%s_bytes" % (s, ) for s in stages] + counts)
+            for ft in files:
+                w.writerow([ft.filename, ft.input_bytes, "%.6f" % ft.total()] +
+                           ["%.6f" % ft.stages.get(s, (0, 0))[0] for s in stages] + [ft.stages.get(s, (0, 0))[1] for s in stages] +
+                           [ft.counts.get(name, 0) for name in counts])
@@ -0,0 +1,254 @@
+#
+# outcome index
+#
+#   every outcome, subgroup and row of study data the PICOtron reads, kept in
+#   an SQLite file (output/outcomes.sqlite) for queries across the whole
+#   corpus without parsing the RevMan files again, e.g.
+#
+#   python outcomeindex.py "SELECT cdno, analysis, outcome, point FROM analyses
+#                           WHERE units = 'RR' AND ci_high < 1 AND intervention LIKE '%aspirin%'"
+#
+#   tables (one row per ...)
+#   files = input file; sha1 and CD number (NULL if skipped), or the file it is a duplicate of
+#   analyses = outcome or subgroup; names, groups compared, units, estimate and CI, studies, participants
+#   studies = row of study data, in the analysis it is listed under (analysis_id = analyses.id)
+#
+#   each review's rows are replaced in one transaction when it is converted,
+#   so the index is kept up to date as files change
+#
+
+import argparse
+import csv
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+
+INDEX_VERSION = "1" # change if the table layout changes; forces a rebuild (and every review to be converted again)
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE files (file TEXT PRIMARY KEY, sha1 TEXT NOT NULL, cdno TEXT, title TEXT, search_date TEXT,
+                    duplicate_of TEXT);
+CREATE TABLE analyses (id INTEGER PRIMARY KEY, file TEXT NOT NULL, cdno TEXT NOT NULL, analysis TEXT,
+                       comparison_no TEXT, comparison TEXT, outcome_no TEXT, outcome TEXT,
+                       subgroup_no TEXT, subgroup TEXT, data_type TEXT, intervention TEXT, control TEXT,
+                       units TEXT, point REAL, ci_low REAL, ci_high REAL, studies INTEGER, participants INTEGER,
+                       search_date TEXT);
+CREATE TABLE studies (analysis_id INTEGER NOT NULL, file TEXT NOT NULL, cdno TEXT NOT NULL, study_id TEXT,
+                      data_type TEXT, estimable TEXT, effect_size REAL, ci_low REAL, ci_high REAL,
+                      events_1 REAL, events_2 REAL, total_1 REAL, total_2 REAL,
+                      mean_1 REAL, mean_2 REAL, sd_1 REAL, sd_2 REAL, se REAL);
+CREATE INDEX files_duplicate_of ON files (duplicate_of);
+CREATE INDEX analyses_file ON analyses (file);
+CREATE INDEX analyses_cdno ON analyses (cdno);
+CREATE INDEX analyses_units ON analyses (units, point);
+CREATE INDEX analyses_intervention ON analyses (intervention);
+CREATE INDEX studies_analysis ON studies (analysis_id);
+CREATE INDEX studies_file ON studies (file);
+CREATE INDEX studies_study_id ON studies (study_id);
+"""
+
+ANALYSIS_COLUMNS = ("id", "file", "cdno", "analysis", "comparison_no", "comparison", "outcome_no", "outcome",
+                    "subgroup_no", "subgroup", "data_type", "intervention", "control", "units",
+                    "point", "ci_low", "ci_high", "studies", "participants", "search_date")
+
+STUDY_COLUMNS = ("analysis_id", "file", "cdno", "study_id", "data_type", "estimable", "effect_size", "ci_low", "ci_high",
+                 "events_1", "events_2", "total_1", "total_2", "mean_1", "mean_2", "sd_1", "sd_2", "se")
+
+
+
+def _number(value, convert = float):
+    " value (a string or Decimal from the file) as a number, or None "
+    if value is None:
+        return None
+    try:
+        return convert(value)
+    except (ValueError, ArithmeticError):
+        return None
+
+
+def review_rows(review):
+    """
+    the rows of a review (a reviewmodel.Review) for the index, as a list of
+    (analysis values, list of study values) for each outcome and subgroup;
+    values are in column order (ANALYSIS_COLUMNS and STUDY_COLUMNS, without
+    the ids, file and CD number, which OutcomeIndex.update fills in)
+    """
+    rows = []
+    for comparison in review.comparisons:
+        for outcome in comparison.outcomes:
+            if outcome.skipped:
+                continue
+            for analysis in [outcome] + outcome.subgroups:
+                is_subgroup = analysis is not outcome
+                ocstr = "%s.%s" % (comparison.no, outcome.no)
+                if is_subgroup:
+                    ocstr += ".%s" % (analysis.no, )
+                values = (ocstr, comparison.no, comparison.title, outcome.no, outcome.name,
+                          analysis.no if is_subgroup else None, analysis.name if is_subgroup else None,
+                          analysis.kind, outcome.intname, outcome.cntname, outcome.units,
+                          _number(analysis.point), _number(analysis.ci95low), _number(analysis.ci95up),
+                          _number(analysis.studies, int), analysis.participants, review.searchdate)
+                study_values = [(s.study_id, s.kind, s.estimable, _number(s.effect_size), _number(s.ci_start), _number(s.ci_end),
+                                 _number(s.events_1), _number(s.events_2), _number(s.total_1), _number(s.total_2),
+                                 _number(s.mean_1), _number(s.mean_2), _number(s.sd_1), _number(s.sd_2), _number(s.se))
+                                for s in analysis.study_data]
+                rows.append((values, study_values))
+    return rows
+
+
+
+class OutcomeIndex():
+    """
+    The outcome index in an SQLite file (created, or rebuilt empty if made by
+    another version, when opened)
+
+    files() returns a dict of file name: sha1 for every file indexed
+    update(file, sha1, cdno, title, search_date, rows) replaces a file's rows (rows from review_rows)
+    add_duplicate(file, sha1, other) records file as a duplicate of other (which holds the rows)
+    forget(file) and prune(keep) remove files
+    merge(filename) copies in every file of another index (e.g. one shard's)
+    query(sql, params) returns (column names, rows)
+
+    file = the input file's base name; each process (and thread) opens its own connection
+
+    """
+
+    def __init__(self, filename):
+
+        self.filename = filename
+        self.local = threading.local() # conn, pid
+        conn = self._connect()
+        try:
+            version = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        except sqlite3.DatabaseError:
+            version = None
+        if version is None or version[0] != INDEX_VERSION:
+            self.create()
+
+    def _connect(self):
+        local = self.local
+        if getattr(local, "conn", None) is None or local.pid != os.getpid():
+            local.conn = sqlite3.connect(self.filename)
+            local.conn.execute("PRAGMA journal_mode = WAL") # (queries can run during a conversion run)
+            local.conn.execute("PRAGMA synchronous = NORMAL")
+            local.pid = os.getpid()
+        return local.conn
+
+    def create(self):
+        " empties the index "
+        conn = self._connect()
+        with conn:
+            for (name, ) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall():
+                conn.execute("DROP TABLE %s" % (name, ))
+            for statement in SCHEMA.split(";"):
+                if statement.strip():
+                    conn.execute(statement)
+            conn.execute("INSERT INTO meta VALUES ('version', ?)", (INDEX_VERSION, ))
+
+    def files(self):
+        return dict(self._connect().execute("SELECT file, sha1 FROM files"))
+
+    def _delete(self, conn, name):
+        conn.execute("DELETE FROM studies WHERE file = ?", (name, ))
+        conn.execute("DELETE FROM analyses WHERE file = ?", (name, ))
+        conn.execute("DELETE FROM files WHERE file = ?", (name, ))
+        # duplicates are recorded again if they still are (otherwise they are converted next run)
+        conn.execute("DELETE FROM files WHERE duplicate_of = ?", (name, ))
+
+    def update(self, filename, sha1, cdno, title = None, search_date = None, rows = ()):
+        " replaces the rows of filename (cdno None = skipped, not an intervention review) "
+        name = os.path.basename(filename)
+        conn = self._connect()
+        with conn:
+            self._delete(conn, name)
+            conn.execute("INSERT INTO files VALUES (?, ?, ?, ?, ?, NULL)", (name, sha1, cdno, title, search_date))
+            if not rows:
+                return
+            first_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM analyses").fetchone()[0]
+            conn.executemany("INSERT INTO analyses VALUES (%s)" % (", ".join("?" * len(ANALYSIS_COLUMNS)), ),
+                             ((first_id + i, name, cdno) + values for (i, (values, study_values)) in enumerate(rows)))
+            conn.executemany("INSERT INTO studies VALUES (%s)" % (", ".join("?" * len(STUDY_COLUMNS)), ),
+                             ((first_id + i, name, cdno) + s for (i, (values, study_values)) in enumerate(rows) for s in study_values))
+
+    def add_duplicate(self, filename, sha1, other):
+        name = os.path.basename(filename)
+        conn = self._connect()
+        with conn:
+            self._delete(conn, name)
+            conn.execute("INSERT INTO files SELECT ?, ?, cdno, title, search_date, ? FROM files WHERE file = ?",
+                         (name, sha1, os.path.basename(other), os.path.basename(other)))
+
+    def forget(self, filename):
+        conn = self._connect()
+        with conn:
+            self._delete(conn, os.path.basename(filename))
+
+    def prune(self, keep):
+        " removes every file not in keep (a list of filenames) "
+        keep = set(os.path.basename(f) for f in keep)
+        conn = self._connect()
+        gone = [name for (name, ) in conn.execute("SELECT file FROM files").fetchall() if name not in keep]
+        with conn:
+            for name in gone:
+                self._delete(conn, name)
+        return gone
+
+    def merge(self, filename):
+        " copies every file in the index filename into this one, replacing any of the same name "
+        conn = self._connect()
+        conn.execute("ATTACH DATABASE ? AS other", (filename, ))
+        try:
+            version = conn.execute("SELECT value FROM other.meta WHERE key = 'version'").fetchone()
+            if version is None or version[0] != INDEX_VERSION:
+                raise ValueError("%s is not an outcome index of version %s" % (filename, INDEX_VERSION))
+            with conn:
+                for (name, ) in conn.execute("SELECT file FROM other.files").fetchall():
+                    self._delete(conn, name)
+                offset = conn.execute("SELECT COALESCE(MAX(id), 0) FROM analyses").fetchone()[0]
+                conn.execute("INSERT INTO files SELECT * FROM other.files")
+                conn.execute("INSERT INTO analyses SELECT id + ?, %s FROM other.analyses" % (", ".join(ANALYSIS_COLUMNS[1:]), ), (offset, ))
+                conn.execute("INSERT INTO studies SELECT analysis_id + ?, %s FROM other.studies" % (", ".join(STUDY_COLUMNS[1:]), ), (offset, ))
+        finally:
+            conn.execute("DETACH DATABASE other")
+
+    def query(self, sql, params = ()):
+        cursor = self._connect().execute(sql, params)
+        return ([d[0] for d in cursor.description or ()], cursor.fetchall())
+
+
+
+def _encode(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="runs an SQL query on the outcome index, printing csv (see the top of outcomeindex.py)")
+    parser.add_argument("sql", help="the query (tables: files, analyses, studies)")
+    parser.add_argument("params", nargs="*", help="values for ? placeholders in the query")
+    parser.add_argument("--index", default=os.path.join("output", "outcomes.sqlite"), help="index file (default output/outcomes.sqlite)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.index):
+        parser.error("no index at %s (run cca.py first)" % (args.index, ))
+
+    start = time.time()
+    (columns, rows) = OutcomeIndex(args.index).query(args.sql, args.params)
+    elapsed = time.time() - start
+
+    w = csv.writer(sys.stdout)
+    if columns:
+        w.writerow(columns)
+    for row in rows:
+        w.writerow([_encode(v) for v in row])
+    sys.stderr.write("(%d rows in %.1f ms)\n" % (len(rows), elapsed * 1000))
+
+
+
+if __name__ == '__main__':
+    main()
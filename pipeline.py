@@ -0,0 +1,126 @@
+#
+# pipeline
+#
+#   overlaps reading input files, processing them, and writing the results,
+#   with bounded queues in between (so memory use stays level however slow
+#   the storage is)
+#
+#   reads and writes run in their own threads; the processing runs in one
+#   thread of its own while they wait on the disk or network
+#
+
+import Queue
+import threading
+import traceback
+
+
+READERS = 2 # threads reading input files
+WRITERS = 1 # threads writing output files
+QUEUE_SIZE = 4 # files held between stages (read and not yet processed, or processed and not yet written)
+
+
+
+class Pipeline():
+    """
+    Runs items through three stages: read, process and write
+
+    read(item) returns the data for item (e.g. the contents of a file)
+    process(item, data) returns (value, output); output is passed to write,
+    unless it is None
+    write(output) writes it
+
+    call imap with the list of items; yields (index, ok, value) as items
+    complete (in completion order), in the same form as workerpool.WorkerPool;
+    value is process's value, or the error text if any stage raised
+
+    """
+
+    def __init__(self, read, process, write, readers = READERS, writers = WRITERS, queue_size = QUEUE_SIZE):
+
+        self.read = read
+        self.process = process
+        self.write = write
+        self.readers = max(1, readers)
+        self.writers = max(1, writers)
+        self.queue_size = max(1, queue_size)
+
+    def _start(self, target, *args):
+        t = threading.Thread(target=target, args=args)
+        t.daemon = True
+        t.start()
+        return t
+
+    def _reader(self, todo, loaded, stop):
+        while not stop.is_set():
+            try:
+                (i, item) = todo.get_nowait()
+            except Queue.Empty:
+                break
+            try:
+                loaded.put((i, item, True, self.read(item)))
+            except Exception:
+                loaded.put((i, item, False, traceback.format_exc()))
+
+    def _processor(self, count, loaded, to_write, results, stop):
+        for n in range(count):
+            if stop.is_set():
+                break
+            (i, item, ok, data) = loaded.get()
+            if not ok:
+                results.put((i, False, data))
+                continue
+            try:
+                (value, output) = self.process(item, data)
+            except Exception:
+                results.put((i, False, traceback.format_exc()))
+                continue
+            del data # (not held while waiting for a writer)
+            if output is None:
+                results.put((i, True, value))
+            else:
+                to_write.put((i, value, output))
+        for w in range(self.writers):
+            to_write.put(None)
+
+    def _writer(self, to_write, results):
+        while True:
+            job = to_write.get()
+            if job is None:
+                break
+            (i, value, output) = job
+            try:
+                self.write(output)
+            except Exception:
+                results.put((i, False, traceback.format_exc()))
+            else:
+                results.put((i, True, value))
+
+    def imap(self, items):
+
+        items = list(items)
+        todo = Queue.Queue()
+        for i, item in enumerate(items):
+            todo.put((i, item))
+
+        loaded = Queue.Queue(self.queue_size)
+        to_write = Queue.Queue(self.queue_size)
+        results = Queue.Queue()
+        stop = threading.Event()
+
+        for r in range(min(self.readers, len(items))):
+            self._start(self._reader, todo, loaded, stop)
+        self._start(self._processor, len(items), loaded, to_write, results, stop)
+        for w in range(self.writers):
+            self._start(self._writer, to_write, results)
+
+        try:
+            for n in range(len(items)):
+                while True:
+                    try:
+                        # (with a timeout, so ctrl-c is not blocked)
+                        yield results.get(timeout=1.0)
+                        break
+                    except Queue.Empty:
+                        pass
+        finally:
+            stop.set()
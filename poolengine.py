@@ -0,0 +1,284 @@
+#
+# pooling engine
+#
+#   batch (numpy) meta-analysis of the study data (DICH_DATA and CONT_DATA)
+#   of every outcome and subgroup in a review, by the method the review
+#   names (Mantel-Haenszel, Peto or inverse variance; fixed or random effects)
+#
+#   gives a pooled estimate where the review has none (ESTIMABLE="NO"), and
+#   a check of those it does report
+#
+#   methods as RevMan 5 (Deeks & Higgins, "Statistical algorithms in Review
+#   Manager 5"): Mantel-Haenszel without continuity correction, studies with
+#   no events (or only events) in both groups left out of risk and odds
+#   ratios, 0.5 added to each cell of studies with a zero cell for the study
+#   estimates, DerSimonian-Laird random effects (heterogeneity about the
+#   Mantel-Haenszel estimate, for that method), Hedges' g for the SMD; the
+#   Peto method is fixed effect only
+#
+
+import collections
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+Z_95 = 1.959963984540054
+
+# a reported estimate agrees with the recomputed one if each of the point and CI ends is the
+# same to the precision written in the file (half a unit in its last decimal place), or within
+# RELATIVE_TOLERANCE of it where the file gives more places than floating point can match
+RELATIVE_TOLERANCE = 1e-6
+
+VALUE_NAMES = ("point estimate", "lower CI limit", "upper CI limit")
+
+# effect measure (units, as in the file or standardised by UNIT_DICT in cca.py) -> measure pooled
+MEASURES = {"RR": "RR", "RISK RATIO": "RR", "RELATIVE RISK": "RR",
+            "OR": "OR", "ODDS RATIO": "OR",
+            "RD": "RD", "RISK DIFFERENCE": "RD",
+            "PETO_OR": "PETO_OR", "PETO OR": "PETO_OR",
+            "MD": "MD", "MEAN DIFFERENCE": "MD",
+            "SMD": "SMD", "STANDARDIZED MEAN DIFFERENCE": "SMD", "STD. MEAN DIFFERENCE": "SMD"}
+
+RATIOS = ("RR", "OR", "PETO_OR")
+
+METHOD_NAMES = {"MH": "Mantel-Haenszel", "IV": "inverse variance", "PETO": "Peto"}
+
+Pooled = collections.namedtuple("Pooled", "units point ci95low ci95up studies method random agrees mismatches")
+
+
+
+def available():
+    " True if numpy is installed "
+    return np is not None
+
+
+def method_text(pooled):
+    " e.g. 'Mantel-Haenszel, fixed effect' "
+    return "%s, %s effect%s" % (METHOD_NAMES[pooled.method], "random" if pooled.random else "fixed", "s" * pooled.random)
+
+
+def _half_unit(value):
+    " half a unit in the last decimal place of a reported value (a Decimal, as written in the file) "
+    if value is None:
+        return float("nan")
+    exponent = value.as_tuple().exponent
+    if not isinstance(exponent, int):
+        return float("nan")
+    return 0.5 * 10.0 ** exponent
+
+
+def _pool_code(kind, units, method):
+    " (pool code, method) for an analysis, or None if it cannot be recomputed "
+    measure = MEASURES.get((units or "").upper())
+    if kind in ("DICH_OUTCOME", "DICH_SUBGROUP"):
+        if measure == "PETO_OR" or method == "PETO":
+            return ("PETO", "PETO") if measure in ("OR", "PETO_OR") else None
+        if measure not in ("RR", "OR", "RD"):
+            return None
+        method = method or "MH"
+        if method not in ("MH", "IV"):
+            return None
+        return ("%s_%s" % (method, measure), method)
+    if kind in ("CONT_OUTCOME", "CONT_SUBGROUP"):
+        if measure not in ("MD", "SMD") or (method or "IV") != "IV":
+            return None
+        return ("IV_%s" % (measure, ), "IV")
+    return None
+
+
+
+class PoolTable():
+    """
+    Pooled estimates recomputed for every DICH_OUTCOME, CONT_OUTCOME and subgroup in a review
+
+    initiate with the review (reviewmodel.Review)
+
+    the study data of all the analyses are loaded into flat arrays (one row per
+    DICH_DATA or CONT_DATA, with the analysis it belongs to), and every analysis
+    is pooled in one go by each method, then each takes the result of its own
+
+    lookup returns a Pooled (units, point, ci95low, ci95up as floats, number of
+    studies pooled, method code, random (bool), agrees = None where the review
+    reports no estimate, otherwise whether it agrees with this one, mismatches =
+    the VALUE_NAMES of those reported values which disagree), or None if
+    the analysis could not be recomputed (other types of data or measure,
+    missing or impossible numbers)
+
+    """
+
+    def __init__(self, review):
+
+        self.table = {}
+
+        analyses = {"DICH": [], "CONT": []} # (reviewmodel.Analysis, units, pool code, method, random)
+        rows = {"DICH": [], "CONT": []} # (analysis number, study values...)
+        fields = {"DICH": ("events_1", "total_1", "events_2", "total_2"),
+                  "CONT": ("mean_1", "sd_1", "total_1", "mean_2", "sd_2", "total_2")}
+
+        for comparison in review.comparisons:
+            for outcome in comparison.outcomes:
+                if outcome.skipped:
+                    continue
+                code = _pool_code(outcome.kind, outcome.units, outcome.method)
+                if code is None:
+                    continue
+                data_type = outcome.kind[:4]
+                for analysis in [outcome] + outcome.subgroups:
+                    if analysis is outcome and outcome.usetotal == "SUB":
+                        continue # (no overall result)
+                    try:
+                        data = [tuple(float(getattr(d, name)) for name in fields[data_type])
+                                for d in analysis.all_study_data() if d.kind == data_type + "_DATA"]
+                    except (TypeError, ValueError):
+                        continue
+                    if not data:
+                        continue
+                    rows[data_type].extend((len(analyses[data_type]), ) + d for d in data)
+                    analyses[data_type].append((analysis, outcome.units, code[0], code[1], outcome.random == "YES" and code[1] != "PETO"))
+
+        if analyses["DICH"]:
+            self._store(analyses["DICH"], self._pool_dich(np.array(rows["DICH"], dtype=np.float64), len(analyses["DICH"])))
+        if analyses["CONT"]:
+            self._store(analyses["CONT"], self._pool_cont(np.array(rows["CONT"], dtype=np.float64), len(analyses["CONT"])))
+
+    def _pool_dich(self, rows, no_groups):
+        " dict of pool code: (fixed (estimate, variance, studies), random (estimate, variance, studies)) arrays by analysis "
+        group = rows[:, 0].astype(np.int64)
+        (a, n1, c, n2) = (rows[:, 1], rows[:, 2], rows[:, 3], rows[:, 4])
+        (b, d) = (n1 - a, n2 - c)
+        n = n1 + n2
+
+        valid = (a >= 0) & (c >= 0) & (b >= 0) & (d >= 0) & (n1 > 0) & (n2 > 0)
+        ratio_valid = valid & (a + c > 0) & (b + d > 0) # no events (or only events) in both groups: not estimable
+
+        def total(x, mask):
+            return np.bincount(group, weights=np.where(mask, x, 0.0), minlength=no_groups)
+
+        pools = {}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Mantel-Haenszel risk ratio (Greenland & Robins variance)
+            r = total(a * n2 / n, ratio_valid)
+            s = total(c * n1 / n, ratio_valid)
+            p = total((n1 * n2 * (a + c) - a * c * n) / (n * n), ratio_valid)
+            pools["MH_RR"] = (np.log(r / s), p / (r * s), total(1.0, ratio_valid))
+
+            # Mantel-Haenszel odds ratio (Robins, Breslow & Greenland variance)
+            (rr, ss) = (a * d / n, b * c / n)
+            (pp, qq) = ((a + d) / n, (b + c) / n)
+            r = total(rr, ratio_valid)
+            s = total(ss, ratio_valid)
+            variance = (total(pp * rr, ratio_valid) / (2 * r * r) + total(pp * ss + qq * rr, ratio_valid) / (2 * r * s)
+                        + total(qq * ss, ratio_valid) / (2 * s * s))
+            pools["MH_OR"] = (np.log(r / s), variance, total(1.0, ratio_valid))
+
+            # Mantel-Haenszel risk difference
+            w = total(n1 * n2 / n, valid)
+            pools["MH_RD"] = (total((a * n2 - c * n1) / n, valid) / w,
+                              total((a * b * n2 ** 3 + c * d * n1 ** 3) / (n1 * n2 * n * n), valid) / (w * w), total(1.0, valid))
+
+            # Peto odds ratio
+            peto_valid = ratio_valid & (n > 1)
+            v = total(n1 * n2 * (a + c) * (b + d) / (n * n * (n - 1)), peto_valid)
+            pools["PETO"] = (total(a - n1 * (a + c) / n, peto_valid) / v, 1 / v, total(1.0, peto_valid))
+
+            # study estimates and variances, both from the same cells (0.5 added to each cell
+            # of studies with a zero cell)
+            cc = np.where((a == 0) | (b == 0) | (c == 0) | (d == 0), 0.5, 0.0)
+            (ac, bc, cc_, dc) = (a + cc, b + cc, c + cc, d + cc)
+            (n1c, n2c) = (ac + bc, cc_ + dc)
+            estimates = {"RR": (np.log((ac / n1c) / (cc_ / n2c)), 1 / ac - 1 / n1c + 1 / cc_ - 1 / n2c, ratio_valid),
+                         "OR": (np.log((ac * dc) / (bc * cc_)), 1 / ac + 1 / bc + 1 / cc_ + 1 / dc, ratio_valid),
+                         "RD": (ac / n1c - cc_ / n2c, ac * bc / n1c ** 3 + cc_ * dc / n2c ** 3, valid)}
+
+        for (measure, (y, var, mask)) in estimates.items():
+            fixed = self._inverse_variance(group, y, var, mask, no_groups)
+            pools["IV_" + measure] = (fixed, self._random_effects(group, y, var, mask, fixed[0], no_groups))
+            # Mantel-Haenszel random effects: the study estimates, with the heterogeneity about the MH estimate
+            mh = pools["MH_" + measure]
+            pools["MH_" + measure] = (mh, self._random_effects(group, y, var, mask, mh[0], no_groups))
+        pools["PETO"] = (pools["PETO"], None) # (fixed effect only)
+        return pools
+
+    def _pool_cont(self, rows, no_groups):
+        " as _pool_dich, for continuous data "
+        group = rows[:, 0].astype(np.int64)
+        (m1, sd1, n1, m2, sd2, n2) = (rows[:, 1], rows[:, 2], rows[:, 3], rows[:, 4], rows[:, 5], rows[:, 6])
+        n = n1 + n2
+        valid = (n1 > 0) & (n2 > 0) & (sd1 > 0) & (sd2 > 0)
+
+        pools = {}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            estimates = {"MD": (m1 - m2, sd1 * sd1 / n1 + sd2 * sd2 / n2, valid)}
+
+            # Hedges' adjusted g
+            pooled_sd = np.sqrt(((n1 - 1) * sd1 * sd1 + (n2 - 1) * sd2 * sd2) / (n - 2))
+            g = (m1 - m2) / pooled_sd * (1 - 3 / (4 * n - 9))
+            estimates["SMD"] = (g, n / (n1 * n2) + g * g / (2 * (n - 3.94)), valid & (n > 3.94))
+
+        for (measure, (y, var, mask)) in estimates.items():
+            fixed = self._inverse_variance(group, y, var, mask, no_groups)
+            pools["IV_" + measure] = (fixed, self._random_effects(group, y, var, mask, fixed[0], no_groups))
+        return pools
+
+    def _inverse_variance(self, group, y, var, mask, no_groups):
+        " (estimate, variance, studies) arrays by analysis "
+        mask = mask & np.isfinite(y) & (var > 0) & np.isfinite(var)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            w = np.where(mask, 1 / var, 0.0)
+            sw = np.bincount(group, weights=w, minlength=no_groups)
+            return (np.bincount(group, weights=w * np.where(mask, y, 0.0), minlength=no_groups) / sw, 1 / sw,
+                    np.bincount(group, weights=mask.astype(np.float64), minlength=no_groups))
+
+    def _random_effects(self, group, y, var, mask, centre, no_groups):
+        " DerSimonian-Laird, with the heterogeneity about centre (the fixed effect estimates); (estimate, variance, studies) arrays by analysis "
+        mask = mask & np.isfinite(y) & (var > 0) & np.isfinite(var)
+        k = np.bincount(group, weights=mask.astype(np.float64), minlength=no_groups)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            w = np.where(mask, 1 / var, 0.0)
+            sw = np.bincount(group, weights=w, minlength=no_groups)
+            q = np.bincount(group, weights=w * np.where(mask, y - centre[group], 0.0) ** 2, minlength=no_groups)
+            scale = sw - np.bincount(group, weights=w * w, minlength=no_groups) / sw
+            tau2 = np.where(scale > 0, np.maximum(0.0, (q - (k - 1)) / scale), 0.0)
+            w = np.where(mask, 1 / (var + tau2[group]), 0.0)
+            sw = np.bincount(group, weights=w, minlength=no_groups)
+            return (np.bincount(group, weights=w * np.where(mask, y, 0.0), minlength=no_groups) / sw, 1 / sw, k)
+
+    def _store(self, analyses, pools):
+
+        no_groups = len(analyses)
+        estimate = np.empty(no_groups)
+        variance = np.empty(no_groups)
+        studies = np.empty(no_groups)
+        for (i, (analysis, units, code, method, random)) in enumerate(analyses):
+            (estimate[i], variance[i], studies[i]) = [values[i] for values in pools[code][random]]
+
+        is_ratio = np.array([MEASURES[units.upper()] in RATIOS for (analysis, units, code, method, random) in analyses])
+        with np.errstate(invalid='ignore'):
+            half_width = Z_95 * np.sqrt(variance)
+        results = np.column_stack([estimate, estimate - half_width, estimate + half_width])
+        results = np.where(is_ratio[:, np.newaxis], np.exp(results), results)
+        ok = np.all(np.isfinite(results), axis=1) & (studies > 0)
+
+        # the reported estimates, and the precision each is written to
+        values = [(a.point, a.ci95low, a.ci95up) for (a, units, code, method, random) in analyses]
+        reported = np.array([[float(v) if v is not None else np.nan for v in row] for row in values], dtype=np.float64)
+        precision = np.array([[_half_unit(v) for v in row] for row in values], dtype=np.float64)
+        margin = np.maximum(precision, RELATIVE_TOLERANCE * np.abs(reported))
+        with np.errstate(invalid='ignore'):
+            close = np.abs(results - reported) <= margin
+        has_reported = np.all(np.isfinite(reported), axis=1)
+
+        for i in np.nonzero(ok)[0]:
+            (analysis, units, code, method, random) = analyses[i]
+            if has_reported[i]:
+                mismatches = tuple(name for (name, same) in zip(VALUE_NAMES, close[i]) if not same)
+                agrees = not mismatches
+            else:
+                (mismatches, agrees) = ((), None)
+            self.table[analysis] = Pooled(units, results[i, 0], results[i, 1], results[i, 2], int(studies[i]), method, random, agrees, mismatches)
+
+    def lookup(self, analysis):
+        return self.table.get(analysis)
@@ -2,10 +2,17 @@
 # progress bar
 #
 
+import collections
+import multiprocessing
+import os
 import sys
 import time
 
 
+UPDATE_INTERVAL = 0.2 # minimum seconds between redraws of a ThroughputProgress
+RATE_WINDOW = 10.0 # seconds of recent progress the live rates (and time remaining) are worked out from
+
+
 
 class ProgressBar():
     """
@@ -48,16 +55,7 @@ class ProgressBar():
             else:
                 seconds_passed = time.time() - self.start_time
                 seconds_to_go = ((seconds_passed / percentage_progress) * (100-percentage_progress))
-                if seconds_to_go > 60:
-                    minutes_to_go_rounded = int((seconds_to_go / 60) + 1)
-                    time_text = "%d minute%s" % (minutes_to_go_rounded, (minutes_to_go_rounded > 1) * "s")
-                elif seconds_to_go <= 10:
-                    seconds_to_go_rounded = int(seconds_to_go + 1)
-                    time_text = "%d second%s" % (seconds_to_go_rounded, (seconds_to_go_rounded > 1) * "s")
-                else:
-                    seconds_to_go_rounded = int((seconds_to_go + 5) / 5) * 5
-                    time_text = "%d second%s" % (seconds_to_go_rounded, (seconds_to_go_rounded > 1) * "s")
-                sys.stdout.write(" - Around %s remaining     " % (time_text, ))
+                sys.stdout.write(" - Around %s remaining     " % (time_text(seconds_to_go), ))
 
 
         if percentage_progress == 100:
@@ -66,6 +64,140 @@ class ProgressBar():
 
 
 
+def time_text(seconds_to_go):
+    " rounded time remaining, as ProgressBar shows it "
+    if seconds_to_go > 60:
+        minutes_to_go_rounded = int((seconds_to_go / 60) + 1)
+        return "%d minute%s" % (minutes_to_go_rounded, (minutes_to_go_rounded > 1) * "s")
+    elif seconds_to_go <= 10:
+        seconds_to_go_rounded = int(seconds_to_go + 1)
+        return "%d second%s" % (seconds_to_go_rounded, (seconds_to_go_rounded > 1) * "s")
+    else:
+        seconds_to_go_rounded = int((seconds_to_go + 5) / 5) * 5
+        return "%d second%s" % (seconds_to_go_rounded, (seconds_to_go_rounded > 1) * "s")
+
+
+def throughput_text(files, total_bytes, seconds):
+    if seconds <= 0:
+        return "%d files, %.2f MB" % (files, total_bytes / 1e6)
+    return "%d files, %.2f MB in %.1fs - %.1f files/sec, %.2f MB/sec" % (files, total_bytes / 1e6, seconds, files / seconds, total_bytes / 1e6 / seconds)
+
+
+
+class ThroughputProgress():
+    """
+    Progress bar weighted by bytes, for files of very different sizes
+
+    initiate with the total number of files and their total size in bytes
+    call tap(nbytes) as each file finishes; shows the percentage of bytes done,
+    live files/sec and MB/sec (over the last RATE_WINDOW seconds), and the time
+    remaining at that rate
+    call finish() at the end to print the throughput of the whole run
+
+    the counters are in shared memory behind a lock, so tap() may be called from
+    threads, or from worker processes forked after the progress bar was made;
+    only the process which made it draws (when it taps, or calls update())
+
+    """
+
+    def __init__(self, number_to_reach, bytes_to_reach, stream = sys.stdout):
+
+        self.number_to_reach = number_to_reach
+        self.bytes_to_reach = bytes_to_reach
+        self.stream = stream
+        self.lock = multiprocessing.Lock()
+        self.counts = multiprocessing.RawArray('d', 2) # files, bytes
+        self.pid = os.getpid()
+        self.start_time = time.time()
+        self.last_draw = None
+        self.samples = collections.deque() # (time, files, bytes) of recent redraws
+        self.finished = False
+        self.update()
+
+    def tap(self, nbytes = 0):
+        with self.lock:
+            self.counts[0] += 1
+            self.counts[1] += nbytes
+        if os.getpid() == self.pid:
+            self.update()
+
+    def progress(self):
+        " (files done, bytes done) "
+        with self.lock:
+            return (int(self.counts[0]), self.counts[1])
+
+    def _rates(self, now, files, nbytes):
+        " (files/sec, bytes/sec) over the last RATE_WINDOW seconds "
+        self.samples.append((now, files, nbytes))
+        while len(self.samples) > 2 and now - self.samples[1][0] >= RATE_WINDOW:
+            self.samples.popleft()
+        (then, files_then, bytes_then) = self.samples[0]
+        if now - then <= 0:
+            return (0.0, 0.0)
+        return ((files - files_then) / (now - then), (nbytes - bytes_then) / (now - then))
+
+    def update(self, force = False):
+        (files, nbytes) = self.progress()
+        now = time.time()
+        done = files >= self.number_to_reach
+        if not (force or done or self.last_draw is None or now - self.last_draw >= UPDATE_INTERVAL) or self.finished:
+            return
+        self.last_draw = now
+
+        if self.bytes_to_reach > 0:
+            fraction = min(1.0, nbytes / float(self.bytes_to_reach))
+        else:
+            fraction = min(1.0, files / float(max(1, self.number_to_reach)))
+        percentage_progress = 100 if done else min(99, int(100 * fraction))
+        no_bars = percentage_progress / 5
+        line = "\r[%s%s] %d%% - %d/%d files" % ("=" * no_bars, " " * (20 - no_bars), percentage_progress, files, self.number_to_reach)
+
+        (files_rate, bytes_rate) = self._rates(now, files, nbytes)
+        if done:
+            line += " - done!"
+        elif files == 0 or bytes_rate <= 0:
+            line += " - calculating time"
+        else:
+            seconds_to_go = (self.bytes_to_reach - nbytes) / bytes_rate
+            line += ", %.1f files/sec, %.2f MB/sec - around %s remaining" % (files_rate, bytes_rate / 1e6, time_text(seconds_to_go))
+        self.stream.write(line.ljust(getattr(self, "last_length", 0)))
+        self.last_length = len(line)
+
+        if done:
+            self.stream.write("\n")
+            self.finished = True
+        self.stream.flush()
+
+    def finish(self):
+        " completes the bar (if files were left out), and prints the throughput of the run "
+        if not self.finished:
+            self.update(force = True)
+        if not self.finished:
+            self.stream.write("\n")
+            self.finished = True
+        (files, nbytes) = self.progress()
+        self.stream.write(throughput_text(files, nbytes, time.time() - self.start_time) + "\n")
+        self.stream.flush()
+
+
+
+class NullProgress():
+    " takes the place of a ThroughputProgress where nothing should be shown (e.g. in tests) "
+
+    def __init__(self, number_to_reach, bytes_to_reach, stream = None):
+        pass
+
+    def tap(self, nbytes = 0):
+        pass
+
+    def update(self, force = False):
+        pass
+
+    def finish(self):
+        pass
+
+
+
 def example():
 
     p = ProgressBar(10000, timer=True)
@@ -75,8 +207,34 @@ def example():
 
 
 
+def throughput_example():
+
+    import random
+    import threading
+
+    sizes = [random.choice([50e3, 200e3, 1e6, 20e6]) for i in range(200)]
+    p = ThroughputProgress(len(sizes), sum(sizes))
+
+    def work(mine):
+        for size in mine:
+            time.sleep(size / 50e6)
+            p.tap(size)
+
+    threads = [threading.Thread(target=work, args=(sizes[t::4], )) for t in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    p.finish()
+
+
+
 def main():
-    example()
+    " runs the ProgressBar example (python progressbar.py), or with --throughput the ThroughputProgress one "
+    if "--throughput" in sys.argv[1:]:
+        throughput_example()
+    else:
+        example()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
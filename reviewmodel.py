@@ -0,0 +1,107 @@
+#
+# review model
+#
+#   compact objects holding what the PICOtron reads from a review
+#   Review -> Comparison -> Outcome -> Subgroup -> StudyData
+#
+#   filled in once per file (rm_review in cca.py), after which the parsed
+#   xml is no longer needed; rendering reads from these objects only
+#
+#   all classes use __slots__ (no per-object dict) and pickle with protocol 2,
+#   so parsed reviews can be cached and reused
+#
+
+
+class Model(object):
+    " common base: keyword constructor, every slot defaults to None "
+    __slots__ = ()
+
+    def __init__(self, **kwargs):
+        for cls in type(self).__mro__:
+            for name in getattr(cls, "__slots__", ()):
+                setattr(self, name, kwargs.pop(name, None))
+        if kwargs:
+            raise TypeError("unexpected fields: %s" % (", ".join(sorted(kwargs)), ))
+
+    def __getstate__(self):
+        return dict((name, getattr(self, name)) for cls in type(self).__mro__ for name in getattr(cls, "__slots__", ()))
+
+    def __setstate__(self, state):
+        for (name, value) in state.items():
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return "<%s %s>" % (type(self).__name__, getattr(self, "no", ""))
+
+
+
+class StudyData(Model):
+    """
+    one row of study data (DICH_DATA, CONT_DATA, IV_DATA or IPD_DATA)
+    values are the attribute strings from the file (None if absent), converted where used
+    """
+    __slots__ = ("kind", "study_id", "estimable", "effect_size", "ci_start", "ci_end",
+                 "events_1", "events_2", "total_1", "total_2", "mean_1", "mean_2", "sd_1", "sd_2", "se")
+
+
+class Analysis(Model):
+    """
+    the results of one forest plot (an outcome overall, or one of its subgroups), as found by ocparse
+
+    kind = element name (DICH_OUTCOME, CONT_SUBGROUP etc.)
+    octype = element name, or None where there is no meta-analysis
+    point, ci95low, ci95up = Decimal (None where there is no meta-analysis)
+    studies, usetotal, subgroups_present = attribute strings
+    method, random = the METHOD and RANDOM attribute strings (None if absent; subgroups use their outcome's)
+    study_text = individual study results, where there is no meta-analysis
+    study_data = list of StudyData (the rows directly inside this element)
+    """
+    __slots__ = ("kind", "no", "name", "octype", "units", "point", "ci95low", "ci95up", "favours1", "favours2",
+                 "studies", "participants", "usetotal", "subgroups_present", "study_text", "study_data", "method", "random")
+
+    def all_study_data(self):
+        " study rows in this analysis and its subgroups "
+        return self.study_data
+
+
+class Subgroup(Analysis):
+    " a subgroup analysis; reported with its outcome's units, names and favours labels "
+    __slots__ = ()
+
+
+class Outcome(Analysis):
+    """
+    an outcome; as Analysis, plus the names of the groups compared and its subgroups
+
+    skipped = None, or the field ("intervention") missing from the file, in which
+    case the outcome is reported as skipped and nothing else is filled in
+    """
+    __slots__ = ("intname", "cntname", "show_participants", "subgroups", "skipped")
+
+    def all_study_data(self):
+        rows = list(self.study_data)
+        for sg in self.subgroups:
+            rows.extend(sg.study_data)
+        return rows
+
+
+class Comparison(Model):
+    __slots__ = ("no", "title", "outcomes")
+
+
+class Review(Model):
+    """
+    review level details, and the comparisons
+    outcomes_text = html of the outcome criteria (CRIT_OUTCOMES)
+    """
+    __slots__ = ("cdno", "title", "searchdate", "outcomes_text", "comparisons")
+
+    def analyses(self):
+        " every outcome and subgroup (that was not skipped), in document order "
+        for comparison in self.comparisons:
+            for outcome in comparison.outcomes:
+                if outcome.skipped:
+                    continue
+                yield outcome
+                for sg in outcome.subgroups:
+                    yield sg
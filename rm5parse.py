@@ -0,0 +1,440 @@
+#
+# rm5 parser
+#
+#   streaming (expat event driven) parser for RevMan 5 files
+#   builds a lightweight tree which answers the same calls as the
+#   xml.dom.minidom objects used in cca.py (getElementsByTagName,
+#   attributes[...].value, childNodes, firstChild.data, nodeName, toxml)
+#
+#   parse_selective builds only the parts of the file the PICOtron reads
+#
+#   elements in SOURCE_TAGS remember where they are in the file, so their
+#   contents can be returned exactly as written (source_contents) instead
+#   of being reserialised by toxml
+#
+
+import xml.parsers.expat
+
+
+PARSE_BUFFER_SIZE = 65536 # bytes handed to expat at a time (also size of merged text chunks)
+
+# elements built (with everything in them) by parse_selective, wherever they are found in the file
+# everything else apart from the root element (references, study characteristics, risk of bias
+# tables, the text of the review etc.) is read past without making nodes
+KEEP_TAGS = ("COVER_SHEET", "LAST_SEARCH", "CRIT_OUTCOMES", "ANALYSES_AND_DATA")
+
+# rich text sections whose position in the file is recorded (see Element.source_contents)
+SOURCE_TAGS = ("CRIT_OUTCOMES", "CRIT_PARTICIPANTS", "CRIT_INTERVENTIONS", "ABS_CONCLUSIONS",
+               "IMPLICATIONS_PRACTICE", "SUMMARY_BODY", "QUALITY_OF_EVIDENCE")
+
+SNIFF_BLOCK_SIZE = 4096 # bytes read at a time by sniff()
+SNIFF_LIMIT = 1 << 16 # sniff() gives up if the root element has not started within this many bytes
+
+
+
+def _escape(data):
+    " escapes text in the same way as minidom (so that toxml() output is identical) "
+    return data.replace("&", "&amp;").replace("<", "&lt;").replace("\"", "&quot;").replace(">", "&gt;")
+
+
+
+class Attr(object):
+    " single attribute value, mimics minidom's Attr.value "
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+
+class Attributes(object):
+    """
+    read only view of an element's attributes
+    wraps the plain dict handed over by expat; Attr objects are only made on access
+    """
+    __slots__ = ("_d",)
+
+    def __init__(self, d):
+        self._d = d
+
+    def __getitem__(self, name):
+        return Attr(self._d[name])
+
+    def __contains__(self, name):
+        return name in self._d
+
+    def __len__(self):
+        return len(self._d)
+
+    def get(self, name, default=None):
+        if name in self._d:
+            return Attr(self._d[name])
+        return default
+
+    def keys(self):
+        return self._d.keys()
+
+
+class Text(object):
+    nodeName = "#text"
+    childNodes = ()
+    firstChild = None
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    def toxml(self):
+        return _escape(self.data)
+
+
+class CDATASection(Text):
+    nodeName = "#cdata-section"
+    __slots__ = ()
+
+    def toxml(self):
+        return "<![CDATA[%s]]>" % (self.data,)
+
+
+class Comment(Text):
+    nodeName = "#comment"
+    __slots__ = ()
+
+    def toxml(self):
+        return "<!--%s-->" % (self.data,)
+
+
+class Element(object):
+    " xml element; only the parts of the minidom interface which the PICOtron uses "
+    __slots__ = ("nodeName", "_attrs", "childNodes", "_source")
+
+    def __init__(self, name, attrs):
+        self.nodeName = name
+        self._attrs = attrs
+        self.childNodes = []
+        self._source = None # (Source, start, end) byte offsets of the element, if recorded
+
+    def source_contents(self):
+        """
+        the element's contents (everything between its start and end tags) exactly as in the
+        file, decoded; or None if its position was not recorded (not in SOURCE_TAGS)
+        """
+        if self._source is None or len(self._source) < 3:
+            return None
+        (source, start, end) = self._source
+        raw = source.read(start, end)
+        i = _start_tag_end(raw)
+        if raw[i - 2:i] == "/>":
+            return u""
+        return raw[i:].decode(source.encoding)
+
+    @property
+    def tagName(self):
+        return self.nodeName
+
+    @property
+    def attributes(self):
+        return Attributes(self._attrs)
+
+    @property
+    def firstChild(self):
+        if self.childNodes:
+            return self.childNodes[0]
+        return None
+
+    def getElementsByTagName(self, name):
+        " all descendant elements called name, in document order "
+        found = []
+        stack = list(reversed(self.childNodes))
+        while stack:
+            node = stack.pop()
+            if node.nodeName == name:
+                found.append(node)
+            if node.childNodes:
+                stack.extend(reversed(node.childNodes))
+        return found
+
+    def toxml(self):
+        op = []
+        self._writexml(op)
+        return "".join(op)
+
+    def _writexml(self, op):
+        op.append("<" + self.nodeName)
+        for a_name in sorted(self._attrs):
+            op.append(" %s=\"%s\"" % (a_name, _escape(self._attrs[a_name])))
+        if self.childNodes:
+            op.append(">")
+            for node in self.childNodes:
+                if isinstance(node, Element):
+                    node._writexml(op)
+                else:
+                    op.append(node.toxml())
+            op.append("</%s>" % (self.nodeName,))
+        else:
+            op.append("/>")
+
+
+def _start_tag_end(raw):
+    " index just past the '>' which closes the start tag at the beginning of raw (skipping quoted attribute values) "
+    quote = None
+    for i, c in enumerate(raw):
+        if quote:
+            if c == quote:
+                quote = None
+        elif c == '"' or c == "'":
+            quote = c
+        elif c == '>':
+            return i + 1
+    raise ValueError("start tag not closed")
+
+
+class Source(object):
+    """
+    the bytes a document was parsed from, and their encoding (kept, so the file
+    is never read again after parsing, even if it has changed since)
+    """
+    __slots__ = ("data", "encoding")
+
+    def __init__(self, data):
+        self.data = data
+        self.encoding = "utf-8" # (XML default; changed if the declaration says otherwise)
+
+    def read(self, start, end):
+        return self.data[start:end]
+
+
+
+class Document(Element):
+    """
+    top level node; getElementsByTagName includes the root element as minidom does
+    bytes_skipped = bytes of the file not built into the tree (parse_selective only)
+    """
+    __slots__ = ("bytes_skipped",)
+
+    def __init__(self):
+        Element.__init__(self, "#document", {})
+        self.bytes_skipped = 0
+
+    @property
+    def documentElement(self):
+        for node in self.childNodes:
+            if isinstance(node, Element):
+                return node
+        return None
+
+
+
+class TreeBuilder(object):
+    """
+    receives expat events and assembles the lightweight tree
+    """
+
+    def __init__(self, source = None, source_tags = SOURCE_TAGS):
+        self.document = Document()
+        self.stack = [self.document]
+        self.in_cdata = False
+        self.source = source # Source, if element positions are to be recorded
+        self.source_tags = frozenset(source_tags)
+
+    def start_element(self, name, attrs):
+        el = Element(name, attrs)
+        if self.source is not None and name in self.source_tags:
+            el._source = (self.p.CurrentByteIndex, )
+        self.stack[-1].childNodes.append(el)
+        self.stack.append(el)
+
+    def end_element(self, name):
+        el = self.stack.pop()
+        if el._source is not None:
+            # (expat gives the start of </x>, or the end of <x/>)
+            el._source = (self.source, el._source[0], self.p.CurrentByteIndex)
+
+    def xml_decl(self, version, encoding, standalone):
+        if encoding and self.source is not None:
+            self.source.encoding = encoding
+
+    def character_data(self, data):
+        children = self.stack[-1].childNodes
+        if self.in_cdata:
+            node_type = CDATASection
+        else:
+            node_type = Text
+        if children and type(children[-1]) is node_type:
+            # expat may split long runs of text; join them as minidom does
+            children[-1].data += data
+        else:
+            children.append(node_type(data))
+
+    def start_cdata(self):
+        self.in_cdata = True
+
+    def end_cdata(self):
+        self.in_cdata = False
+
+    def comment(self, data):
+        if len(self.stack) > 1:
+            self.stack[-1].childNodes.append(Comment(data))
+
+    def parser(self):
+        " returns an expat parser wired up to this builder "
+        self.p = p = xml.parsers.expat.ParserCreate()
+        p.buffer_text = True
+        p.buffer_size = PARSE_BUFFER_SIZE
+        p.StartElementHandler = self.start_element
+        p.EndElementHandler = self.end_element
+        p.CharacterDataHandler = self.character_data
+        p.StartCdataSectionHandler = self.start_cdata
+        p.EndCdataSectionHandler = self.end_cdata
+        p.CommentHandler = self.comment
+        p.XmlDeclHandler = self.xml_decl
+        return p
+
+
+
+class SelectiveTreeBuilder(TreeBuilder):
+    """
+    as TreeBuilder, but only builds the root element and elements named in
+    keep_tags (with their contents); the rest of the file is skipped
+
+    a kept element inside skipped ones is attached to the nearest built
+    ancestor, so it is still found by getElementsByTagName, in document order
+
+    """
+
+    def __init__(self, keep_tags, source = None):
+        TreeBuilder.__init__(self, source)
+        self.keep_tags = frozenset(keep_tags)
+        self.open = [] # for each open element: "root", "keep" or "skip"
+        self.skip_start = None # byte index where the current skipped run began
+        self.skip_events = 0 # events since then (0 = element still empty)
+
+    def _skipping(self):
+        return bool(self.open) and self.open[-1] == "skip"
+
+    def _end_index(self, name, empty):
+        " byte index just past the end of the element now ending "
+        if empty:
+            return self.p.CurrentByteIndex # (expat reports the end of <x/> after it)
+        return self.p.CurrentByteIndex + len(name) + 3 # (and the start of </x>)
+
+    def start_element(self, name, attrs):
+        if self.open and self.open[-1] == "keep":
+            self.open.append("keep")
+            TreeBuilder.start_element(self, name, attrs)
+        elif not self.open:
+            self.open.append("root")
+            TreeBuilder.start_element(self, name, attrs)
+        elif name in self.keep_tags:
+            if self._skipping():
+                self.document.bytes_skipped += self.p.CurrentByteIndex - self.skip_start
+            self.open.append("keep")
+            TreeBuilder.start_element(self, name, attrs)
+        else:
+            if self._skipping():
+                self.skip_events += 1
+            else:
+                self.skip_start = self.p.CurrentByteIndex
+                self.skip_events = 0
+            self.open.append("skip")
+
+    def end_element(self, name):
+        kind = self.open.pop()
+        if kind == "skip":
+            if not self._skipping():
+                self.document.bytes_skipped += self._end_index(name, self.skip_events == 0) - self.skip_start
+        else:
+            if kind == "keep" and self._skipping():
+                # back into a skipped run
+                self.skip_start = self._end_index(name, not self.stack[-1].childNodes)
+                self.skip_events = 1
+            TreeBuilder.end_element(self, name)
+
+    def character_data(self, data):
+        if self._skipping():
+            self.skip_events += 1
+        elif self.open and self.open[-1] == "keep":
+            TreeBuilder.character_data(self, data)
+
+    def comment(self, data):
+        if self._skipping():
+            self.skip_events += 1
+        elif self.open and self.open[-1] == "keep":
+            TreeBuilder.comment(self, data)
+
+
+
+def _parse(builder_class, filename, *args):
+    if hasattr(filename, "read"):
+        builder = builder_class(*args)
+        builder.parser().ParseFile(filename)
+    else:
+        # (read in one go, and parsed from memory, so the source contents come from the same bytes)
+        with open(filename, 'rb') as f:
+            return _parse_string(builder_class, f.read(), *args)
+    return builder.document
+
+
+def _parse_string(builder_class, string, *args):
+    builder = builder_class(*args, source = Source(string))
+    builder.parser().Parse(string, True)
+    return builder.document
+
+
+def parse(filename):
+    """
+    parses a RevMan file (filename or open file object) in a single streaming pass
+    returns a Document
+    """
+    return _parse(TreeBuilder, filename)
+
+
+def parseString(string):
+    " as parse(), from a string in memory "
+    return _parse_string(TreeBuilder, string)
+
+
+def parse_selective(filename, keep_tags = KEEP_TAGS):
+    """
+    as parse(), but only builds the root element and the elements in keep_tags
+    the Document's bytes_skipped gives how much of the file was left out
+    """
+    return _parse(SelectiveTreeBuilder, filename, keep_tags)
+
+
+def parseString_selective(string, keep_tags = KEEP_TAGS):
+    " as parse_selective(), from a string in memory "
+    return _parse_string(SelectiveTreeBuilder, string, keep_tags)
+
+
+
+class _RootFound(Exception):
+    pass
+
+
+def sniff(filename):
+    """
+    reads only the start of a file, up to the root element's start tag
+    returns (root element name, dict of its attributes), or None if not found within SNIFF_LIMIT bytes
+    raises xml.parsers.expat.ExpatError if the start of the file is not well formed
+    """
+    found = []
+
+    def start_element(name, attrs):
+        found.append((name, attrs))
+        raise _RootFound()
+
+    p = xml.parsers.expat.ParserCreate()
+    p.StartElementHandler = start_element
+
+    with open(filename, 'rb') as f:
+        read = 0
+        while read < SNIFF_LIMIT:
+            block = f.read(SNIFF_BLOCK_SIZE)
+            if not block:
+                break
+            read += len(block)
+            try:
+                p.Parse(block, False)
+            except _RootFound:
+                return found[0]
+    return None
@@ -0,0 +1,190 @@
+#
+# conversion service
+#
+#   a small local HTTP server (on a TCP port, or a Unix socket) converting
+#   one review per request with cca.convert_review, so a CMS does not start
+#   a new Python process for every review it publishes
+#
+#   the topic map, question templates and text caches stay loaded between
+#   requests; the topic map is reloaded when topics.csv changes
+#
+#   POST /convert   body = RevMan file; returns the document (text/html)
+#                   ?format=json returns {cdno, html, records, diagnostics}
+#                   (with ?records=1 for the PICO records)
+#                   422 if not an intervention review, 400 if it cannot be converted
+#   GET /health     {status, topics, converted}
+#
+#   e.g. curl --data-binary @input/CD001234.rm5 http://127.0.0.1:8750/convert
+#
+
+import argparse
+import BaseHTTPServer
+import json
+import os
+import SocketServer
+import sys
+import traceback
+import urlparse
+
+import cca
+
+
+HOST = "127.0.0.1" # local only; there is no authentication
+PORT = 8750
+MAX_REVIEW_BYTES = 64 << 20 # larger request bodies are refused
+
+
+
+class TopicMap():
+    " the topic lookup from cca.load_topics, reloaded if the csv changes "
+
+    def __init__(self, filename):
+
+        self.filename = filename
+        self.stat = None
+        self.lookup = None
+        self.current()
+
+    def current(self):
+        try:
+            st = os.stat(self.filename)
+            stat = (st.st_size, st.st_mtime)
+        except OSError:
+            stat = None
+        if stat != self.stat or self.lookup is None:
+            self.lookup = cca.load_topics(self.filename) if stat else {}
+            self.stat = stat
+        return self.lookup
+
+
+
+class ReviewHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    server_version = "PICOtron/" + cca.PICOTRON_VERSION
+
+    def address_string(self):
+        # (a Unix socket has no client address)
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return "local"
+
+    def log_message(self, format, *args):
+        # (as BaseHTTPRequestHandler, which reads client_address directly)
+        if not self.server.quiet:
+            sys.stderr.write("%s - - [%s] %s\n" % (self.address_string(), self.log_date_time_string(), format % args))
+
+    def _send(self, status, body, content_type, headers = ()):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for (name, value) in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, obj):
+        self._send(status, json.dumps(obj, sort_keys=True), "application/json")
+
+    def do_GET(self):
+        path = urlparse.urlparse(self.path).path
+        if path != "/health":
+            self._send_json(404, {"error": "not found"})
+            return
+        self.server.topics.current()
+        self._send_json(200, {"status": "ok", "topics": self.server.topics.stat is not None, "converted": self.server.converted})
+
+    def do_POST(self):
+        url = urlparse.urlparse(self.path)
+        if url.path != "/convert":
+            self._send_json(404, {"error": "not found"})
+            return
+        query = urlparse.parse_qs(url.query)
+        as_json = query.get("format", ["html"])[0] == "json"
+        records = query.get("records", ["0"])[0] not in ("0", "")
+
+        try:
+            length = int(self.headers.getheader("Content-Length"))
+        except (TypeError, ValueError):
+            self._send_json(411, {"error": "Content-Length required"})
+            return
+        if length > MAX_REVIEW_BYTES:
+            self._send_json(413, {"error": "review larger than %d bytes" % (MAX_REVIEW_BYTES, )})
+            return
+        data = self.rfile.read(length)
+
+        try:
+            result = cca.convert_review(data, self.server.topics.current(), records = records and as_json)
+        except Exception:
+            self._send_json(400, {"error": traceback.format_exc().strip().splitlines()[-1]})
+            return
+        self.server.converted += 1
+
+        if result["cdno"] is None:
+            self._send_json(422, {"error": "not an intervention review"})
+        elif as_json:
+            result["html"] = result["html"].decode('utf-8')
+            self._send_json(200, result)
+        else:
+            self._send(200, result["html"], "text/html; charset=utf-8", [("X-CD-Number", result["cdno"])])
+
+
+
+class ReviewServer(BaseHTTPServer.HTTPServer):
+    """
+    HTTP server on a TCP port; requests are handled one at a time (the text
+    caches in textgen.py are not thread safe, and each review takes milliseconds)
+    """
+
+    def __init__(self, address, topics, quiet = False):
+
+        BaseHTTPServer.HTTPServer.__init__(self, address, ReviewHandler)
+        self.topics = topics
+        self.quiet = quiet
+        self.converted = 0
+
+
+class UnixReviewServer(SocketServer.UnixStreamServer):
+    " as ReviewServer, listening on a Unix socket "
+
+    def __init__(self, path, topics, quiet = False):
+
+        if os.path.exists(path):
+            os.remove(path)
+        SocketServer.UnixStreamServer.__init__(self, path, ReviewHandler)
+        self.topics = topics
+        self.quiet = quiet
+        self.converted = 0
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="serves review conversions over HTTP (see the top of service.py)")
+    parser.add_argument("--host", default=HOST, help="address to listen on (default %s)" % (HOST, ))
+    parser.add_argument("--port", type=int, default=PORT, help="port to listen on (default %d)" % (PORT, ))
+    parser.add_argument("--socket", metavar="PATH", help="listen on a Unix socket at PATH instead of a port")
+    parser.add_argument("--topics", default=cca.get_topic_filename(), help="topic map csv (default %s)" % (cca.get_topic_filename(), ))
+    parser.add_argument("--quiet", action="store_true", help="do not log each request")
+    args = parser.parse_args()
+
+    topics = TopicMap(args.topics)
+    if args.socket:
+        server = UnixReviewServer(args.socket, topics, args.quiet)
+        print "serving on %s" % (args.socket, )
+    else:
+        server = ReviewServer((args.host, args.port), topics, args.quiet)
+        print "serving on http://%s:%d/" % (args.host, args.port)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print ""
+        print "stopped"
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+
+if __name__ == '__main__':
+    main()
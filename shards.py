@@ -0,0 +1,89 @@
+#
+# shards
+#
+#   splits one run over several machines which share the input and output
+#   folders: each converts one shard of the input files (cca.py --shard i/n),
+#   keeping its own manifest, reports and not done list, and cca.py --merge n
+#   combines them once every shard has finished
+#
+#   files are grouped by CD number (or content hash, for a file without one),
+#   so every copy and version of a review is in the same shard (and duplicates
+#   are still found); the groups are dealt out largest first, each to the
+#   shard with the fewest bytes so far, so every machine works out the same
+#   split from the same input files
+#
+
+import collections
+import os
+
+
+def parse(text):
+    " (i, n) from 'i/n', with 1 <= i <= n; raises ValueError "
+    try:
+        (i, n) = [int(part) for part in text.split("/")]
+    except ValueError:
+        raise ValueError("shard must be given as i/n, e.g. 2/4")
+    if not 1 <= i <= n:
+        raise ValueError("shard %d/%d: i must be from 1 to n" % (i, n))
+    return (i, n)
+
+
+def suffix(shard):
+    " e.g. '.shard-2-of-4' ('' for shard None = an unsharded run) "
+    if shard is None:
+        return ""
+    return ".shard-%d-of-%d" % shard
+
+
+def shard_filename(filename, shard):
+    " filename with the shard suffix before its extension (output/manifest.shard-2-of-4.json) "
+    (base, ext) = os.path.splitext(filename)
+    return base + suffix(shard) + ext
+
+
+def assign(keys, sizes, n):
+    """
+    shard number (1 to n) for each item, given its key (items with the same key
+    share a shard) and size; largest groups first, each to the smallest shard
+    so far (the lowest numbered, if equal)
+    """
+    groups = collections.OrderedDict()
+    for (i, key) in enumerate(keys):
+        groups.setdefault(key, []).append(i)
+    group_sizes = dict((key, sum(sizes[i] for i in items)) for (key, items) in groups.items())
+
+    totals = [0] * n
+    shard_nos = [None] * len(keys)
+    for key in sorted(groups, key=lambda k: (-group_sizes[k], k)):
+        smallest = min(range(n), key=lambda s: (totals[s], s))
+        totals[smallest] += group_sizes[key]
+        for i in groups[key]:
+            shard_nos[i] = smallest + 1
+    return shard_nos
+
+
+def merge_runs(runs):
+    """
+    one set of run details from those of each shard (dicts as cca.run_details,
+    with "shard" and "not_done" added)
+    """
+    merged = {"shards": len(runs),
+              "settings": runs[0]["settings"],
+              "finished": max(run["finished"] for run in runs),
+              "files": sorted(f for run in runs for f in run["files"]),
+              "results": {},
+              "skipped_types": collections.Counter(),
+              "duplicates": [],
+              "not_done": sorted(f for run in runs for f in run["not_done"])}
+    for run in runs:
+        if run["settings"] != merged["settings"]:
+            merged.setdefault("warnings", []).append("shard %s was run with other settings: %r" % (run["shard"], run["settings"]))
+        merged["results"].update(run["results"])
+        merged["skipped_types"].update(run["skipped_types"])
+        merged["duplicates"].extend(run["duplicates"])
+        for (stage, totals) in run.get("stage_totals", {}).items():
+            stage_totals = merged.setdefault("stage_totals", {}).setdefault(stage, {})
+            for (name, value) in totals.items():
+                stage_totals[name] = stage_totals.get(name, 0) + value
+    merged["skipped_types"] = dict(merged["skipped_types"])
+    return merged
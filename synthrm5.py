@@ -0,0 +1,221 @@
+#
+# synthetic RevMan files
+#
+#   writes valid (synthetic) RevMan 5 intervention reviews, with a chosen
+#   number of comparisons, outcomes, subgroups and studies, for testing
+#   and benchmarking the PICOtron
+#
+
+import argparse
+import math
+import os
+import random
+from xml.sax.saxutils import escape, quoteattr
+
+
+OUTCOME_TYPES = ["DICH", "DICH", "CONT", "IV"] # cycled through for each comparison
+DICH_MEASURES = ["RR", "OR"]
+
+
+
+def _ratio(rng):
+    " an effect estimate with a 95% CI, never touching exactly 1 (the PICOtron treats that as an error) "
+    log_point = rng.gauss(0, 0.4)
+    se = rng.uniform(0.05, 0.5)
+    values = [math.exp(log_point + z * se) for z in (0, -1.96, 1.96)]
+    return ["%.3f" % (v if abs(v - 1) > 0.0005 else 1.001) for v in values]
+
+
+def _difference(rng):
+    " as _ratio, for mean differences (never touching 0) "
+    point = rng.gauss(0, 2)
+    se = rng.uniform(0.1, 1)
+    values = [point + z * se for z in (0, -1.96, 1.96)]
+    return ["%.3f" % (v if abs(v) > 0.0005 else 0.001) for v in values]
+
+
+def _attrs(d):
+    return "".join(" %s=%s" % (k, quoteattr(str(v))) for (k, v) in sorted(d.items()))
+
+
+def _study_rows(rng, octype, studies, first_study):
+    " DICH_DATA / CONT_DATA / IV_DATA rows; returns (rows, total_1, total_2) "
+    rows = []
+    total_1 = total_2 = 0
+
+    for s in range(studies):
+        n1 = rng.randint(20, 400)
+        n2 = rng.randint(20, 400)
+        total_1 += n1
+        total_2 += n2
+        attrs = {"STUDY_ID": "STD-Study-%d" % (first_study + s, ), "ORDER": s + 1, "ESTIMABLE": "YES", "WEIGHT": "%.1f" % (100.0 / studies, ),
+                 "TOTAL_1": n1, "TOTAL_2": n2}
+
+        if octype == "DICH":
+            attrs["EVENTS_1"] = rng.randint(0, n1 // 2)
+            attrs["EVENTS_2"] = rng.randint(1, n2 // 2)
+            (attrs["EFFECT_SIZE"], attrs["CI_START"], attrs["CI_END"]) = _ratio(rng)
+            rows.append("<DICH_DATA%s/>" % (_attrs(attrs), ))
+        elif octype == "CONT":
+            attrs.update({"MEAN_1": "%.2f" % rng.uniform(5, 50), "MEAN_2": "%.2f" % rng.uniform(5, 50), "SD_1": "%.2f" % rng.uniform(1, 10), "SD_2": "%.2f" % rng.uniform(1, 10)})
+            (attrs["EFFECT_SIZE"], attrs["CI_START"], attrs["CI_END"]) = _difference(rng)
+            rows.append("<CONT_DATA%s/>" % (_attrs(attrs), ))
+        else:
+            (attrs["EFFECT_SIZE"], attrs["CI_START"], attrs["CI_END"]) = _ratio(rng)
+            attrs["SE"] = "%.3f" % rng.uniform(0.05, 0.5)
+            rows.append("<IV_DATA%s/>" % (_attrs(attrs), ))
+
+    return rows, total_1, total_2
+
+
+def _analysis(rng, octype, studies, first_study, units):
+    " attributes and data rows for an outcome or subgroup element "
+    rows, total_1, total_2 = _study_rows(rng, octype, studies, first_study)
+    if octype == "CONT":
+        estimates = _difference(rng)
+    else:
+        estimates = _ratio(rng)
+
+    attrs = {"ESTIMABLE": "YES", "STUDIES": studies, "TOTAL_1": total_1, "TOTAL_2": total_2,
+             "EFFECT_SIZE": estimates[0], "CI_START": estimates[1], "CI_END": estimates[2], "CHI2": "1.0", "DF": max(studies - 1, 0), "I2": "0.0",
+             "P_CHI2": "0.5", "P_Z": "0.01", "Z": "2.0"}
+    if units:
+        attrs["EFFECT_MEASURE"] = units
+    return attrs, rows
+
+
+def review(seed = 0, comparisons = 3, outcomes = 4, subgroups = 0, studies = 5, references = 20, cd_number = None):
+    """
+    returns the text of a synthetic RevMan 5 intervention review (utf-8 encoded string)
+
+    comparisons = number of COMPARISON elements
+    outcomes = outcomes per comparison (cycling through OUTCOME_TYPES)
+    subgroups = subgroups per outcome (0 = no subgroups)
+    studies = studies per outcome (or per subgroup)
+    references = number of included study references (bulk text the PICOtron does not use)
+    """
+    rng = random.Random(seed)
+    if cd_number is None:
+        cd_number = "CD%06d" % (seed % 1000000, )
+
+    intname = rng.choice(["Inhaled corticosteroids", "Paracetamol", "Exercise therapy", "Antibiotics", "Acupuncture"])
+    cntname = rng.choice(["placebo", "usual care", "no treatment"])
+    cndname = rng.choice(["asthma", "low back pain", "otitis media", "depression"])
+
+    op = []
+    op.append('<?xml version="1.0" encoding="UTF-8" standalone="no"?>')
+    op.append('<COCHRANE_REVIEW%s>' % _attrs({"DESCRIPTION": "", "DOI": "10.1002/14651858.%s.pub2" % (cd_number, ), "GROUP_ID": "SYNTH", "ID": seed,
+                                                "MODIFIED": "2012-01-01 00:00:00 +0000", "REVIEW_NO": seed, "REVMAN_SUB_VERSION": "5.1.6", "REVMAN_VERSION": "5",
+                                                "STAGE": "R", "STATUS": "UNCHANGED", "TYPE": "INTERVENTION", "VERSION_NO": "2.0"}))
+
+    op.append('<COVER_SHEET MODIFIED="2012-01-01 00:00:00 +0000">')
+    op.append('<TITLE>%s versus %s for %s in adults</TITLE>' % (escape(intname), escape(cntname), escape(cndname)))
+    op.append('<CREATORS><PERSON ID="1"><FIRST_NAME>Alex</FIRST_NAME><LAST_NAME>Synth</LAST_NAME></PERSON></CREATORS>')
+    op.append('<DATES><LAST_SEARCH MODIFIED="2012-01-01 00:00:00 +0000"><DATE DAY="%d" MONTH="%d" YEAR="%d"/></LAST_SEARCH></DATES>' % (rng.randint(1, 28), rng.randint(1, 12), rng.randint(2000, 2012)))
+    op.append('</COVER_SHEET>')
+
+    op.append('<MAIN_TEXT>')
+    op.append('<SUMMARY><SUMMARY_TITLE>%s for %s</SUMMARY_TITLE><SUMMARY_BODY><P>Synthetic plain language summary.</P></SUMMARY_BODY></SUMMARY>' % (escape(intname), escape(cndname)))
+    op.append('<METHODS><SELECTION_CRITERIA>')
+    op.append('<CRIT_PARTICIPANTS><P>Adults with %s.</P></CRIT_PARTICIPANTS>' % (escape(cndname), ))
+    op.append('<CRIT_INTERVENTIONS><P>%s compared with %s.</P></CRIT_INTERVENTIONS>' % (escape(intname), escape(cntname)))
+    op.append('<CRIT_OUTCOMES><P><B>Primary outcomes</B></P><OL><LI>Treatment failure</LI><LI>Adverse events</LI></OL><P>Secondary outcomes &amp; "other" measures &lt;1 year</P></CRIT_OUTCOMES>')
+    op.append('</SELECTION_CRITERIA></METHODS>')
+    op.append('</MAIN_TEXT>')
+
+    op.append('<STUDIES_AND_REFERENCES><STUDIES><INCLUDED_STUDIES>')
+    for s in range(references):
+        op.append('<STUDY DATA_SOURCE="PUB" ID="STD-Study-%d" NAME="Study %d" YEAR="%d"><REFERENCE PRIMARY="YES" TYPE="JOURNAL_ARTICLE"><AU>Author A, Author B</AU><TI>A randomised trial of %s in %s (%d)</TI><SO>Journal of Synthetic Trials</SO><YR>%d</YR><VL>%d</VL><PG>1-10</PG></REFERENCE></STUDY>'
+                  % (s, s, 1990 + s % 20, escape(intname.lower()), escape(cndname), s, 1990 + s % 20, s))
+    op.append('</INCLUDED_STUDIES></STUDIES></STUDIES_AND_REFERENCES>')
+
+    op.append('<CHARACTERISTICS_OF_STUDIES><CHARACTERISTICS_OF_INCLUDED_STUDIES>')
+    for s in range(references):
+        op.append('<INCLUDED_CHAR STUDY_ID="STD-Study-%d"><CHAR_METHODS><P>Randomised controlled trial.</P></CHAR_METHODS><CHAR_PARTICIPANTS><P>%d adults.</P></CHAR_PARTICIPANTS><CHAR_INTERVENTIONS><P>%s</P></CHAR_INTERVENTIONS></INCLUDED_CHAR>'
+                  % (s, rng.randint(20, 800), escape(intname)))
+    op.append('</CHARACTERISTICS_OF_INCLUDED_STUDIES></CHARACTERISTICS_OF_STUDIES>')
+
+    op.append('<ANALYSES_AND_DATA CALCULATED_DATA="YES">')
+    for c in range(1, comparisons + 1):
+        op.append('<COMPARISON ID="CMP-%03d" NO="%d"><NAME>%s versus %s</NAME>' % (c, c, escape(intname), escape(cntname)))
+
+        for o in range(1, outcomes + 1):
+            octype = OUTCOME_TYPES[(o - 1) % len(OUTCOME_TYPES)]
+            if octype == "DICH":
+                units = rng.choice(DICH_MEASURES)
+            elif octype == "CONT":
+                units = "MD"
+            else:
+                units = "RR"
+            name = "Outcome %d" % (o, )
+
+            if subgroups:
+                attrs, dummy = _analysis(rng, octype, studies * subgroups, 0, units)
+                attrs["SUBGROUPS"] = "YES"
+            else:
+                attrs, rows = _analysis(rng, octype, studies, 0, units)
+                attrs["SUBGROUPS"] = "NO"
+            attrs["NO"] = o
+            attrs["ID"] = "CMP-%03d.%02d" % (c, o)
+            attrs["TOTALS"] = "YES"
+
+            op.append('<%s_OUTCOME%s><NAME>%s</NAME><GROUP_LABEL_1>%s</GROUP_LABEL_1><GROUP_LABEL_2>%s</GROUP_LABEL_2><GRAPH_LABEL_1>Favours %s</GRAPH_LABEL_1><GRAPH_LABEL_2>Favours %s</GRAPH_LABEL_2>'
+                      % (octype, _attrs(attrs), name, escape(intname), escape(cntname), escape(intname.lower()), escape(cntname)))
+
+            if subgroups:
+                for s in range(1, subgroups + 1):
+                    sg_attrs, sg_rows = _analysis(rng, octype, studies, (s - 1) * studies, None)
+                    sg_attrs["NO"] = s
+                    sg_attrs["ID"] = "CMP-%03d.%02d.%02d" % (c, o, s)
+                    op.append('<%s_SUBGROUP%s><NAME>Subgroup %d</NAME>%s</%s_SUBGROUP>' % (octype, _attrs(sg_attrs), s, "".join(sg_rows), octype))
+            else:
+                op.append("".join(rows))
+
+            op.append('</%s_OUTCOME>' % (octype, ))
+
+        op.append('</COMPARISON>')
+    op.append('</ANALYSES_AND_DATA>')
+    op.append('</COCHRANE_REVIEW>')
+
+    return "\n".join(op)
+
+
+def write_review(filename, **kwargs):
+    " writes review(**kwargs) to filename; returns the number of bytes written "
+    txt = review(**kwargs)
+    with open(filename, 'wb') as f:
+        f.write(txt)
+    return len(txt)
+
+
+def write_corpus(directory, files, seed = 0, **kwargs):
+    " writes a corpus of synthetic reviews (one per seed) to directory; returns the list of filenames "
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    filenames = []
+    for i in range(files):
+        filename = os.path.join(directory, "CD%06d.rm5" % (seed + i, ))
+        write_review(filename, seed = seed + i, **kwargs)
+        filenames.append(filename)
+    return filenames
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="writes synthetic RevMan 5 reviews for testing and benchmarking")
+    parser.add_argument("directory", help="output directory (e.g. input/)")
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--comparisons", type=int, default=3)
+    parser.add_argument("--outcomes", type=int, default=4, help="outcomes per comparison")
+    parser.add_argument("--subgroups", type=int, default=0, help="subgroups per outcome")
+    parser.add_argument("--studies", type=int, default=5, help="studies per outcome (or subgroup)")
+    parser.add_argument("--references", type=int, default=20, help="included study references (unused bulk)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    filenames = write_corpus(args.directory, args.files, seed=args.seed, comparisons=args.comparisons, outcomes=args.outcomes,
+                             subgroups=args.subgroups, studies=args.studies, references=args.references)
+    print "%d files written to %s" % (len(filenames), args.directory)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+#
+# tag index
+#
+#   one pass index of every element in a parsed review, by tag name
+#   so that repeated getElementsByTagName calls (on the whole review, or
+#   on a single comparison / outcome / subgroup) do not rescan the tree
+#
+#   works with either parser backend (rm5parse or xml.dom.minidom)
+#
+
+from bisect import bisect_left
+
+
+
+def _is_element(node):
+    " text, comment and cdata nodes are named #text etc. "
+    return node.nodeName[:1] != "#"
+
+
+
+class TagIndex(object):
+    """
+    built with a single preorder walk of the tree
+
+    positions[tag] = preorder numbers of every element called tag (ascending)
+    nodes[tag] = the matching elements, in the same (document) order
+    spans[id(node)] = (first, end) preorder numbers of node's descendants
+
+    so the descendants of any node called tag are a contiguous slice,
+    found by bisecting positions[tag] with that node's span
+
+    """
+
+    def __init__(self, root):
+
+        self.root = root
+        self.positions = {}
+        self.nodes = {}
+        self.spans = {}
+
+        counter = 0
+        stack = [(root, None)]
+
+        while stack:
+            node, pos = stack.pop()
+
+            if pos is not None:
+                # all descendants now numbered
+                self.spans[id(node)] = (pos + 1, counter)
+                continue
+
+            name = node.nodeName
+            if name in self.positions:
+                self.positions[name].append(counter)
+                self.nodes[name].append(node)
+            else:
+                self.positions[name] = [counter]
+                self.nodes[name] = [node]
+
+            children = [c for c in node.childNodes if _is_element(c)]
+            if children:
+                stack.append((node, counter))
+                stack.extend((c, None) for c in reversed(children))
+            counter += 1
+
+    def elements(self, tag, scope = None):
+        " elements called tag below scope (default whole tree), in document order "
+        if tag not in self.positions:
+            return []
+        if scope is None:
+            scope = self.root
+
+        span = self.spans.get(id(scope))
+        if span is None:
+            # no element children
+            return []
+
+        positions = self.positions[tag]
+        return self.nodes[tag][bisect_left(positions, span[0]):bisect_left(positions, span[1])]
+
+    def view(self, node):
+        " wraps node so that its getElementsByTagName calls use this index "
+        if node is None or not _is_element(node):
+            return node
+        return IndexedNode(node, self)
+
+
+
+class IndexedNode(object):
+    """
+    view of an element (or document) which answers getElementsByTagName from a TagIndex
+    everything else is passed through to the wrapped node
+    """
+    __slots__ = ("node", "index")
+
+    def __init__(self, node, index):
+        self.node = node
+        self.index = index
+
+    def __eq__(self, other):
+        # views of the same node are interchangeable (e.g. as dictionary keys)
+        return self.node is getattr(other, "node", other)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.node)
+
+    @property
+    def nodeName(self):
+        return self.node.nodeName
+
+    @property
+    def attributes(self):
+        return self.node.attributes
+
+    @property
+    def childNodes(self):
+        return [self.index.view(c) for c in self.node.childNodes]
+
+    @property
+    def firstChild(self):
+        return self.index.view(self.node.firstChild)
+
+    def getElementsByTagName(self, tag):
+        return [IndexedNode(n, self.index) for n in self.index.elements(tag, self.node)]
+
+    def source_contents(self):
+        # None where the backend records no source offsets (minidom), as rm5parse does for other tags
+        return getattr(self.node, "source_contents", lambda: None)()
+
+    def toxml(self):
+        return self.node.toxml()
+
+
+
+def indexed(document):
+    " indexes a parsed review, returning a view of the document to use in place of it "
+    return IndexedNode(document, TagIndex(document))
@@ -0,0 +1,46 @@
+#
+# test support
+#
+#   the fixture reviews (tests/fixtures), and conversion with a fixed
+#   question wording and the date stamp removed, so output can be compared
+#
+
+import os
+import re
+
+import cca
+import textgen
+
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def fixture(name):
+    " full path of a file in tests/fixtures "
+    return os.path.join(FIXTURES, name)
+
+
+def read_fixture(name):
+    with open(fixture(name), 'rb') as f:
+        return f.read()
+
+
+def convert(name, **settings):
+    """
+    cca.convert_review of a fixture, with the cca constants in settings set for the
+    conversion (and restored after); questions worded from seed 1, date stamp removed
+    returns the convert_review dict
+    """
+    saved = dict((k, getattr(cca, k)) for k in settings)
+    saved["QUESTION_CHOOSER"] = cca.QUESTION_CHOOSER
+    try:
+        for (k, v) in settings.items():
+            setattr(cca, k, v)
+        cca.QUESTION_CHOOSER = textgen.Chooser(1)
+        result = cca.convert_review(read_fixture(name), cca.parse_topics(fixture("topics.csv")), records = True)
+    finally:
+        for (k, v) in saved.items():
+            setattr(cca, k, v)
+    if result["html"] is not None:
+        result["html"] = re.sub("text complied @ [^;]*;", "text complied @ X;", result["html"])
+    return result
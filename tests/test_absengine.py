@@ -0,0 +1,68 @@
+import unittest
+from decimal import Decimal
+
+import absengine
+import cca
+import reviewmodel
+from tests.support import fixture
+
+
+def decimal_numerators(analysis, units, denom):
+    " the numerators as the Decimal path (rm_abs_values without abstable) works them out "
+    cer = cca.cerparse(analysis.all_study_data())
+    return [cca.natfreq_nodenom(cca.ier(cer, units, Decimal(value)), denom)
+            for value in (analysis.point, analysis.ci95low, analysis.ci95up)] + [cca.natfreq_nodenom(cer, denom)]
+
+
+def dich_outcome(units, studies, estimate):
+    " an outcome from (events, total) in each group of each study, and the reported (point, low, high) "
+    data = [reviewmodel.StudyData(kind="DICH_DATA", events_1=str(a), total_1=str(n1), events_2=str(c), total_2=str(n2))
+            for (a, n1, c, n2) in studies]
+    (point, ci95low, ci95up) = [Decimal(v) for v in estimate]
+    return reviewmodel.Outcome(kind="DICH_OUTCOME", no="1", units=units, study_data=data, subgroups=[],
+                               point=point, ci95low=ci95low, ci95up=ci95up)
+
+
+def table(*outcomes):
+    return absengine.AbsTable(reviewmodel.Review(comparisons=[reviewmodel.Comparison(no="1", outcomes=list(outcomes))]), 1000)
+
+
+@unittest.skipUnless(absengine.available(), "needs numpy")
+class AbsTableTest(unittest.TestCase):
+
+    def test_fixture_review_matches_decimal(self):
+        review = cca.rm_review(cca.rm_parse(fixture("CD001234.rm5")))
+        abstable = absengine.AbsTable(review, cca.DENOMINATOR)
+        checked = 0
+        for comparison in review.comparisons:
+            for outcome in comparison.outcomes:
+                if outcome.skipped or outcome.kind != "DICH_OUTCOME":
+                    continue
+                for analysis in [outcome] + outcome.subgroups:
+                    numerators = abstable.lookup(analysis)
+                    if numerators is None:
+                        continue
+                    self.assertEqual(numerators, decimal_numerators(analysis, outcome.units, cca.DENOMINATOR))
+                    checked += 1
+        self.assertTrue(checked > 0)
+
+    def test_zero_cells_match_decimal(self):
+        outcomes = [dich_outcome("RR", [(0, 40, 0, 40), (3, 50, 6, 52)], ("0.5", "0.2", "0.9")), # no events in one study
+                    dich_outcome("RR", [(0, 40, 0, 40)], ("0.5", "0.2", "0.9")), # no control events at all
+                    dich_outcome("OR", [(4, 40, 0, 38), (7, 60, 9, 61)], ("0.6", "0.3", "0.95")),
+                    dich_outcome("OR", [(40, 40, 38, 38)], ("0.6", "0.3", "0.95"))] # events in everyone
+        abstable = table(*outcomes)
+        for o in outcomes:
+            self.assertEqual(abstable.lookup(o), decimal_numerators(o, o.units, 1000))
+
+    def test_left_to_decimal(self):
+        no_control = dich_outcome("RR", [(3, 40, 0, 0)], ("0.5", "0.2", "0.9"))
+        boundary = dich_outcome("RR", [(3, 40, 1, 8)], ("0.5", "0.2", "0.9")) # 125 x 0.5 = 62.5 per 1000
+        abstable = table(no_control, boundary)
+        self.assertIsNone(abstable.lookup(no_control))
+        self.assertIsNone(abstable.lookup(boundary))
+        self.assertEqual(decimal_numerators(boundary, "RR", 1000)[0], "62") # (half to even)
+
+
+if __name__ == '__main__':
+    unittest.main()
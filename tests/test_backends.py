@@ -0,0 +1,54 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import rm5parse
+from tests.support import convert, fixture
+
+
+class BackendTest(unittest.TestCase):
+    " one review through each parser backend "
+
+    def test_each_backend_converts(self):
+        for backend in ("minidom", "stream", "selective"):
+            for raw in (True, False):
+                result = convert("CD001234.rm5", PARSER_BACKEND = backend, RAW_TAG_CONTENTS = raw)
+                self.assertEqual(result["cdno"], "CD001234", (backend, raw))
+                self.assertIn("Cochrane Clinical Answers", result["html"])
+
+    def test_backends_agree_when_serialised(self):
+        # without the raw tag contents, every backend rebuilds the sections with toxml()
+        html = [convert("CD001234.rm5", PARSER_BACKEND = backend, RAW_TAG_CONTENTS = False)["html"]
+                for backend in ("minidom", "stream", "selective")]
+        self.assertEqual(html[0], html[1])
+        self.assertEqual(html[0], html[2])
+
+    def test_minidom_falls_back_to_serialised(self):
+        # minidom records no source positions, so RAW_TAG_CONTENTS makes no difference to it
+        self.assertEqual(convert("CD001234.rm5", PARSER_BACKEND = "minidom", RAW_TAG_CONTENTS = True)["html"],
+                         convert("CD001234.rm5", PARSER_BACKEND = "minidom", RAW_TAG_CONTENTS = False)["html"])
+
+    def test_other_review_types_skipped(self):
+        for backend in ("minidom", "stream", "selective"):
+            self.assertEqual(convert("CD009999.rm5", PARSER_BACKEND = backend)["cdno"], None)
+
+    def test_source_contents_from_bytes_parsed(self):
+        # the contents come from the bytes read for parsing, even if the file is overwritten after
+        folder = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(folder, "review.rm5")
+            for parse in (rm5parse.parse, rm5parse.parse_selective):
+                shutil.copy(fixture("CD001234.rm5"), filename)
+                el = parse(filename).getElementsByTagName("CRIT_OUTCOMES")[0]
+                before = el.source_contents()
+                with open(filename, 'wb') as f:
+                    f.write(" " * 100000)
+                self.assertEqual(el.source_contents(), before)
+                self.assertTrue(before.strip())
+        finally:
+            shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import os
+import re
+import shutil
+import sys
+import tempfile
+import unittest
+import zipfile
+from StringIO import StringIO
+
+import buildcache
+import bundle
+import cca
+import instrument
+import progressbar
+import textgen
+from tests.support import fixture
+
+
+class BuildTest(unittest.TestCase):
+    " incremental builds in a temporary input and output folder "
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.saved_path = dict(cca.PATH)
+        self.saved_chooser = cca.QUESTION_CHOOSER
+        cca.PATH["rev"] = os.path.join(self.folder, "input")
+        cca.PATH["op"] = os.path.join(self.folder, "output")
+        os.mkdir(cca.PATH["rev"])
+        os.mkdir(cca.PATH["op"])
+        self.topics = cca.load_topics(fixture("topics.csv"))
+        self.manifest = buildcache.BuildManifest(cca.get_manifest_filename(), cca.build_settings())
+
+    def tearDown(self):
+        cca.PATH.clear()
+        cca.PATH.update(self.saved_path)
+        cca.QUESTION_CHOOSER = self.saved_chooser
+        shutil.rmtree(self.folder)
+
+    def add_input(self, name, mtime):
+        filename = os.path.join(cca.PATH["rev"], name)
+        shutil.copy(fixture("CD001234.rm5"), filename)
+        os.utime(filename, (mtime, mtime))
+        return filename
+
+    def build(self, files, **kwargs):
+        (stdout, sys.stdout) = (sys.stdout, StringIO())
+        try:
+            return cca.build(files, self.topics, self.manifest, instrument.RunTimer(False), progress = progressbar.NullProgress, **kwargs)[0]
+        finally:
+            sys.stdout = stdout
+
+    def test_unchanged_not_converted(self):
+        original = self.add_input("CD001234.rm5", 1000000000)
+        self.assertEqual(self.build([original]), ["done"])
+        self.assertEqual(self.build([original]), ["unchanged"])
+        self.assertEqual(self.build([original], rebuild = True), ["done"])
+
+    def test_pipeline_same_as_serial(self):
+        cca.QUESTION_CHOOSER = textgen.Chooser(1)
+        files = [self.add_input("CD001234.rm5", 1000000000), self.add_input("other.rm5", 1000000000)]
+        shutil.copy(fixture("CD009999.rm5"), files[1]) # (skipped: not an intervention review)
+        outputs = []
+        for use_pipeline in (False, True):
+            self.assertEqual(self.build(files, rebuild = True, use_pipeline = use_pipeline), ["done", "skipped"])
+            with open(cca.outputfile(files[0]), 'rb') as f:
+                outputs.append(re.sub("text complied @ [^;]*;", "", f.read()))
+        self.assertEqual(outputs[0], outputs[1])
+
+    def test_bundle(self):
+        # every document (a duplicate's too) in the bundle, and nothing in the output folder
+        original = self.add_input("CD001234.rm5", 1000000000)
+        copy = self.add_input("copy.rm5", 1100000000)
+        output_bundle = bundle.open_bundle("zip", os.path.join(cca.PATH["op"], "cca.zip"))
+        self.assertEqual(sorted(self.build([original, copy], rebuild = True, output_bundle = output_bundle)), ["done", "duplicate"])
+        output_bundle.close([], {})
+        zf = zipfile.ZipFile(output_bundle.filename)
+        self.assertEqual(sorted(zf.namelist()), ["CD001234.doc", "copy.doc", "run.json"])
+        self.assertEqual(zf.read("CD001234.doc"), zf.read("copy.doc"))
+        self.assertFalse(os.path.exists(cca.outputfile(original)))
+
+    def test_shards_cover_files_once(self):
+        files = [self.add_input(name, 1000000000) for name in ("CD001234.rm5", "copy.rm5", "other.rm5")]
+        shutil.copy(fixture("CD009999.rm5"), files[2])
+        saved = cca.SHARD
+        try:
+            split = []
+            for i in (1, 2):
+                cca.SHARD = (i, 2)
+                split.append(cca.shard_files(files, self.manifest))
+        finally:
+            cca.SHARD = saved
+        self.assertEqual(sorted(split[0] + split[1]), files)
+        self.assertTrue(any(files[0] in part and files[1] in part for part in split)) # (copies of a review together)
+
+    def test_changed_file_converted_again(self):
+        # as watch(): the same manifest for every batch, and the file edited in between
+        original = self.add_input("CD001234.rm5", 1000000000)
+        self.assertEqual(self.build([original]), ["done"])
+        with open(cca.outputfile(original), 'rb') as f:
+            before = f.read()
+        with open(original, 'rb') as f:
+            data = f.read()
+        with open(original, 'wb') as f:
+            f.write(data.replace("Exacerbation 1", "Flare up 1"))
+        self.assertEqual(self.build([original], changed = [original]), ["done"])
+        with open(cca.outputfile(original), 'rb') as f:
+            after = f.read()
+        self.assertNotEqual(before, after)
+        self.assertIn("flare up 1", after.lower())
+
+    def test_duplicates_converted_once(self):
+        # the newest of each group converted, and the others linked to its output
+        original = self.add_input("CD001234.rm5", 1000000000)
+        copy = self.add_input("copy.rm5", 1100000000)
+        self.assertEqual(self.build([original, copy]), ["duplicate", "done"])
+        self.assertTrue(os.path.samefile(cca.outputfile(original), cca.outputfile(copy)))
+        self.assertEqual(self.build([original, copy]), ["unchanged", "unchanged"])
+
+    def test_new_copy_linked_when_watching(self):
+        # as watch(): every file listed, only the changed one converted
+        original = self.add_input("CD001234.rm5", 1000000000)
+        self.assertEqual(self.build([original]), ["done"])
+        copy = self.add_input("copy.rm5", 1100000000) # (newer)
+        self.assertEqual(self.build([original, copy], changed = [copy]), ["unchanged", "duplicate"])
+        with open(cca.outputfile(original), 'rb') as a:
+            with open(cca.outputfile(copy), 'rb') as b:
+                self.assertEqual(a.read(), b.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+import bundle
+
+
+DOCUMENT = u"<p>Steroids \u2013 caf\xe9</p>".encode('utf-8')
+RECORDS = [{"analysis": "1.1", "point": "0.7"}, {"analysis": "1.2", "point": None}]
+RUN = {"files": ["a.rm5", "b.rm5", "c.rm5"], "results": {"a.rm5": "done"}}
+
+
+class BundleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, fmt):
+        filename = os.path.join(self.folder, "cca." + fmt)
+        b = bundle.open_bundle(fmt, filename)
+        b.add("a.doc", DOCUMENT)
+        b.add_records("a.jsonl", RECORDS)
+        self.assertFalse(os.path.exists(filename)) # (until closed)
+        b.close(["c.rm5"], RUN)
+        self.assertFalse(os.path.exists(filename + ".part"))
+        return filename
+
+    def test_zip(self):
+        zf = zipfile.ZipFile(self.write("zip"))
+        self.assertEqual(zf.namelist(), ["a.doc", "a.jsonl", "not_done.txt", "run.json"])
+        self.assertEqual(zf.read("a.doc"), DOCUMENT)
+        self.assertEqual([json.loads(line) for line in zf.read("a.jsonl").splitlines()], RECORDS)
+        self.assertEqual(zf.read("not_done.txt"), bundle.not_done_text(["c.rm5"]))
+        self.assertEqual(json.loads(zf.read("run.json")), RUN)
+
+    def test_jsonl(self):
+        with open(self.write("jsonl"), 'rb') as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual([line["type"] for line in lines], ["document", "record", "record", "not_done", "run"])
+        self.assertEqual(lines[0]["html"].encode('utf-8'), DOCUMENT)
+        self.assertEqual([dict((k, v) for (k, v) in line.items() if k not in ("type", "name")) for line in lines[1:3]], RECORDS)
+        self.assertEqual(lines[3]["files"], ["c.rm5"])
+        self.assertEqual(dict((k, v) for (k, v) in lines[4].items() if k != "type"), RUN)
+
+    def test_abort(self):
+        filename = os.path.join(self.folder, "cca.zip")
+        b = bundle.open_bundle("zip", filename)
+        b.add("a.doc", DOCUMENT)
+        b.abort()
+        self.assertEqual(os.listdir(self.folder), [])
+
+    def test_unknown_format(self):
+        self.assertRaises(ValueError, bundle.open_bundle, "tar", os.path.join(self.folder, "cca.tar"))
+
+
+if __name__ == '__main__':
+    unittest.main()
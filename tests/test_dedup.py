@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import dedup
+
+
+# (name, contents hash, (CD number, version)), for find_duplicates
+ITEMS = [("a", "h1", ("CD1", "2")),
+         ("b", "h2", ("CD2", "1")),
+         ("c", "h1", None),          # same contents as a
+         ("d", "h3", ("CD2", "1")),  # same review and version as b
+         ("e", "h4", ("CD1", "3")),  # another version of a: not a duplicate
+         ("f", "h3", None)]          # same contents as d, so with b too
+KEYS = [("same contents", lambda item: item[1]), ("same CD number and version", lambda item: item[2])]
+
+
+class FindDuplicatesTest(unittest.TestCase):
+
+    def test_groups(self):
+        self.assertEqual(dedup.find_duplicates(ITEMS, KEYS),
+                         [(0, [2], ["same contents"]), (1, [3, 5], ["same CD number and version", "same contents"])])
+
+    def test_rank(self):
+        # the highest ranked member is converted (the first of equals)
+        rank = {"a": 1, "c": 2, "b": 5, "d": 7, "f": 7}
+        self.assertEqual(dedup.find_duplicates(ITEMS, KEYS, rank = lambda item: rank.get(item[0], 0)),
+                         [(2, [0], ["same contents"]), (3, [1, 5], ["same CD number and version", "same contents"])])
+
+    def test_none_never_matched(self):
+        self.assertEqual(dedup.find_duplicates([("a", None), ("b", None)], [("same", lambda item: item[1])]), [])
+
+
+class LinkOrCopyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.source = os.path.join(self.folder, "a.doc")
+        self.target = os.path.join(self.folder, "b.doc")
+        with open(self.source, 'wb') as f:
+            f.write("document")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_link(self):
+        with open(self.target, 'wb') as f:
+            f.write("old output")
+        dedup.link_or_copy(self.source, self.target)
+        self.assertTrue(os.path.samefile(self.source, self.target))
+        dedup.link_or_copy(self.source, self.target) # (again: left as it is)
+        self.assertTrue(os.path.samefile(self.source, self.target))
+        self.assertEqual(sorted(os.listdir(self.folder)), ["a.doc", "b.doc"])
+
+    def test_copy(self):
+        dedup.link_or_copy(self.source, self.target, link = False)
+        self.assertFalse(os.path.samefile(self.source, self.target))
+        with open(self.target, 'rb') as f:
+            self.assertEqual(f.read(), "document")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import diagnostics
+
+
+class BatchReportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.filenames = (os.path.join(self.folder, "diagnostics.json"), os.path.join(self.folder, "diagnostics.csv"))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_unchanged_files_kept(self):
+        # an incremental run starts from the last report, and replaces the files it converts
+        first = diagnostics.BatchReport()
+        first.add("input/a.rm5", [diagnostics.Diagnostic("pooled-mismatch", diagnostics.WARNING, u"gives RR 0.70", "1.1")])
+        first.add("input/b.rm5", [diagnostics.Diagnostic("no-meta-analysis", diagnostics.NOTE, "not pooled", "2.3")])
+        first.add_failure("input/c.rm5", "ValueError: bad file")
+        first.write(*self.filenames)
+
+        second = diagnostics.BatchReport()
+        second.load(self.filenames[0])
+        second.prune(keep=["input/a.rm5", "input/b.rm5"]) # (c.rm5 removed)
+        second.add("input/b.rm5", [])
+        self.assertEqual(sorted(second.files), ["a.rm5", "b.rm5"])
+        self.assertEqual(second.files["a.rm5"], first.files["a.rm5"])
+        self.assertEqual(second.summary_text(), "0 errors, 1 warning, 0 notes")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+
+import cca
+import diagnostics
+from tests.support import read_fixture
+
+
+# analysis 1.1 of the fixture review, with its upper CI limit moved onto the line of no effect
+ORIGINAL = 'CI_END="0.9" CI_START="0.5" DF="3" EFFECT_MEASURE="RR" EFFECT_SIZE="0.7" ESTIMABLE="YES" ID="CMP-001.01"'
+ON_THE_LINE = 'CI_END="1" CI_START="0.5" DF="3" EFFECT_MEASURE="RR" EFFECT_SIZE="0.7" ESTIMABLE="YES" ID="CMP-001.01"'
+
+
+class NarrativeTest(unittest.TestCase):
+
+    def test_ci_limit_at_no_effect(self):
+        review = cca.rm_review(cca.rm_parse(None, data = read_fixture("CD001234.rm5").replace(ORIGINAL, ON_THE_LINE)))
+        outcome = review.comparisons[0].outcomes[0]
+        diags = diagnostics.Diagnostics()
+        with self.assertRaises(ValueError) as raised:
+            cca.rm_narrative(outcome, outcome, diags.at("1.1"))
+        self.assertIn("analysis 1.1", str(raised.exception))
+        self.assertEqual([(d.code, d.severity, d.location) for d in diags], [("unexpected-estimate", diagnostics.ERROR, "1.1")])
+
+    def test_conversion_error(self):
+        # (service.py returns this as a 400)
+        with self.assertRaises(ValueError):
+            cca.convert_review(read_fixture("CD001234.rm5").replace(ORIGINAL, ON_THE_LINE))
+
+
+if __name__ == '__main__':
+    unittest.main()
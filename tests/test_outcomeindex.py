@@ -0,0 +1,102 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import cca
+import outcomeindex
+from tests.support import fixture
+
+
+class OutcomeIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        review = cca.rm_review(cca.rm_parse(fixture("CD001234.rm5")))
+        self.rows = outcomeindex.review_rows(review)
+        self.study_count = sum(len(study_values) for (values, study_values) in self.rows)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def index(self, name = "outcomes.sqlite"):
+        return outcomeindex.OutcomeIndex(os.path.join(self.folder, name))
+
+    def count(self, index, sql, params = ()):
+        return index.query(sql, params)[1][0][0]
+
+    def check_links(self, index):
+        " every study row belongs to an analysis of the same file "
+        self.assertEqual(self.count(index, "SELECT COUNT(*) FROM studies s LEFT JOIN analyses a ON a.id = s.analysis_id "
+                                           "WHERE a.id IS NULL OR a.file != s.file"), 0)
+
+    def test_review_rows(self):
+        analyses = [values[0] for (values, study_values) in self.rows]
+        self.assertIn("1.1", analyses)
+        self.assertIn("1.2.1", analyses) # (subgroups too)
+        self.assertTrue(self.study_count > 0)
+
+    def test_update_replaces(self):
+        index = self.index()
+        index.update("input/a.rm5", "sha-a", "CD001234", "Title", "July 2011", self.rows)
+        index.update("input/a.rm5", "sha-a2", "CD001234", "Title", "July 2011", self.rows)
+        index.update("input/skipped.rm5", "sha-s", None)
+        self.assertEqual(index.files(), {"a.rm5": "sha-a2", "skipped.rm5": "sha-s"})
+        self.assertEqual(self.count(index, "SELECT COUNT(*) FROM analyses"), len(self.rows))
+        self.assertEqual(self.count(index, "SELECT COUNT(*) FROM studies"), self.study_count)
+        self.check_links(index)
+
+    def test_duplicates(self):
+        index = self.index()
+        index.update("input/a.rm5", "sha-a", "CD001234", "Title", "July 2011", self.rows)
+        index.add_duplicate("input/b.rm5", "sha-b", "input/a.rm5")
+        self.assertEqual(index.query("SELECT cdno, duplicate_of FROM files WHERE file = 'b.rm5'")[1], [("CD001234", "a.rm5")])
+        self.assertEqual(self.count(index, "SELECT COUNT(*) FROM analyses WHERE file = 'b.rm5'"), 0)
+        # converting the file its rows are held under again drops the duplicate, to be recorded again
+        index.update("input/a.rm5", "sha-a", "CD001234", "Title", "July 2011", self.rows)
+        self.assertEqual(sorted(index.files()), ["a.rm5"])
+
+    def test_forget_and_prune(self):
+        index = self.index()
+        for name in ("a", "b", "c"):
+            index.update("input/%s.rm5" % (name, ), "sha-" + name, "CD001234", rows = self.rows)
+        index.forget("input/a.rm5")
+        self.assertEqual(index.prune(keep=["input/b.rm5"]), ["c.rm5"])
+        self.assertEqual(sorted(index.files()), ["b.rm5"])
+        self.assertEqual(self.count(index, "SELECT COUNT(*) FROM analyses"), len(self.rows))
+        self.assertEqual(self.count(index, "SELECT COUNT(*) FROM studies"), self.study_count)
+
+    def test_merge_offsets_ids(self):
+        # two shards' indexes both number their analyses from 1
+        (first, second) = (self.index("one.sqlite"), self.index("two.sqlite"))
+        first.update("input/a.rm5", "sha-a", "CD001234", rows = self.rows)
+        second.update("input/b.rm5", "sha-b", "CD001234", rows = self.rows)
+        second.add_duplicate("input/c.rm5", "sha-c", "input/b.rm5")
+        merged = self.index()
+        merged.update("input/b.rm5", "sha-old", "CD001234", rows = self.rows[:1]) # (replaced by the merge)
+        merged.merge(first.filename)
+        merged.merge(second.filename)
+        self.assertEqual(merged.files(), {"a.rm5": "sha-a", "b.rm5": "sha-b", "c.rm5": "sha-c"})
+        self.assertEqual(self.count(merged, "SELECT COUNT(DISTINCT id) FROM analyses"), 2 * len(self.rows))
+        self.assertEqual(self.count(merged, "SELECT COUNT(*) FROM studies"), 2 * self.study_count)
+        for name in ("a.rm5", "b.rm5"):
+            self.assertEqual(self.count(merged, "SELECT COUNT(*) FROM studies WHERE file = ?", (name, )), self.study_count)
+        self.check_links(merged)
+
+    def test_other_version_rebuilt(self):
+        index = self.index()
+        index.update("input/a.rm5", "sha-a", "CD001234", rows = self.rows)
+        conn = sqlite3.connect(index.filename)
+        with conn:
+            conn.execute("UPDATE meta SET value = 'old' WHERE key = 'version'")
+        conn.close()
+        self.assertEqual(self.index().files(), {})
+        other = self.index("other.sqlite")
+        with other._connect():
+            other._connect().execute("UPDATE meta SET value = 'old' WHERE key = 'version'")
+        self.assertRaises(ValueError, self.index().merge, other.filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import re
+import unittest
+
+import cca
+import textgen
+from tests.support import convert, read_fixture
+
+
+class OutputTest(unittest.TestCase):
+    """
+    the fixture review's document against a stored copy (tests/fixtures/CD001234.expected.doc,
+    questions worded from seed 1, date stamp removed); if the output is meant to change,
+    write the new copy with convert("CD001234.rm5")["html"] and check the difference
+    """
+
+    def test_same_as_expected(self):
+        self.assertEqual(convert("CD001234.rm5")["html"], read_fixture("CD001234.expected.doc"))
+
+    def test_same_with_warm_caches(self):
+        # the memoised sentence helpers give the same text whether or not they have seen it before
+        textgen.clear_caches()
+        cold = convert("CD001234.rm5")["html"]
+        warm = convert("CD001234.rm5")["html"]
+        self.assertTrue(textgen.cache_totals()[0] > 0)
+        self.assertEqual(cold, warm)
+
+    def test_questions_as_substituted(self):
+        # each template filled as the text was before it was precompiled (re.sub of each name)
+        for title in ("Steroids for asthma", "Steroids versus placebo for asthma in children", "X for ",
+                      "X versus  for Y in ", "Steroids for asthma in adults"):
+            (intname, cntname, cndname, popname, patternno) = cca.splitter(title)
+            values = {"intname": intname, "cntname": cntname or None, "cndname": cndname, "popname": popname or None}
+            for (pattern, template) in zip(cca.QUESTION_PATTERNS[patternno], cca.QUESTION_TEMPLATES[patternno]):
+                text = re.sub("cndname", cndname, re.sub("intname", intname, pattern))
+                if cntname:
+                    text = re.sub("cntname", cntname, text)
+                if popname:
+                    text = re.sub("popname", popname, text)
+                self.assertEqual(template.fill(values), text, title)
+        self.assertNotIn("cndname", cca.randomquestion(*cca.splitter("X for ")))
+
+
+if __name__ == '__main__':
+    unittest.main()
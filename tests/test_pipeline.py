@@ -0,0 +1,64 @@
+import threading
+import time
+import unittest
+
+import pipeline
+
+
+class PipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.written = []
+        self.lock = threading.Lock()
+
+    def read(self, item):
+        time.sleep(0.001 * (item % 3)) # (so items finish reading out of order)
+        if item == 3:
+            raise IOError("cannot read 3")
+        return item * 10
+
+    def process(self, item, data):
+        if item == 5:
+            raise ValueError("cannot process 5")
+        if item == 8:
+            return ("skipped %d" % (item, ), None) # (nothing to write)
+        return ("value %d" % (data, ), "output %d" % (item, ))
+
+    def write(self, output):
+        if output == "output 7":
+            raise IOError("cannot write 7")
+        with self.lock:
+            self.written.append(output)
+
+    def test_results_and_faults(self):
+        items = range(10)
+        results = list(pipeline.Pipeline(self.read, self.process, self.write).imap(items))
+
+        # every item once, by its index in items, whatever order they finish in
+        self.assertEqual(sorted(i for (i, ok, value) in results), items)
+        by_index = dict((i, (ok, value)) for (i, ok, value) in results)
+        for i in items:
+            (ok, value) = by_index[i]
+            if i in (3, 5, 7):
+                # one failing stage only fails its own item
+                self.assertFalse(ok)
+                self.assertIn("cannot", value.strip().splitlines()[-1])
+            elif i == 8:
+                self.assertEqual((ok, value), (True, "skipped 8"))
+            else:
+                self.assertEqual((ok, value), (True, "value %d" % (i * 10, )))
+        self.assertEqual(sorted(self.written), sorted("output %d" % (i, ) for i in items if i not in (3, 5, 7, 8)))
+
+    def test_small_queues(self):
+        # more items than the queues hold, with one reader and writer
+        p = pipeline.Pipeline(lambda item: item, lambda item, data: (data, data), self.write, readers = 1, writers = 1, queue_size = 1)
+        results = list(p.imap(range(50)))
+        self.assertEqual(sorted(value for (i, ok, value) in results), range(50))
+        self.assertEqual(sorted(self.written), range(50))
+
+    def test_no_items(self):
+        self.assertEqual(list(pipeline.Pipeline(self.read, self.process, self.write).imap([])), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+from decimal import Decimal
+
+import poolengine
+import reviewmodel
+from tests.support import convert
+
+
+# hand-computed (RevMan 5 formulas, one study at a time) for the studies below
+# (events, total) in each group; the third study has no events in one group, the
+# fourth none in either
+DICH = [(12, 100, 20, 100), (5, 50, 9, 48), (0, 30, 3, 31), (0, 20, 0, 22)]
+DICH_EXPECTED = {("RR", None, None): (0.5258511192087455, 0.3041791088087023, 0.909067689283661, 3),
+                 ("OR", None, None): (0.47124974167376815, 0.24972565395226154, 0.8892811591957874, 3),
+                 ("RD", None, None): (-0.07602158913866013, -0.13872520015690948, -0.013317978120410787, 4),
+                 ("Peto OR", None, None): (0.4843340932227558, 0.2645827632172958, 0.8866016478377099, 3),
+                 ("RR", "IV", None): (0.5526153668948022, 0.3207011356877511, 0.9522377994495537, 3),
+                 ("RD", "IV", None): (-0.053969914653845034, -0.10729291082518583, -0.0006469184825042412, 4),
+                 ("RR", "IV", "YES"): (0.5526153668948022, 0.3207011356877511, 0.9522377994495537, 3)} # (no heterogeneity)
+
+# heterogeneous studies, for DerSimonian-Laird (Q about the MH or IV estimate)
+HETEROGENEOUS = [(2, 50, 20, 50), (15, 60, 14, 58), (30, 100, 10, 100)]
+HETEROGENEOUS_EXPECTED = {"MH": (0.7721111298517614, 0.17021282677279584, 3.5024128800629497),
+                          "IV": (0.7764603233451861, 0.17718433856251425, 3.4026180791176346)}
+
+# (mean, SD, total) in each group
+CONT = [(10, 2, 30, 12, 2.5, 31), (9, 3, 40, 11, 2.8, 38)]
+CONT_EXPECTED = {"MD": (-2.0, -2.8510296062945386, -1.1489703937054616),
+                 "SMD": (-0.76293584228764, -1.1082897292581815, -0.4175819553170984)} # Hedges' g
+
+
+def dich_data(studies):
+    return [reviewmodel.StudyData(kind="DICH_DATA", events_1=str(a), total_1=str(n1), events_2=str(c), total_2=str(n2))
+            for (a, n1, c, n2) in studies]
+
+
+def cont_data(studies):
+    return [reviewmodel.StudyData(kind="CONT_DATA", mean_1=str(m1), sd_1=str(sd1), total_1=str(n1),
+                                  mean_2=str(m2), sd_2=str(sd2), total_2=str(n2))
+            for (m1, sd1, n1, m2, sd2, n2) in studies]
+
+
+def outcome(kind, units, data, method = None, random = None, reported = (None, None, None)):
+    (point, ci95low, ci95up) = [Decimal(v) if v is not None else None for v in reported]
+    return reviewmodel.Outcome(kind=kind, no="1", units=units, study_data=data, subgroups=[], method=method, random=random,
+                               point=point, ci95low=ci95low, ci95up=ci95up)
+
+
+def pool(*outcomes):
+    return poolengine.PoolTable(reviewmodel.Review(comparisons=[reviewmodel.Comparison(no="1", outcomes=list(outcomes))]))
+
+
+@unittest.skipUnless(poolengine.available(), "needs numpy")
+class PoolTableTest(unittest.TestCase):
+
+    def assertPooled(self, pooled, expected):
+        self.assertIsNotNone(pooled)
+        for (value, wanted) in zip((pooled.point, pooled.ci95low, pooled.ci95up), expected):
+            self.assertAlmostEqual(value, wanted, places=12)
+
+    def test_dichotomous(self):
+        outcomes = dict((key, outcome("DICH_OUTCOME", key[0], dich_data(DICH), key[1], key[2])) for key in DICH_EXPECTED)
+        table = pool(*outcomes.values())
+        for (key, expected) in DICH_EXPECTED.items():
+            pooled = table.lookup(outcomes[key])
+            self.assertPooled(pooled, expected[:3])
+            self.assertEqual(pooled.studies, expected[3], key)
+
+    def test_peto_fixed_effect_only(self):
+        o = outcome("DICH_OUTCOME", "Peto OR", dich_data(DICH), None, "YES")
+        pooled = pool(o).lookup(o)
+        self.assertPooled(pooled, DICH_EXPECTED[("Peto OR", None, None)])
+        self.assertFalse(pooled.random)
+
+    def test_random_effects(self):
+        for (method, expected) in HETEROGENEOUS_EXPECTED.items():
+            o = outcome("DICH_OUTCOME", "RR", dich_data(HETEROGENEOUS), method, "YES")
+            pooled = pool(o).lookup(o)
+            self.assertPooled(pooled, expected)
+            self.assertTrue(pooled.random)
+
+    def test_continuous(self):
+        outcomes = dict((units, outcome("CONT_OUTCOME", units, cont_data(CONT))) for units in CONT_EXPECTED)
+        table = pool(*outcomes.values())
+        for (units, expected) in CONT_EXPECTED.items():
+            self.assertPooled(table.lookup(outcomes[units]), expected)
+
+    def test_no_events_in_either_group(self):
+        o = outcome("DICH_OUTCOME", "RR", dich_data([(0, 20, 0, 22)]))
+        self.assertIsNone(pool(o).lookup(o))
+        o = outcome("DICH_OUTCOME", "RD", dich_data([(0, 20, 0, 22)]))
+        self.assertPooled(pool(o).lookup(o), (0.0, ))
+
+    def test_agreement_to_printed_precision(self):
+        (point, low, high) = DICH_EXPECTED[("RR", None, None)][:3]
+        same = outcome("DICH_OUTCOME", "RR", dich_data(DICH), reported=("0.53", "0.30", "0.91"))
+        full = outcome("DICH_OUTCOME", "RR", dich_data(DICH), reported=tuple(repr(v) for v in (point, low, high)))
+        coarse = outcome("DICH_OUTCOME", "RR", dich_data(DICH), reported=("0.5", "0.3", "0.9"))
+        off = outcome("DICH_OUTCOME", "RR", dich_data(DICH), reported=("0.54", "0.30", "0.92"))
+        none = outcome("DICH_OUTCOME", "RR", dich_data(DICH))
+        table = pool(same, full, coarse, off, none)
+        self.assertEqual((table.lookup(same).agrees, table.lookup(same).mismatches), (True, ()))
+        self.assertEqual((table.lookup(full).agrees, table.lookup(full).mismatches), (True, ()))
+        self.assertEqual((table.lookup(coarse).agrees, table.lookup(coarse).mismatches), (True, ()))
+        self.assertEqual((table.lookup(off).agrees, table.lookup(off).mismatches), (False, ("point estimate", "upper CI limit")))
+        self.assertEqual((table.lookup(none).agrees, table.lookup(none).mismatches), (None, ()))
+
+    def test_not_estimable_outcome(self):
+        # analysis 2.3 of the fixture review has ESTIMABLE="NO"
+        result = convert("CD001234.rm5", RECOMPUTE_POOLED = True)
+        record = [r for r in result["records"] if r["analysis"] == "2.3"][0]
+        self.assertIsNone(record["point"])
+        self.assertAlmostEqual(record["recomputed"]["point"], 1.2756549414545675, places=12)
+        self.assertIsNone(record["recomputed"]["agrees"])
+        codes = [d["code"] for d in result["diagnostics"] if d["location"] == "2.3"]
+        self.assertIn("pooled-recomputed", codes)
+        self.assertNotIn("pooled-mismatch", codes)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import random
+import unittest
+
+import shards
+
+
+class ShardsTest(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEqual(shards.parse("2/4"), (2, 4))
+        for text in ("0/4", "5/4", "2", "a/b", "1/2/3"):
+            self.assertRaises(ValueError, shards.parse, text)
+
+    def test_filenames(self):
+        self.assertEqual(shards.shard_filename("output/manifest.json", (2, 4)), "output/manifest.shard-2-of-4.json")
+        self.assertEqual(shards.shard_filename("output/manifest.json", None), "output/manifest.json")
+
+    def test_assign_deterministic(self):
+        rng = random.Random(1)
+        keys = ["CD%03d" % (rng.randint(1, 60), ) for i in range(200)]
+        sizes = [rng.randint(1000, 2000000) for i in range(200)]
+        first = shards.assign(keys, sizes, 4)
+        self.assertEqual(shards.assign(list(keys), list(sizes), 4), first)
+        self.assertEqual(sorted(set(first)), [1, 2, 3, 4])
+
+    def test_assign_keeps_groups(self):
+        keys = ["CD1", "CD2", "CD1", "sha1:x", "CD2", "CD3"]
+        shard_nos = shards.assign(keys, [10, 20, 30, 40, 50, 60], 3)
+        for key in set(keys):
+            self.assertEqual(len(set(n for (k, n) in zip(keys, shard_nos) if k == key)), 1, key)
+
+    def test_assign_balanced(self):
+        rng = random.Random(2)
+        sizes = [rng.randint(1000, 100000) for i in range(400)]
+        shard_nos = shards.assign(["file%d" % (i, ) for i in range(400)], sizes, 4)
+        totals = [sum(s for (s, n) in zip(sizes, shard_nos) if n == shard) for shard in range(1, 5)]
+        # largest first to the smallest shard: no shard more than the largest item above another
+        self.assertTrue(max(totals) - min(totals) <= max(sizes), totals)
+
+    def test_assign_largest_first(self):
+        self.assertEqual(shards.assign(["a", "b", "c", "d"], [10, 40, 30, 20], 2), [1, 1, 2, 2]) # (b 40, c 30, d 20 to 2, then a to 1)
+        self.assertEqual(shards.assign(["a"], [5], 3), [1])
+
+    def test_merge_runs(self):
+        settings = {"version": "29"}
+        runs = [{"shard": "1/2", "settings": settings, "finished": "2026-10-18T10:00:00", "files": ["b.rm5", "a.rm5"],
+                 "results": {"a.rm5": "done", "b.rm5": "not done"}, "skipped_types": {"DIAGNOSTIC": 1},
+                 "duplicates": [], "not_done": ["b.rm5"], "stage_totals": {"parse": {"seconds": 1.5}}},
+                {"shard": "2/2", "settings": dict(settings, version="28"), "finished": "2026-10-18T10:05:00", "files": ["c.rm5"],
+                 "results": {"c.rm5": "done"}, "skipped_types": {"DIAGNOSTIC": 2},
+                 "duplicates": [{"converted": "c.rm5", "duplicates": []}], "not_done": [], "stage_totals": {"parse": {"seconds": 2.0}}}]
+        merged = shards.merge_runs(runs)
+        self.assertEqual(merged["files"], ["a.rm5", "b.rm5", "c.rm5"])
+        self.assertEqual(merged["finished"], "2026-10-18T10:05:00")
+        self.assertEqual(merged["results"], {"a.rm5": "done", "b.rm5": "not done", "c.rm5": "done"})
+        self.assertEqual(merged["skipped_types"], {"DIAGNOSTIC": 3})
+        self.assertEqual(merged["not_done"], ["b.rm5"])
+        self.assertEqual(merged["stage_totals"], {"parse": {"seconds": 3.5}})
+        self.assertEqual(len(merged["warnings"]), 1) # (shard 2 had other settings)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,193 @@
+#
+# text generation
+#
+#   support for the sentence builders in cca.py, which run thousands of times
+#   per batch on a small, repetitive vocabulary:
+#
+#   memoise = bounded LRU cache for the pure helpers (with hit/miss counts)
+#   Template = question templates compiled once, filled in one pass
+#   Chooser = one random number generator per run (optionally seeded, so
+#             each review gets the same choice every run)
+#
+
+import hashlib
+import os
+import random
+import re
+
+
+CACHE_SIZE = 1024 # results kept per memoised function; 0 = no caching
+
+CACHES = [] # every LRUCache made by memoise, for the statistics
+
+
+
+class LRUCache():
+    """
+    Bounded cache of a function's results, which discards the least recently
+    used entry when full
+
+    wrap(func) returns func with the cache in front
+
+    entries are kept in a circular doubly linked list (of [prev, next, key,
+    result] lists) in order of use, with a dict from key to link for lookups
+
+    the lookup is written out in full in the wrapper, since the helpers it
+    fronts take only a microsecond or two; not thread safe (the conversions
+    in each process run in one thread)
+
+    """
+
+    def __init__(self, name, maxsize = CACHE_SIZE):
+
+        self.name = name
+        self.maxsize = maxsize
+        self.links = {}
+        self.root = []
+        self.clear()
+
+    def clear(self):
+        # (in place, as the wrapper holds references to both)
+        self.links.clear()
+        self.root[:] = [self.root, self.root, None, None]
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.links), "maxsize": self.maxsize}
+
+    def wrap(self, func):
+        cache = self
+        links = self.links
+        root = self.root
+        maxsize = self.maxsize
+
+        def wrapper(*args):
+            link = links.get(args)
+            if link is not None:
+                # move to the most recently used end
+                (prev, next) = (link[0], link[1])
+                prev[1] = next
+                next[0] = prev
+                last = root[0]
+                last[1] = root[0] = link
+                link[0] = last
+                link[1] = root
+                cache.hits += 1
+                return link[3]
+            result = func(*args)
+            cache.misses += 1
+            if maxsize > 0:
+                if len(links) >= maxsize:
+                    # discard the least recently used
+                    oldest = root[1]
+                    root[1] = oldest[1]
+                    oldest[1][0] = root
+                    del links[oldest[2]]
+                last = root[0]
+                last[1] = root[0] = links[args] = [last, root, args, result]
+            return result
+
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        wrapper.cache = self
+        return wrapper
+
+
+def memoise(func):
+    """
+    decorator; caches the results of func (which must be a pure function of
+    hashable arguments) in an LRUCache of CACHE_SIZE entries
+
+    equal arguments share an entry, so an ascii str and the same text as
+    unicode get the same (equal) result
+    """
+    cache = LRUCache(func.__name__)
+    CACHES.append(cache)
+    return cache.wrap(func)
+
+
+def cache_stats():
+    " dict of function name: dict of hits, misses, size, maxsize, for every memoised function "
+    return dict((c.name, c.stats()) for c in CACHES)
+
+
+def cache_totals():
+    " (hits, misses) over every memoised function "
+    return (sum(c.hits for c in CACHES), sum(c.misses for c in CACHES))
+
+
+def clear_caches():
+    for c in CACHES:
+        c.clear()
+
+
+
+class Template():
+    """
+    Text with named slots (e.g. 'What are the effects of intname?'), split
+    into literal text and slots once so filling it is a single join
+
+    fill(values) replaces each slot with values[slot], even if that is an empty
+    string; a slot whose value is None or missing is left as its name
+
+    """
+
+    def __init__(self, text, slots):
+
+        self.text = text
+        pattern = re.compile("|".join(re.escape(s) for s in slots))
+        self.parts = [] # literal text and slot names, alternately (starting and ending with text)
+        pos = 0
+        for m in pattern.finditer(text):
+            self.parts.append(text[pos:m.start()])
+            self.parts.append(m.group())
+            pos = m.end()
+        self.parts.append(text[pos:])
+
+    def fill(self, values):
+        parts = list(self.parts)
+        for i in range(1, len(parts), 2):
+            value = values.get(parts[i])
+            if value is not None:
+                parts[i] = value
+        return "".join(parts)
+
+
+def compile_templates(patterns, slots):
+    " list of lists of Templates, from a list of lists of template text "
+    return [[Template(text, slots) for text in group] for group in patterns]
+
+
+
+class Chooser():
+    """
+    Makes arbitrary choices (e.g. the wording of a question) for a run
+
+    seed = None: one generator per process, seeded from the OS once (not per
+    choice); choices differ from run to run
+    seed = integer: each choice depends only on the seed and the key passed to
+    choose(), so the same review gets the same wording every run, whatever
+    order (or worker) it is converted in
+
+    """
+
+    def __init__(self, seed = None):
+
+        self.seed = seed
+        self.rng = None
+        self.pid = None
+
+    def choose(self, options, key = ""):
+        " returns one of options "
+        if self.seed is None:
+            if self.pid != os.getpid():
+                # (a forked worker gets a generator of its own)
+                self.rng = random.Random()
+                self.pid = os.getpid()
+            rng = self.rng
+        else:
+            if isinstance(key, unicode):
+                key = key.encode('utf-8')
+            rng = random.Random(long(hashlib.sha1("%d:%s" % (self.seed, key)).hexdigest(), 16))
+        return options[rng.randint(0, len(options) - 1)]
@@ -0,0 +1,107 @@
+#
+# topic index
+#
+#   the topic map (topics.csv: CD number -> top level headings) kept in an
+#   on-disk SQLite index, so a run (and each worker process) looks up just the
+#   reviews it needs instead of re-reading and holding the whole csv
+#
+#   the index is rebuilt when the csv changes; size and mtime are checked
+#   first, and the sha1 only if they differ (so a touched file is not reparsed)
+#
+
+import os
+import sqlite3
+import threading
+
+from buildcache import file_hash
+
+
+INDEX_VERSION = "1" # change if the table layout changes; forces a rebuild
+
+
+
+class TopicIndex():
+    """
+    Read-only mapping of CD number to a set of top level headings, served from
+    an SQLite file built from the topic csv
+
+    initiate with the csv filename, the index filename, and read_rows (a function
+    taking the csv filename and yielding (CD number, heading) in file order)
+
+    index[cdno] returns a set (empty for an unknown CD number, as the
+    defaultdict from parse_topics does); get(cdno, default) as dict.get
+
+    headings are added to each set in csv order, so sets iterate in the same
+    order as those built directly from the csv
+
+    each process (and thread) opens its own connection on first use, so the
+    index can be shared by forked worker processes and pipeline threads
+
+    """
+
+    def __init__(self, csv_filename, index_filename, read_rows):
+
+        self.csv_filename = csv_filename
+        self.filename = index_filename
+        self.local = threading.local() # conn, pid
+        self.rebuilt = self.refresh(read_rows)
+
+    def _connect(self):
+        local = self.local
+        if getattr(local, "conn", None) is None or local.pid != os.getpid():
+            local.conn = sqlite3.connect(self.filename)
+            local.conn.text_factory = str # headings come back as they were read from the csv
+            local.pid = os.getpid()
+        return local.conn
+
+    def _meta(self, conn):
+        try:
+            return dict(conn.execute("SELECT key, value FROM meta"))
+        except sqlite3.DatabaseError:
+            return {}
+
+    def refresh(self, read_rows):
+        " rebuilds the index if the csv has changed since it was built; returns True if rebuilt "
+        st = os.stat(self.csv_filename)
+        conn = self._connect()
+        meta = self._meta(conn)
+
+        if meta.get("version") == INDEX_VERSION:
+            if meta.get("size") == str(st.st_size) and meta.get("mtime") == repr(st.st_mtime):
+                return False
+            sha1 = file_hash(self.csv_filename)
+            if meta.get("sha1") == sha1:
+                # touched, not changed
+                with conn:
+                    conn.execute("UPDATE meta SET value = ? WHERE key = 'mtime'", (repr(st.st_mtime), ))
+                return False
+        else:
+            sha1 = file_hash(self.csv_filename)
+
+        self.build(read_rows(self.csv_filename), {"version": INDEX_VERSION, "size": str(st.st_size), "mtime": repr(st.st_mtime), "sha1": sha1})
+        return True
+
+    def build(self, rows, meta):
+        " replaces the index contents with rows ((CD number, heading) pairs) "
+        conn = self._connect()
+        with conn:
+            conn.execute("DROP TABLE IF EXISTS topics")
+            conn.execute("DROP TABLE IF EXISTS meta")
+            conn.execute("CREATE TABLE topics (cdno TEXT NOT NULL, seq INTEGER NOT NULL, heading TEXT NOT NULL)")
+            conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.executemany("INSERT INTO topics VALUES (?, ?, ?)", ((cdno, seq, heading) for (seq, (cdno, heading)) in enumerate(rows)))
+            conn.execute("CREATE INDEX topics_cdno ON topics (cdno, seq)")
+            conn.executemany("INSERT INTO meta VALUES (?, ?)", meta.items())
+
+    def __getitem__(self, cdno):
+        rows = self._connect().execute("SELECT heading FROM topics WHERE cdno = ? ORDER BY seq", (cdno, ))
+        return set(r[0] for r in rows)
+
+    def get(self, cdno, default = None):
+        headings = self[cdno]
+        if not headings:
+            return default
+        return headings
+
+    def __contains__(self, cdno):
+        return self._connect().execute("SELECT 1 FROM topics WHERE cdno = ? LIMIT 1", (cdno, )).fetchone() is not None
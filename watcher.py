@@ -0,0 +1,186 @@
+#
+# directory watcher
+#
+#   reports files created or changed in a folder, once they have stopped
+#   changing (so files still being copied in are not picked up half written)
+#
+#   uses inotify (Linux, via ctypes) where available, otherwise polls
+#
+
+import ctypes
+import ctypes.util
+import errno
+import fnmatch
+import os
+import select
+import struct
+import time
+
+
+DEBOUNCE = 2.0 # seconds a file must be unchanged before it is reported
+POLL_INTERVAL = 1.0 # seconds between scans when polling
+
+# inotify constants (from <sys/inotify.h>)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_EVENT_HEADER = struct.Struct("iIII") # wd, mask, cookie, len
+
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+
+
+def _inotify_libc():
+    " libc with inotify functions, or None "
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class _Inotify():
+    " minimal inotify wrapper; reads the names of files with events in one directory "
+
+    def __init__(self, libc, directory):
+        self.fd = libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init failed")
+        if libc.inotify_add_watch(self.fd, directory, WATCH_MASK) < 0:
+            e = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(e, "inotify_add_watch failed")
+
+    def read(self, timeout):
+        " names of the files with events in the next timeout seconds (may be empty) "
+        try:
+            ready, dummy1, dummy2 = select.select([self.fd], [], [], timeout)
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                return []
+            raise
+        if not ready:
+            return []
+
+        data = os.read(self.fd, 1 << 16)
+        names = []
+        pos = 0
+        while pos < len(data):
+            (wd, mask, cookie, length) = IN_EVENT_HEADER.unpack_from(data, pos)
+            pos += IN_EVENT_HEADER.size
+            names.append(data[pos:pos + length].rstrip("\0"))
+            pos += length
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+
+class DirectoryWatcher():
+    """
+    Watches a directory for files (matching any of patterns) which are created or changed
+
+    initiate with the directory, and optionally the filename patterns, the debounce
+    time, and use_inotify = False to always poll
+
+    changes() is a generator; each iteration blocks until there are settled changes,
+    then yields the sorted list of their paths. a file is settled once its size and
+    mtime have not changed for debounce seconds
+
+    files already in the directory when the watcher starts are not reported
+
+    """
+
+    def __init__(self, directory, patterns = ("*", ), debounce = DEBOUNCE, use_inotify = True):
+
+        self.directory = directory
+        self.patterns = patterns
+        self.debounce = debounce
+        self.inotify = None
+
+        if use_inotify:
+            libc = _inotify_libc()
+            if libc is not None:
+                try:
+                    self.inotify = _Inotify(libc, directory)
+                except OSError:
+                    self.inotify = None
+
+        self.known = self.scan() # path: (size, mtime) as last reported (or as at start)
+        self.pending = {} # path: ((size, mtime), time first seen like this)
+
+    @property
+    def method(self):
+        return "inotify" if self.inotify else "polling"
+
+    def _matches(self, name):
+        return any(fnmatch.fnmatch(name, p) for p in self.patterns)
+
+    def _stat(self, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_size, st.st_mtime)
+
+    def scan(self):
+        " dict of path: (size, mtime) for every matching file "
+        found = {}
+        for name in os.listdir(self.directory):
+            if self._matches(name):
+                path = os.path.join(self.directory, name)
+                stat = self._stat(path)
+                if stat is not None:
+                    found[path] = stat
+        return found
+
+    def _candidates(self, timeout):
+        " paths which may have changed, after waiting up to timeout seconds "
+        if self.inotify:
+            return set(os.path.join(self.directory, name) for name in self.inotify.read(timeout) if self._matches(name))
+        time.sleep(timeout)
+        current = self.scan()
+        return set(path for (path, stat) in current.items() if self.known.get(path) != stat)
+
+    def _settled(self, now):
+        " moves pending files which have not changed for debounce seconds to known; returns their paths "
+        settled = []
+        for (path, (stat, since)) in self.pending.items():
+            current = self._stat(path)
+            if current is None:
+                # deleted before it settled
+                del self.pending[path]
+            elif current != stat:
+                self.pending[path] = (current, now)
+            elif now - since >= self.debounce:
+                del self.pending[path]
+                if self.known.get(path) != current:
+                    self.known[path] = current
+                    settled.append(path)
+        return sorted(settled)
+
+    def changes(self):
+        while True:
+            if self.pending:
+                timeout = min(POLL_INTERVAL, self.debounce)
+            else:
+                timeout = POLL_INTERVAL
+            for path in self._candidates(timeout):
+                if path not in self.pending:
+                    stat = self._stat(path)
+                    if stat is not None:
+                        self.pending[path] = (stat, time.time())
+
+            settled = self._settled(time.time())
+            if settled:
+                yield settled
+
+    def close(self):
+        if self.inotify:
+            self.inotify.close()
+            self.inotify = None
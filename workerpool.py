@@ -0,0 +1,136 @@
+#
+# worker pool
+#
+
+import multiprocessing
+import select
+import traceback
+
+
+
+class WorkerPool():
+    """
+    Runs a function over a list of items in a pool of worker processes
+
+    each worker has its own pipe, so the pool always knows which item a
+    worker is holding; if the function raises, or the worker process dies
+    outright (segfault, killed, out of memory), only that item is failed
+    and a fresh worker is started in its place
+
+    call imap with the list of items; yields (index, ok, value) as items
+    complete (in completion order - sort by index for a deterministic order)
+    where value is the function's return value, or the error text if not ok
+
+    """
+
+    def __init__(self, func, workers):
+
+        self.func = func
+        self.workers = max(1, workers)
+
+    def _start_worker(self):
+        parent_conn, child_conn = multiprocessing.Pipe()
+        proc = multiprocessing.Process(target=self._work, args=(child_conn, ))
+        proc.daemon = True
+        proc.start()
+        child_conn.close()
+        return [proc, parent_conn, None]
+
+    def _work(self, conn):
+        " worker process loop; runs until sent None "
+        while True:
+            try:
+                item = conn.recv()
+            except EOFError:
+                break
+            if item is None:
+                break
+            try:
+                result = (True, self.func(item))
+            except Exception:
+                result = (False, traceback.format_exc())
+            conn.send(result)
+        conn.close()
+
+    def _stop_worker(self, worker):
+        proc, conn, dummy = worker
+        try:
+            conn.send(None)
+        except (IOError, OSError):
+            pass
+        conn.close()
+        proc.join(1)
+        if proc.is_alive():
+            proc.terminate()
+
+    def imap(self, items):
+
+        pending = list(reversed(list(enumerate(items))))
+        pool = [self._start_worker() for i in range(min(self.workers, len(pending)))]
+
+        try:
+            for worker in pool:
+                self._dispatch(worker, pending)
+
+            while any(worker[2] is not None for worker in pool):
+                busy = [worker for worker in pool if worker[2] is not None]
+                ready, dummy1, dummy2 = select.select([worker[1] for worker in busy], [], [], 1.0)
+
+                for w, worker in enumerate(pool):
+                    if worker[2] is None:
+                        continue
+                    (index, item) = worker[2]
+
+                    if worker[1] in ready:
+                        try:
+                            ok, value = worker[1].recv()
+                        except (EOFError, IOError):
+                            ok, value = False, None
+                    elif not worker[0].is_alive():
+                        ok, value = False, None
+                    else:
+                        continue
+
+                    if ok is False and value is None:
+                        # worker process died while holding this item - replace it
+                        worker[0].join()
+                        value = "worker process died (exit code %s)" % (worker[0].exitcode, )
+                        worker[1].close()
+                        worker = pool[w] = self._start_worker()
+
+                    worker[2] = None
+                    self._dispatch(worker, pending)
+                    yield (index, ok, value)
+        finally:
+            for worker in pool:
+                self._stop_worker(worker)
+
+    def _dispatch(self, worker, pending):
+        " gives an idle worker the next item, if any are left "
+        if pending:
+            worker[2] = pending.pop()
+            worker[1].send(worker[2][1])
+
+
+
+def example():
+
+    import os
+
+    def crashy(n):
+        if n == 3:
+            raise ValueError("three is not allowed")
+        if n == 5:
+            os._exit(1)
+        return n * n
+
+    for (index, ok, value) in sorted(WorkerPool(crashy, 4).imap(range(8))):
+        print index, ok, value if ok else value.strip().splitlines()[-1]
+
+
+
+def main():
+    example()
+
+if __name__ == '__main__':
+    main()